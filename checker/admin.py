@@ -1 +1,18 @@
-# Register your models here.
+from django.contrib import admin
+
+from checker.models import CheckJob, CheckRun
+
+
+@admin.register(CheckJob)
+class CheckJobAdmin(admin.ModelAdmin):
+    list_display = ("url", "status", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("url",)
+    readonly_fields = ("id", "report", "error", "created_at", "started_at", "finished_at")
+
+
+@admin.register(CheckRun)
+class CheckRunAdmin(admin.ModelAdmin):
+    list_display = ("url", "title", "created_at")
+    search_fields = ("url",)
+    readonly_fields = [field.name for field in CheckRun._meta.fields]
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.conf import settings
+
+from checker import metrics
+
+# Interval between two attempts of an asynchronous acquisition in seconds
+POLL_INTERVAL = 0.01
+
+
+class Limiter:
+    """
+    Cap on the number of concurrent holders of a resource, with a bounded wait queue.
+
+    Limits are given on every acquisition, so they follow the settings of the process.
+    """
+
+    def __init__(self, active: metrics.Gauge, queued: metrics.Gauge) -> None:
+        """
+        Initialize the limiter.
+
+        :param active: Gauge of the holders.
+        :param queued: Gauge of the waiters.
+        """
+        self._condition = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self._active_gauge = active
+        self._queued_gauge = queued
+
+    def acquire(self, limit: int, timeout: float, max_queued: Optional[int] = None) -> bool:
+        """
+        Acquire a slot, waiting for one if needed.
+
+        :param limit: Maximum number of holders, 0 for no limit.
+        :param timeout: Maximum time to wait in seconds.
+        :param max_queued: Maximum number of waiters, None for no limit.
+        :return: True if acquired, False if the queue is full or the wait timed out.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if limit > 0 and self.active >= limit:
+                if max_queued is not None and self.queued >= max_queued:
+                    return False
+
+                self.queued += 1
+                self._queued_gauge.inc()
+                try:
+                    while self.active >= limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        self._condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+                    self._queued_gauge.dec()
+
+            self.active += 1
+            self._active_gauge.inc()
+            return True
+
+    def try_acquire(self, limit: int) -> bool:
+        """
+        Acquire a slot if one is free, without waiting.
+
+        :param limit: Maximum number of holders, 0 for no limit.
+        :return: True if acquired.
+        """
+        with self._condition:
+            if limit > 0 and self.active >= limit:
+                return False
+            self.active += 1
+            self._active_gauge.inc()
+            return True
+
+    async def acquire_async(self, limit: int, timeout: float) -> bool:
+        """
+        Acquire a slot from asynchronous code, polling so that the event loop is never blocked.
+
+        :param limit: Maximum number of holders, 0 for no limit.
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if acquired, False if the wait timed out.
+        """
+        if self.try_acquire(limit):
+            return True
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self.queued += 1
+            self._queued_gauge.inc()
+        try:
+            while not self.try_acquire(limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                await asyncio.sleep(min(POLL_INTERVAL, remaining))
+            return True
+        finally:
+            with self._condition:
+                self.queued -= 1
+                self._queued_gauge.dec()
+
+    def release(self) -> None:
+        """Release a slot."""
+        with self._condition:
+            self.active -= 1
+            self._active_gauge.dec()
+            self._condition.notify()
+
+
+class ReleasingIterator:
+    """Iterator over streamed content that releases a slot once, when exhausted or closed."""
+
+    def __init__(self, content: Iterable[bytes], release: Callable[[], None]) -> None:
+        self.content = content
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if hasattr(self.content, "close"):
+            self.content.close()
+        self._release()
+
+
+check_slots = Limiter(metrics.checks_active, metrics.checks_queued)
+outbound_slots = Limiter(metrics.outbound_active, metrics.outbound_queued)
+connection_slots = Limiter(metrics.probe_connections, metrics.probe_connections_queued)
+
+
+def admit_check() -> bool:
+    """
+    Admit a check, waiting shortly for a slot when CHECK_MAX_ACTIVE checks are running.
+
+    :return: True if admitted, the slot is then released with release_check, False if the process is busy.
+    """
+    if check_slots.acquire(settings.CHECK_MAX_ACTIVE, settings.CHECK_QUEUE_TIMEOUT, settings.CHECK_MAX_QUEUED):
+        return True
+    metrics.checks_rejected.inc()
+    return False
+
+
+def release_check() -> None:
+    """Release the slot of an admitted check."""
+    check_slots.release()
@@ -0,0 +1,276 @@
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client as TestClient
+from django.test import override_settings
+from django.urls import reverse
+
+from checker.caching import link_cache
+from checker.client import get_client
+from checker.parser import Parser
+from checker.utils import get_broken_links
+
+# Number of anchors, images, inline styles and paragraphs of the generated pages, "large" is a few MB
+CORPUS_SIZES: dict[str, dict[str, int]] = {
+    "tiny": {"anchors": 10, "images": 2, "styles": 2, "paragraphs": 5},
+    "small": {"anchors": 100, "images": 20, "styles": 20, "paragraphs": 50},
+    "medium": {"anchors": 2000, "images": 200, "styles": 200, "paragraphs": 1000},
+    "large": {"anchors": 30000, "images": 3000, "styles": 3000, "paragraphs": 10000},
+}
+PARSER_PROPERTIES: tuple[str, ...] = (
+    "title",
+    "description",
+    "favicon",
+    "robots_meta",
+    "headings",
+    "anchors",
+    "inline_css",
+    "images",
+    "images_miss_alt",
+)
+BENCHMARK_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "links": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+def generate_page(base_url: str, anchors: int, images: int, styles: int, paragraphs: int) -> bytes:
+    """
+    Generate an HTML page.
+
+    :param base_url: Base URL of the links.
+    :param anchors: Number of anchors, linking to /link/<n>.
+    :param images: Number of images, half of them without alt text.
+    :param styles: Number of elements with inline CSS.
+    :param paragraphs: Number of paragraphs of text.
+    :return: HTML content.
+    """
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Benchmark page</title>",
+        "<meta name='description' content='Generated page'><meta name='robots' content='index, follow'>",
+        "<link rel='icon' href='/favicon.ico'></head><body><h1>Benchmark</h1>",
+    ]
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            parts.append(f"<h{2 + i // 50 % 5}>Section {i}</h{2 + i // 50 % 5}>")
+        parts.append(f"<p>Paragraph {i} with some <b>bold</b> and <i>italic</i> text to parse.</p>")
+    for i in range(anchors):
+        # Relative and absolute links, and a few duplicates
+        href = f"/link/{i}" if i % 2 else f"{base_url}/link/{i}"
+        parts.append(f"<a href='{href}' title='Link {i}'>Link {i}</a> ")
+        if i % 10 == 0:
+            parts.append(f"<a href='{href}'>Duplicate {i}</a> ")
+    for i in range(images):
+        alt = f" alt='Image {i}'" if i % 2 else ""
+        parts.append(f"<img src='/images/{i}.png'{alt} width='10' height='10'>")
+    for i in range(styles):
+        parts.append(f"<div style='color: #{i % 4096:03x}; margin: {i % 10}px'>Styled {i}</div>")
+    parts.append("</body></html>")
+    return "".join(parts).encode()
+
+
+class FakeWebHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def respond(self, body: bool) -> None:
+        server: FakeWebServer = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if self.path.startswith("/page/") and (content := server.pages.get(self.path.removeprefix("/page/"))):
+            status = 200
+        else:
+            # The same links are broken on every run
+            status = 404 if zlib.crc32(self.path.encode()) % 10000 < server.error_rate * 10000 else 200
+            content = b"Not found" if status == 404 else b"OK"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def do_HEAD(self) -> None:
+        self.respond(body=False)
+
+    def do_GET(self) -> None:
+        self.respond(body=True)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeWebServer(ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for the web.
+
+    Serves the generated pages at /page/<size> and answers every other path, with a fixed latency and a share of
+    broken links.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        """
+        Initialize the server on a free local port.
+
+        :param latency: Delay of every response in seconds.
+        :param error_rate: Share of the paths answered with 404, between 0 and 1.
+        """
+        super().__init__(("127.0.0.1", 0), FakeWebHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pages: dict[str, bytes] = dict()
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def handle_error(self, request, client_address) -> None:
+        # Connections dropped by the client, e.g. at the deadline of a check, are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def __enter__(self) -> "FakeWebServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def measure(func: Callable[[Any], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> dict[str, Any]:
+    """
+    Time a function.
+
+    :param func: Function to time, called with the result of setup.
+    :param repeat: Number of runs.
+    :param setup: Function preparing every run, not timed.
+    :return: Minimum and median time in seconds, and number of runs.
+    """
+    times: list[float] = list()
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+
+def run_benchmarks(
+    sizes: list[str], repeat: int, links: int, latency: float, error_rate: float, log: Callable[[str], Any] = print
+) -> dict[str, Any]:
+    """
+    Run the benchmarks.
+
+    :param sizes: Names of the corpus sizes to benchmark.
+    :param repeat: Number of runs of every benchmark.
+    :param links: Number of links of the link checker benchmark, 0 to skip it.
+    :param latency: Response delay of the fake web server in seconds.
+    :param error_rate: Share of broken links of the fake web server.
+    :param log: Function receiving the progress messages.
+    :return: Results, with the environment under "meta" and the timings by benchmark name under "results".
+    """
+    results: dict[str, dict[str, Any]] = dict()
+
+    def record(name: str, result: dict[str, Any]) -> None:
+        results[name] = result
+        log(f"{name:<40} median {result['median'] * 1000:10.2f} ms  min {result['min'] * 1000:10.2f} ms")
+
+    overrides = override_settings(
+        CACHES=BENCHMARK_CACHES,
+        ALLOWED_HOSTS=["testserver"],
+        # Skips the captcha and the page rank, which are remote services
+        DEBUG=True,
+        REPORT_CACHE_TTL=0,
+        CHECK_JOBS_ENABLED=False,
+        CHECK_STREAMING=False,
+        # Every check is cold, the stored link statuses would be reused otherwise
+        CHECK_HISTORY=False,
+    )
+    with overrides, FakeWebServer(latency, error_rate) as server:
+        for size in sizes:
+            content = generate_page(server.url, **CORPUS_SIZES[size])
+            server.pages[size] = content
+            log(f"Corpus {size}: {len(content) / 1024:.0f} KiB")
+
+            record(f"parser.{size}.parse", measure(lambda _: Parser(content, server.url), repeat))
+            for name in ("extract", *PARSER_PROPERTIES):
+                # Every property is timed on a fresh parser, the extraction is cached afterwards
+                func = (
+                    (lambda parser: parser.extract()) if name == "extract" else (lambda parser: getattr(parser, name))
+                )
+                record(f"parser.{size}.{name}", measure(func, repeat, setup=lambda: Parser(content, server.url)))
+
+            def post(client: TestClient) -> None:
+                response = client.post(
+                    reverse("check"), {"url": f"{server.url}/page/{size}", "g-recaptcha-response": ""}
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(f"Check failed with status {response.status_code}")
+
+            def setup_post() -> TestClient:
+                cache.clear()
+                link_cache.clear()
+                return TestClient()
+
+            record(f"check_view.{size}", measure(post, repeat, setup=setup_post))
+
+        if links:
+            urls = [f"{server.url}/link/{i}" for i in range(links)]
+
+            def setup_links() -> None:
+                cache.clear()
+                link_cache.clear()
+
+            result = measure(lambda _: get_broken_links(get_client(), urls), repeat, setup=setup_links)
+            result["linksPerSecond"] = links / result["median"]
+            record(f"broken_links.{links}", result)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeat": repeat,
+            "latency": latency,
+            "errorRate": error_rate,
+            "linkConcurrency": settings.LINK_CONCURRENCY,
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> list[tuple[str, float]]:
+    """
+    Compare results against a baseline.
+
+    :param results: Results of run_benchmarks.
+    :param baseline: Baseline results of run_benchmarks.
+    :return: Ratio of the median times of every benchmark found in both, by benchmark name.
+    """
+    ratios: list[tuple[str, float]] = list()
+    for name, result in results["results"].items():
+        if (base := baseline["results"].get(name)) and base["median"] > 0:
+            ratios.append((name, result["median"] / base["median"]))
+    return ratios
+
+
+def load_results(path: str) -> dict[str, Any]:
+    """
+    Load results saved as JSON.
+
+    :param path: File path.
+    :return: Results.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
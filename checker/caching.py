@@ -0,0 +1,215 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+DEFAULT_PORTS: dict[str, str] = {"http": "80", "https": "443"}
+LOCK_TIMEOUT: int = 120
+POLL_INTERVAL: float = 0.2
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL so that equivalent URLs share a cache key.
+
+    :param url: URL to normalize.
+    :return: Normalized URL.
+    """
+    u = urlsplit(url.strip())
+    scheme = u.scheme.lower()
+    netloc = u.netloc.lower()
+
+    # Remove default port
+    host, _, port = netloc.rpartition(":")
+    if host and DEFAULT_PORTS.get(scheme) == port:
+        netloc = host
+
+    return urlunsplit((scheme, netloc, u.path or "/", u.query, ""))
+
+
+def make_key(prefix: str, value: str) -> str:
+    """
+    Make a cache key that is safe for every cache backend.
+
+    :param prefix: Key prefix.
+    :param value: Value to be hashed.
+    :return: Cache key.
+    """
+    return f"checker:{prefix}:" + hashlib.sha256(value.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent computations of the same key.
+
+    Callers in the same process wait for the computation already in flight. Callers in other processes wait for its
+    result to appear in the shared cache, guarded by a lock entry in the same cache.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = dict()
+
+    def get_or_set(
+        self, key: str, func: Callable[[], Any], timeout: int, cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        Get a cached value, computing it at most once across all concurrent callers.
+
+        :param key: Cache key.
+        :param func: Function computing the value on a cache miss.
+        :param timeout: Cache timeout in seconds.
+        :param cacheable: Function telling if a computed value may be cached, all values are by default.
+        :return: Cached or computed value.
+        """
+        if (value := cache.get(key)) is not None:
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = self._compute(key, func, timeout, cacheable)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @staticmethod
+    def _compute(key: str, func: Callable[[], Any], timeout: int, cacheable: Optional[Callable[[Any], bool]]) -> Any:
+        """
+        Compute a value once across processes.
+
+        :param key: Cache key.
+        :param func: Function computing the value.
+        :param timeout: Cache timeout in seconds.
+        :param cacheable: Function telling if the computed value may be cached.
+        :return: Computed value, or the value computed by another process.
+        """
+        lock_key = key + ":lock"
+        deadline = time.monotonic() + LOCK_TIMEOUT
+
+        # Wait for another process working on the same key
+        while not cache.add(lock_key, True, LOCK_TIMEOUT):
+            if (value := cache.get(key)) is not None:
+                return value
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            if (value := cache.get(key)) is not None:
+                return value
+
+            value = func()
+            if cacheable is None or cacheable(value):
+                cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+
+single_flight = SingleFlight()
+
+
+class LinkStatusCache:
+    """
+    Cache of link statuses shared across checks.
+
+    A bounded in-process LRU sits in front of the shared "links" cache, so worker processes share their results while
+    hot links are served without a round trip to the cache backend. Broken and OK statuses expire separately.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+
+    def get_many(self, links: list[str]) -> dict[str, bool]:
+        """
+        Get the cached statuses of links.
+
+        :param links: Links to look up.
+        :return: Broken flag of every link found in the cache.
+        """
+        now = time.time()
+        statuses: dict[str, bool] = dict()
+        misses: list[str] = list()
+
+        with self._lock:
+            for link in links:
+                entry = self._entries.get(link)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(link)
+                    statuses[link] = entry[0]
+                else:
+                    misses.append(link)
+
+        if not misses:
+            return statuses
+
+        keys = {make_key("link", link): link for link in misses}
+        shared: dict[str, tuple[bool, float]] = caches["links"].get_many(list(keys))
+        with self._lock:
+            for key, entry in shared.items():
+                if entry[1] > now:
+                    statuses[keys[key]] = entry[0]
+                    self._store(keys[key], entry)
+
+        return statuses
+
+    def set_many(self, statuses: dict[str, bool]) -> None:
+        """
+        Cache the statuses of links.
+
+        :param statuses: Broken flag of every link.
+        """
+        now = time.time()
+        shared: dict[int, dict[str, tuple[bool, float]]] = dict()
+
+        with self._lock:
+            for link, broken in statuses.items():
+                ttl = settings.LINK_CACHE_BROKEN_TTL if broken else settings.LINK_CACHE_OK_TTL
+                if ttl <= 0:
+                    continue
+                entry = (broken, now + ttl)
+                self._store(link, entry)
+                shared.setdefault(ttl, dict())[make_key("link", link)] = entry
+
+        for ttl, entries in shared.items():
+            caches["links"].set_many(entries, ttl)
+
+    def clear(self) -> None:
+        """Clear the in-process entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, link: str, entry: tuple[bool, float]) -> None:
+        """
+        Store an entry in the in-process LRU, the lock must be held.
+
+        :param link: Link.
+        :param entry: Broken flag and expiry timestamp.
+        """
+        self._entries[link] = entry
+        self._entries.move_to_end(link)
+        while len(self._entries) > settings.LINK_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+
+link_cache = LinkStatusCache()
@@ -0,0 +1,240 @@
+import uuid
+from concurrent.futures import Future
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from requests.exceptions import RequestException
+
+from checker import metrics
+from checker.caching import make_key, normalize_url, single_flight
+from checker.client import get_client
+from checker.history import get_stored_statuses, record_check
+from checker.metrics import record_stage, timed
+from checker.pagerank import get_page_rank
+from checker.pages import open_page, parse_page, store_page
+from checker.pipeline import Deadline, Pipeline
+from checker.sitemaps import get_sitemaps
+from checker.utils import get_broken_links, get_robots_link
+
+# Sections listing at most REPORT_MAX_TAGS items, the rest is served page by page from the saved run
+PAGED_SECTIONS: tuple[str, ...] = ("inlineCSS", "imagesMissAlt", "brokenLinks", "sitemaps")
+
+
+def start_check(url: str, deadline: Optional[Deadline] = None) -> tuple[dict, Pipeline]:
+    """
+    Fetch and parse a page, and prepare the network stages of its check.
+
+    :param url: URL to check.
+    :param deadline: Deadline of the check, defaults to CHECK_DEADLINE seconds from now.
+    :return: Report context holding the parsed sections, and the pipeline of the network stages.
+    """
+    deadline = deadline or Deadline(settings.CHECK_DEADLINE)
+    u = urlsplit(url, allow_fragments=False)
+    domain = u.netloc
+    base_url = f"{u.scheme}://{domain}"
+    client = get_client()
+    timings: dict[str, float] = dict()
+    # The tags beyond the first page are only needed when the run is saved
+    max_tags = settings.REPORT_STORED_TAGS if settings.CHECK_HISTORY else settings.REPORT_MAX_TAGS
+    try:
+        with timed(timings, "fetch"):
+            r, cached = open_page(client, url, deadline, max_tags)
+        with timed(timings, "parse"):
+            parsed = parse_page(r, cached, base_url, deadline, max_tags)
+    except (RequestException, ValueError, TimeoutError):
+        metrics.checks_run.inc(result="error")
+        raise
+
+    # Every field is extracted in a single pass, on first access
+    with timed(timings, "extract"):
+        anchors = parsed.anchors
+    store_page(url, r, parsed, cached, deadline)
+    context = {
+        "url": url,
+        "reportId": str(uuid.uuid4()) if settings.CHECK_HISTORY else None,
+        "title": parsed.title,
+        "description": parsed.description,
+        "favicon": parsed.favicon,
+        "robotsMeta": parsed.robots_meta,
+        "headings": parsed.headings,
+        "images": (parsed.images or [])[: settings.REPORT_MAX_TAGS] or None,
+        "inlineCSSCount": parsed.inline_css_count,
+        "imagesCount": parsed.images_count,
+        "imagesMissAltCount": parsed.images_miss_alt_count,
+        "anchors": anchors,
+        "truncated": parsed.truncated,
+        "maxPageSize": settings.MAX_PAGE_SIZE,
+        "linkStats": dict(),
+        "sitemapStats": dict(),
+        "incomplete": list(),
+        "timings": timings,
+        # Statuses of the links requested by the check, and full lists of the paginated sections, saved with its run
+        "checkedLinks": dict(),
+        "sectionItems": dict(),
+    }
+    set_section(context, "inlineCSS", parsed.inline_css, parsed.inline_css_count)
+    set_section(context, "imagesMissAlt", parsed.images_miss_alt, parsed.images_miss_alt_count)
+
+    # Links whose stored status has not expired are not requested again
+    known = None
+    if settings.CHECK_HISTORY:
+        with timed(timings, "history"):
+            try:
+                known = get_stored_statuses(anchors)
+            except DatabaseError as e:
+                print(f"Failed to read check history: {e}")
+
+    # Network stages, only the sitemaps depend on another stage
+    pipeline = Pipeline(deadline=deadline)
+    pipeline.add("pageRank", get_page_rank, client, domain, deadline=deadline)
+    pipeline.add("robotsTxt", get_robots_link, client, base_url, deadline=deadline)
+    pipeline.add(
+        "sitemaps", get_sitemaps, client, base_url, context["sitemapStats"], requires=("robotsTxt",), deadline=deadline
+    )
+    pipeline.add(
+        "brokenLinks",
+        get_broken_links,
+        client,
+        anchors,
+        context["linkStats"],
+        deadline=deadline,
+        known=known,
+        checked=context["checkedLinks"],
+    )
+    return context, pipeline
+
+
+def set_section(context: dict, name: str, items: Optional[list[str]], count: Optional[int] = None) -> None:
+    """
+    Put the first REPORT_MAX_TAGS items of a paginated section and their count in the report context.
+
+    :param context: Report context.
+    :param name: Section name.
+    :param items: Items of the section, kept in "sectionItems" until the run is saved.
+    :param count: Number of items, when some of them were only counted.
+    """
+    context[name] = items[: settings.REPORT_MAX_TAGS] if items else items
+    context[name + "Count"] = len(items or []) if count is None else count
+    context.setdefault("sectionItems", dict())[name] = items
+
+
+def iter_check(context: dict, pipeline: Pipeline) -> Iterator[str]:
+    """
+    Run the network stages and fill the report context as they finish.
+
+    Every stage shares the deadline. When it expires, the report holds what finished and lists the other sections in
+    "incomplete". The finished check is then saved, and its changes since the previous run are in "changes". Paginated
+    sections only hold their first REPORT_MAX_TAGS items, the others are served from the saved run.
+
+    :param context: Report context.
+    :param pipeline: Pipeline of the network stages.
+    :return: Iterator of the names of the completed or incomplete sections.
+    """
+    for name, result in pipeline.iter_results():
+        if name in PAGED_SECTIONS:
+            set_section(context, name, result)
+        else:
+            context[name] = result
+        record_stage(context.get("timings"), name, pipeline.timings[name])
+        if name == "brokenLinks" and context["linkStats"].get("unchecked"):
+            context["incomplete"].append(name)
+        if name == "sitemaps" and context["sitemapStats"].get("incomplete"):
+            context["incomplete"].append(name)
+        yield name
+
+    for name in pipeline.incomplete:
+        if name in PAGED_SECTIONS:
+            set_section(context, name, None)
+        else:
+            context[name] = None
+        context["incomplete"].append(name)
+        yield name
+
+    metrics.checks_run.inc(result="partial" if context["incomplete"] else "complete")
+
+    checked = context.pop("checkedLinks", None) or dict()
+    items = context.pop("sectionItems", None) or dict()
+    if settings.CHECK_HISTORY:
+        try:
+            context["changes"] = record_check({**context, **items}, checked)
+        except DatabaseError as e:
+            print(f"Failed to save check: {e}")
+            # Nothing to serve the other pages of the sections from
+            context["reportId"] = None
+
+
+def finish_check(context: dict, pipeline: Pipeline) -> dict:
+    """
+    Run the network stages of a started check.
+
+    :param context: Report context.
+    :param pipeline: Pipeline of the network stages.
+    :return: Report context.
+    """
+    for _ in iter_check(context, pipeline):
+        pass
+    return context
+
+
+def run_check(url: str, deadline: Optional[Deadline] = None) -> dict:
+    """
+    Check a page.
+
+    :param url: URL to check.
+    :param deadline: Deadline of the check, defaults to CHECK_DEADLINE seconds from now.
+    :return: Report context.
+    """
+    return finish_check(*start_check(url, deadline))
+
+
+def get_report_key(url: str) -> str:
+    """
+    Get the cache key of the report of a page.
+
+    :param url: URL to check.
+    :return: Cache key.
+    """
+    return make_key("report", normalize_url(url))
+
+
+def is_cacheable(context: dict) -> bool:
+    """
+    Check if a report may be cached, partial reports are not.
+
+    :param context: Report context.
+    :return: True if cacheable, False otherwise.
+    """
+    return not context.get("incomplete")
+
+
+def get_cached_report(url: str) -> Optional[dict]:
+    """
+    Get the report of a page from the shared cache.
+
+    :param url: URL to check.
+    :return: Report context if cached, None otherwise.
+    """
+    if settings.REPORT_CACHE_TTL <= 0:
+        return None
+    return cache.get(get_report_key(url))
+
+
+def get_report(url: str, started: Optional[Future] = None) -> dict:
+    """
+    Get the report of a page from the shared cache, checking it if needed.
+
+    Concurrent requests for the same URL share the check already in flight.
+
+    :param url: URL to check.
+    :param started: Future of start_check(url), when the page is already being fetched.
+    :return: Report context.
+    """
+    check = (lambda: finish_check(*started.result())) if started else (lambda: run_check(url))
+    if settings.REPORT_CACHE_TTL <= 0:
+        return check()
+
+    # Partial reports are shared with the concurrent callers, but not cached
+    return single_flight.get_or_set(get_report_key(url), check, settings.REPORT_CACHE_TTL, cacheable=is_cacheable)
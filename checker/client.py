@@ -0,0 +1,119 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional
+
+from django.conf import settings
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, RequestException
+
+from checker import metrics
+from checker.admission import outbound_slots
+
+# Number of hosts whose connection pools are kept alive
+MAX_POOLS = 100
+
+
+class Client(Session):
+    """
+    Outbound HTTP client shared by all the checks of a worker process.
+
+    Connections are kept alive across checks, so the TCP and TLS handshakes are paid once per host. Cookies are never
+    stored, since the client is shared by unrelated checks. At most OUTBOUND_MAX_ACTIVE requests wait for a response at
+    the same time, the others wait for a slot up to their connect timeout. The slot is released once the headers are
+    received, not every caller closes its streamed responses and a slot held until then could leak.
+    """
+
+    def __init__(self, timeout: float, pool_maxsize: int) -> None:
+        """
+        Initialize the client.
+
+        :param timeout: Default timeout of every request in seconds.
+        :param pool_maxsize: Maximum number of connections kept alive per host.
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = HTTPAdapter(pool_connections=MAX_POOLS, pool_maxsize=pool_maxsize)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.adapter = adapter
+
+    def request(self, method: str, url: str, *args, **kwargs) -> Response:
+        """Send a request with the default timeout unless one is given, once an outbound slot is free."""
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+
+        timeout = kwargs["timeout"][0] if isinstance(kwargs["timeout"], tuple) else kwargs["timeout"]
+        if not outbound_slots.acquire(settings.OUTBOUND_MAX_ACTIVE, timeout):
+            metrics.outbound_errors.inc()
+            raise ConnectTimeout(f"Too many outbound requests, {method} {url} was not sent")
+
+        metrics.outbound_requests.inc()
+        try:
+            return super().request(method, url, *args, **kwargs)
+        except RequestException:
+            metrics.outbound_errors.inc()
+            raise
+        finally:
+            # A streamed body is read after the slot is released
+            outbound_slots.release()
+
+    def record_stats(self) -> None:
+        """Publish the connection pool statistics as metrics."""
+        stats = self.get_stats()
+        metrics.client_pools.set(stats["hosts"])
+        metrics.client_connections.set(stats["connections"])
+        metrics.client_requests.set(stats["requests"])
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get the connection pool statistics.
+
+        :return: Number of pooled hosts, connections opened and requests sent over them.
+        """
+        stats = {"hosts": 0, "connections": 0, "requests": 0}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            if pool := pools.get(key):
+                stats["hosts"] += 1
+                stats["connections"] += pool.num_connections
+                stats["requests"] += pool.num_requests
+        return stats
+
+
+def get_pool_size() -> int:
+    """
+    Get the number of connections kept alive per host.
+
+    Every running check may send LINK_HOST_CONCURRENCY requests to the same host at once, within the outbound cap.
+
+    :return: Pool size.
+    """
+    return max(1, min(settings.CHECK_MAX_ACTIVE * settings.LINK_HOST_CONCURRENCY, settings.OUTBOUND_MAX_ACTIVE))
+
+
+_lock = threading.Lock()
+_client: Optional[Client] = None
+_client_pid: Optional[int] = None
+
+
+def get_client() -> Client:
+    """
+    Get the HTTP client of the current worker process.
+
+    :return: Client, created on first use and again after a fork.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = Client(settings.HTTP_TIMEOUT, get_pool_size())
+            _client_pid = pid
+        return _client
@@ -0,0 +1,229 @@
+import hashlib
+import math
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator, Optional
+from urllib.parse import urldefrag, urlsplit
+
+from django.conf import settings
+from requests.exceptions import RequestException
+
+from checker.client import get_client
+from checker.parser import Parser
+from checker.robots import get_robots
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class BloomFilter:
+    """
+    Set membership with a fixed memory size and a bounded false positive rate.
+
+    Used as the crawl frontier dedup, its memory stays flat however many URLs the site has. A false positive only
+    skips a page.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        """
+        Initialize the filter.
+
+        :param capacity: Expected number of items.
+        :param error_rate: False positive rate at capacity.
+        """
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item.
+
+        :param item: Item to add.
+        :return: True if the item was added, False if it was (probably) already there.
+        """
+        added = False
+        for index in self._indexes(item):
+            byte, bit = divmod(index, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+
+        self.count += added
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[index // 8] & (1 << (index % 8)) for index in self._indexes(item))
+
+
+class Crawler:
+    """
+    Breadth-first crawler of the pages of a site.
+
+    Same-domain links from Parser.anchors are followed up to a depth and a page limit, and the pages disallowed by
+    robots.txt are skipped.
+    """
+
+    def __init__(
+        self,
+        start_url: str,
+        max_depth: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the crawler.
+
+        :param start_url: URL to start from.
+        :param max_depth: Maximum link depth from the start URL.
+        :param max_pages: Maximum number of pages to crawl.
+        :param concurrency: Number of concurrent fetches.
+        """
+        u = urlsplit(start_url, allow_fragments=False)
+        self.start_url = start_url
+        self.domain = u.netloc.lower()
+        self.base_url = f"{u.scheme}://{u.netloc}"
+        self.max_depth = max_depth if max_depth is not None else settings.CRAWL_MAX_DEPTH
+        self.max_pages = max_pages if max_pages is not None else settings.CRAWL_MAX_PAGES
+        self.concurrency = concurrency or settings.CRAWL_CONCURRENCY
+        self.client = get_client()
+        self.robots = get_robots(self.client, self.base_url)
+
+        self.seen = BloomFilter(max(self.max_pages, 1))
+        self.summary: Counter[str] = Counter()
+        self.statuses: Counter[int] = Counter()
+        self.started_at: Optional[float] = None
+
+    def is_allowed(self, url: str) -> bool:
+        """
+        Check if a URL is on the crawled site and allowed by robots.txt.
+
+        :param url: URL to check.
+        :return: True if it may be crawled, False otherwise.
+        """
+        u = urlsplit(url)
+        if u.scheme not in ("http", "https") or u.netloc.lower() != self.domain:
+            return False
+        return self.robots.is_allowed(url, settings.CRAWL_USER_AGENT)
+
+    def crawl_page(self, url: str, depth: int) -> tuple[dict, list[str]]:
+        """
+        Fetch and parse a page.
+
+        :param url: URL of the page.
+        :param depth: Link depth from the start URL.
+        :return: Page report and the same-site links to follow.
+        """
+        report: dict = {"url": url, "depth": depth}
+        try:
+            r = self.client.get(url, stream=True, headers={"User-Agent": settings.CRAWL_USER_AGENT})
+            report["status"] = r.status_code
+            # Only the number of tags is reported, links are resolved against the page URL after redirects
+            parsed = Parser.from_response(r, self.base_url, settings.MAX_PAGE_SIZE, max_tags=0, page_url=r.url)
+        except (RequestException, ValueError) as e:
+            report["error"] = str(e)
+            return report, []
+
+        anchors = parsed.anchors or []
+        headings = parsed.headings or {}
+        report.update(
+            {
+                "title": parsed.title,
+                "description": parsed.description,
+                "h1": len(headings.get(1) or []),
+                "anchors": len(anchors),
+                "inlineCSS": parsed.inline_css_count,
+                "images": parsed.images_count,
+                "imagesMissAlt": parsed.images_miss_alt_count,
+                "truncated": parsed.truncated,
+            }
+        )
+        return report, [urldefrag(anchor).url for anchor in anchors]
+
+    def crawl(self) -> Iterator[dict]:
+        """
+        Crawl the site.
+
+        :return: Iterator of page reports, in the order they are crawled.
+        """
+        self.started_at = time.monotonic()
+        frontier: deque[tuple[str, int]] = deque()
+        if self.is_allowed(self.start_url):
+            self.seen.add(self.start_url)
+            frontier.append((self.start_url, 0))
+
+        scheduled = len(frontier)
+        running: dict[Future, int] = dict()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while frontier or running:
+                while frontier and len(running) < self.concurrency:
+                    url, depth = frontier.popleft()
+                    running[executor.submit(self.crawl_page, url, depth)] = depth
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = running.pop(future)
+                    report, links = future.result()
+                    self._count(report)
+                    yield report
+
+                    if depth >= self.max_depth:
+                        continue
+                    for link in links:
+                        if scheduled >= self.max_pages:
+                            break
+                        if self.is_allowed(link) and self.seen.add(link):
+                            frontier.append((link, depth + 1))
+                            scheduled += 1
+
+    def _count(self, report: dict) -> None:
+        """
+        Add a page report to the summary.
+
+        :param report: Page report.
+        """
+        self.summary["pages"] += 1
+        if "error" in report:
+            self.summary["errors"] += 1
+            return
+
+        self.statuses[report["status"]] += 1
+        self.summary["missingTitle"] += not report["title"]
+        self.summary["missingDescription"] += not report["description"]
+        self.summary["missingH1"] += not report["h1"]
+        self.summary["imagesMissAlt"] += report["imagesMissAlt"]
+        self.summary["inlineCSS"] += report["inlineCSS"]
+
+    def get_summary(self) -> dict:
+        """
+        Get the aggregate summary of the crawl.
+
+        :return: Page counts, issue counts, throughput in pages per second and peak memory in KiB.
+        """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "url": self.start_url,
+            "pages": self.summary["pages"],
+            "errors": self.summary["errors"],
+            "statuses": dict(self.statuses),
+            "missingTitle": self.summary["missingTitle"],
+            "missingDescription": self.summary["missingDescription"],
+            "missingH1": self.summary["missingH1"],
+            "imagesMissAlt": self.summary["imagesMissAlt"],
+            "inlineCSS": self.summary["inlineCSS"],
+            "elapsed": round(elapsed, 3),
+            "pagesPerSecond": round(self.summary["pages"] / elapsed, 3) if elapsed else 0.0,
+            # Kilobytes on Linux, unknown on Windows
+            "peakMemory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        }
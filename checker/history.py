@@ -0,0 +1,211 @@
+import hashlib
+from datetime import timedelta
+from typing import Any, Iterable, Optional, Sequence
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from checker.caching import normalize_url
+from checker.models import CheckRun, Link, RunLink
+
+# Number of values per query, below the SQLite limit of bound parameters
+BATCH_SIZE = 500
+# Fields of a run compared with the previous run, with their name in the report context
+RUN_FIELDS: dict[str, str] = {
+    "title": "title",
+    "description": "description",
+    "favicon": "favicon",
+    "robots_meta": "robotsMeta",
+    "headings": "headings",
+    "inline_css_count": "inlineCSSCount",
+    "images_count": "imagesCount",
+    "images_miss_alt_count": "imagesMissAltCount",
+    "page_rank": "pageRank",
+    "robots_txt": "robotsTxt",
+    "sitemaps": "sitemaps",
+}
+# Lists of a run served page by page, with their field
+SECTION_FIELDS: dict[str, str] = {
+    "inlineCSS": "inline_css",
+    "imagesMissAlt": "images_miss_alt",
+    "sitemaps": "sitemaps",
+}
+
+
+def hash_url(url: str) -> str:
+    """
+    Hash a URL for the indexed lookups.
+
+    :param url: URL.
+    :return: SHA-256 hash.
+    """
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def get_stored_statuses(links: Optional[Iterable[str]]) -> dict[str, bool]:
+    """
+    Get the stored statuses of links that have not expired yet.
+
+    Statuses expire after LINK_CACHE_OK_TTL or LINK_CACHE_BROKEN_TTL seconds, like in the link status cache.
+
+    :param links: Links to look up.
+    :return: Broken flag of every link found.
+    """
+    now = timezone.now()
+    fresh = Q(broken=False, checked_at__gt=now - timedelta(seconds=settings.LINK_CACHE_OK_TTL)) | Q(
+        broken=True, checked_at__gt=now - timedelta(seconds=settings.LINK_CACHE_BROKEN_TTL)
+    )
+
+    hashes = {hash_url(link): link for link in links or []}
+    keys = list(hashes)
+    statuses: dict[str, bool] = dict()
+    for i in range(0, len(keys), BATCH_SIZE):
+        rows = Link.objects.filter(fresh, url_hash__in=keys[i : i + BATCH_SIZE]).values_list("url_hash", "broken")
+        statuses.update((hashes[url_hash], broken) for url_hash, broken in rows)
+    return statuses
+
+
+def record_check(context: dict, checked: dict[str, bool]) -> Optional[dict[str, Any]]:
+    """
+    Save a finished check and compare it with the previous run of the same page.
+
+    :param context: Report context, with the full lists of the paginated sections.
+    :param checked: Broken flag of the links requested by the check, the other links keep their stored status.
+    :return: Changes since the previous run if any, None otherwise.
+    """
+    url = normalize_url(context["url"])
+    url_hash = hash_url(url)
+    previous = CheckRun.objects.filter(url_hash=url_hash).first()
+
+    run = save_run(url, url_hash, context, checked)
+    changes = None
+    if previous is not None:
+        # Before the previous run is pruned with its links
+        broken = set(context.get("brokenLinks") or [])
+        changes = diff_runs(previous, run, {link: link in broken for link in context.get("anchors") or []})
+
+    prune_runs(url_hash)
+    return changes
+
+
+def save_run(url: str, url_hash: str, context: dict, checked: dict[str, bool]) -> CheckRun:
+    """
+    Save a run, its links and the new status of the links requested by it.
+
+    :param url: Normalized URL of the page.
+    :param url_hash: Hash of the URL.
+    :param context: Report context, with the full lists of the paginated sections.
+    :param checked: Broken flag of the links requested by the check.
+    :return: Saved run.
+    """
+    fields = {field: context.get(name) for field, name in RUN_FIELDS.items()}
+    # Heading levels are stored as JSON keys
+    fields["headings"] = {str(level): texts for level, texts in (fields["headings"] or {}).items()} or None
+    for field in ("inline_css_count", "images_count", "images_miss_alt_count"):
+        fields[field] = fields[field] or 0
+
+    hashes = {hash_url(link): link for link in context.get("anchors") or []}
+    broken = set(context.get("brokenLinks") or [])
+    now = timezone.now()
+
+    with transaction.atomic():
+        run = CheckRun.objects.create(
+            report_id=context.get("reportId"),
+            url=url,
+            url_hash=url_hash,
+            truncated=context.get("truncated", False),
+            incomplete=context.get("incomplete") or [],
+            inline_css=context.get("inlineCSS") or [],
+            images_miss_alt=context.get("imagesMissAlt") or [],
+            **fields,
+        )
+
+        Link.objects.bulk_create(
+            [Link(url=link, url_hash=key) for key, link in hashes.items()], batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        Link.objects.bulk_create(
+            [
+                Link(url=link, url_hash=hash_url(link), broken=status, checked_at=now)
+                for link, status in checked.items()
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["url_hash"],
+            update_fields=["broken", "checked_at"],
+        )
+
+        keys = list(hashes)
+        link_ids: dict[str, int] = dict()
+        for i in range(0, len(keys), BATCH_SIZE):
+            link_ids.update(Link.objects.filter(url_hash__in=keys[i : i + BATCH_SIZE]).values_list("url_hash", "id"))
+        RunLink.objects.bulk_create(
+            [RunLink(run=run, link_id=link_ids[key], broken=link in broken) for key, link in hashes.items()],
+            batch_size=BATCH_SIZE,
+        )
+    return run
+
+
+def prune_runs(url_hash: str) -> None:
+    """
+    Delete the runs of a page beyond the last CHECK_HISTORY_RUNS.
+
+    :param url_hash: Hash of the URL of the page.
+    """
+    old = CheckRun.objects.filter(url_hash=url_hash).values_list("id", flat=True)[settings.CHECK_HISTORY_RUNS :]
+    if old_ids := list(old):
+        CheckRun.objects.filter(id__in=old_ids).delete()
+
+
+def diff_runs(previous: CheckRun, run: CheckRun, new_links: dict[str, bool]) -> dict[str, Any]:
+    """
+    Compare a run with the previous run of the same page.
+
+    Lists of links hold at most REPORT_MAX_TAGS links, their full length is in the "...Count" keys.
+
+    :param previous: Previous run.
+    :param run: Run.
+    :param new_links: Links of the run, and whether they were reported broken.
+    :return: Changed fields with their old and new values, and added, removed, newly broken and fixed links.
+    """
+    fields = {
+        name: {"old": getattr(previous, field), "new": getattr(run, field)}
+        for field, name in RUN_FIELDS.items()
+        if getattr(previous, field) != getattr(run, field)
+    }
+
+    old_links = dict(previous.run_links.values_list("link__url", "broken"))
+    links = {
+        "addedLinks": [link for link in new_links if link not in old_links],
+        "removedLinks": [link for link in old_links if link not in new_links],
+        "newBrokenLinks": [],
+        "fixedLinks": [],
+    }
+    # Statuses are only compared when both runs checked every link
+    if "brokenLinks" not in previous.incomplete and "brokenLinks" not in run.incomplete:
+        links["newBrokenLinks"] = [link for link, broken in new_links.items() if broken and not old_links.get(link)]
+        links["fixedLinks"] = [link for link, broken in old_links.items() if broken and new_links.get(link) is False]
+
+    changes: dict[str, Any] = {"previousRun": previous.created_at, "fields": fields}
+    for name, values in links.items():
+        changes[name] = values[: settings.REPORT_MAX_TAGS]
+        changes[name + "Count"] = len(values)
+    return changes
+
+
+def get_section_items(report_id: str, section: str) -> Optional[Sequence[str]]:
+    """
+    Get the full list of a section of a saved report.
+
+    :param report_id: Report ID.
+    :param section: Section name, "brokenLinks" or one of SECTION_FIELDS.
+    :return: Items of the section, lazily queried for the broken links, None if the report is not saved.
+    """
+    field = SECTION_FIELDS.get(section)
+    run = CheckRun.objects.filter(report_id=report_id).only("id", *([field] if field else [])).first()
+    if run is None:
+        return None
+    if field:
+        return getattr(run, field) or []
+    return run.run_links.filter(broken=True).order_by("id").values_list("link__url", flat=True)
@@ -0,0 +1,90 @@
+import json
+from datetime import timedelta
+from threading import Event
+from typing import Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from requests.exceptions import RequestException
+
+from checker.checks import get_report
+from checker.models import CheckJob
+
+
+def enqueue_check(url: str) -> CheckJob:
+    """
+    Queue a check to run in the background workers.
+
+    :param url: URL to check.
+    :return: Queued job.
+    """
+    return CheckJob.objects.create(url=url)
+
+
+def claim_job() -> Optional[CheckJob]:
+    """
+    Claim the oldest job waiting in the queue.
+
+    Jobs left running longer than CHECK_JOB_TIMEOUT, e.g. by a crashed worker, are claimed again.
+
+    :return: Claimed job if any, None otherwise.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.CHECK_JOB_TIMEOUT)
+    claimable = Q(status=CheckJob.Status.PENDING) | Q(status=CheckJob.Status.RUNNING, started_at__lt=stale)
+
+    for job in CheckJob.objects.filter(claimable).only("id", "status", "started_at")[:10]:
+        # The conditional update makes sure a single worker gets the job
+        claimed = CheckJob.objects.filter(pk=job.pk, status=job.status, started_at=job.started_at).update(
+            status=CheckJob.Status.RUNNING, started_at=now
+        )
+        if claimed:
+            return CheckJob.objects.get(pk=job.pk)
+
+    return None
+
+
+def run_job(job: CheckJob) -> None:
+    """
+    Run a claimed job and store its report.
+
+    :param job: Claimed job.
+    """
+    try:
+        # Round trip through JSON, as the report is stored in a JSON field
+        job.report = json.loads(json.dumps(get_report(job.url), cls=DjangoJSONEncoder))
+        job.status = CheckJob.Status.DONE
+    except (RequestException, ValueError, TimeoutError) as e:
+        print(f"Failed to check {job.url}: {e}")
+        job.error = str(e)
+        job.status = CheckJob.Status.FAILED
+    except Exception as e:
+        # A bug must fail its job only, not the worker, or the job would be claimed again by the next one
+        print(f"Unexpected error while checking {job.url}: {e!r}")
+        job.error = str(e)
+        job.status = CheckJob.Status.FAILED
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["report", "error", "status", "finished_at"])
+
+
+def work(stop: Optional[Event] = None) -> None:
+    """
+    Run the queued jobs one at a time until stopped.
+
+    :param stop: Event stopping the worker, it runs forever otherwise.
+    """
+    stop = stop or Event()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            if job := claim_job():
+                run_job(job)
+                continue
+        except Exception as e:
+            # E.g. the database went away, the worker retries after the poll interval
+            print(f"Failed to run job: {e!r}")
+        stop.wait(settings.CHECK_JOB_POLL_INTERVAL)
@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checker.benchmarks import CORPUS_SIZES, compare, load_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark the parser, the check view and the link checker against a local fake web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-s", "--sizes", nargs="+", choices=list(CORPUS_SIZES), default=list(CORPUS_SIZES), help="Corpus sizes."
+        )
+        parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of runs of every benchmark.")
+        parser.add_argument("-l", "--links", type=int, default=500, help="Number of links to check, 0 to skip.")
+        parser.add_argument("--latency", type=float, default=0.0, help="Response delay of the server in seconds.")
+        parser.add_argument("--error-rate", type=float, default=0.05, help="Share of broken links, between 0 and 1.")
+        parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file receiving the results.")
+        parser.add_argument("-b", "--baseline", help="JSON file of baseline results to compare against.")
+        parser.add_argument(
+            "-t", "--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression."
+        )
+
+    def handle(self, *args, **options):
+        baseline = load_results(options["baseline"]) if options["baseline"] else None
+        results = run_benchmarks(
+            options["sizes"],
+            options["repeat"],
+            options["links"],
+            options["latency"],
+            options["error_rate"],
+            log=self.stdout.write,
+        )
+
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            return
+
+        regressions = list()
+        for name, ratio in compare(results, baseline):
+            regressed = ratio > options["threshold"]
+            self.stdout.write(f"{name:<40} {ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(name)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
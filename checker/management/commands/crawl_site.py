@@ -0,0 +1,30 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from checker.crawler import Crawler
+
+
+class Command(BaseCommand):
+    help = "Crawl a site breadth-first and report every page, followed by a summary."
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="URL to start from.")
+        parser.add_argument("-d", "--depth", type=int, help="Maximum link depth.")
+        parser.add_argument("-m", "--max-pages", type=int, help="Maximum number of pages.")
+        parser.add_argument("-c", "--concurrency", type=int, help="Number of concurrent fetches.")
+        parser.add_argument("-o", "--output", help="NDJSON file receiving the page reports, stdout by default.")
+
+    def handle(self, *args, **options):
+        crawler = Crawler(options["url"], options["depth"], options["max_pages"], options["concurrency"])
+
+        output = open(options["output"], "w", encoding="utf-8") if options["output"] else sys.stdout
+        try:
+            for report in crawler.crawl():
+                output.write(json.dumps(report, ensure_ascii=False) + "\n")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(json.dumps(crawler.get_summary(), indent=2))
@@ -0,0 +1,32 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from checker.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Run the background workers of the queued checks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-p", "--processes", type=int, default=settings.CHECK_JOB_WORKERS, help="Number of worker processes."
+        )
+
+    def handle(self, *args, **options):
+        # Connections must not be shared with the forked workers
+        connections.close_all()
+
+        processes = [multiprocessing.Process(target=work, daemon=True) for _ in range(options["processes"])]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} check workers.")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
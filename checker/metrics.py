@@ -0,0 +1,217 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Upper bounds of the duration buckets in seconds
+DURATION_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = ((name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    """Process-level metric, rendered in the Prometheus text format."""
+
+    TYPE: str = ""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        """
+        Initialize the metric and register it.
+
+        :param name: Metric name.
+        :param documentation: Help text.
+        """
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self) -> list[str]:
+        """
+        Render the metric.
+
+        :return: Lines of the Prometheus text format.
+        """
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}", *self.samples()]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self.values: dict[tuple[tuple[str, str], ...], float] = dict()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increment the counter.
+
+        :param amount: Amount to add.
+        :param labels: Label values.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        """Get the value of the counter."""
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increment the gauge.
+
+        :param amount: Amount to add.
+        """
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        """
+        Decrement the gauge.
+
+        :param amount: Amount to subtract.
+        """
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        """
+        Set the gauge.
+
+        :param value: New value.
+        """
+        with self._lock:
+            self.value = value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name} {self.value}"]
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        # Per label values, the count of every bucket (not cumulative), then the sum
+        self.values: dict[tuple[tuple[str, str], ...], tuple[list[int], float]] = dict()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record an observation.
+
+        :param value: Observed value.
+        :param labels: Label values.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def get_count(self, **labels: str) -> int:
+        """Get the number of observations."""
+        counts, _ = self.values.get(tuple(sorted(labels.items()))) or ([], 0.0)
+        return sum(counts)
+
+    def samples(self) -> list[str]:
+        lines: list[str] = list()
+        with self._lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels((*key, ('le', str(bound))))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+registry: list[Metric] = list()
+
+checks_run = Counter("checker_checks_total", "Checks run, by result.")
+stage_duration = Histogram("checker_stage_duration_seconds", "Duration of the stages of a check.")
+links_checked = Counter("checker_links_checked_total", "Links requested by the broken link check.")
+outbound_requests = Counter("checker_outbound_requests_total", "Outbound HTTP requests.")
+outbound_errors = Counter("checker_outbound_errors_total", "Outbound HTTP requests failed without a response.")
+cache_hits = Counter("checker_cache_hits_total", "Cache hits, by cache.")
+cache_misses = Counter("checker_cache_misses_total", "Cache misses, by cache.")
+checks_active = Gauge("checker_checks_active", "Checks running.")
+checks_queued = Gauge("checker_checks_queued", "Checks waiting for a slot.")
+checks_rejected = Counter("checker_checks_rejected_total", "Checks rejected because the process was busy.")
+outbound_active = Gauge("checker_outbound_requests_active", "Outbound HTTP requests waiting for a response.")
+outbound_queued = Gauge("checker_outbound_requests_queued", "Outbound HTTP requests waiting for a slot.")
+client_pools = Gauge("checker_client_pools", "Hosts with a connection pool in the shared HTTP client.")
+client_connections = Gauge("checker_client_connections", "Connections opened by the pools of the shared HTTP client.")
+client_requests = Gauge("checker_client_pool_requests", "Requests sent over the pools of the shared HTTP client.")
+probe_connections = Gauge("checker_probe_connections", "Connections opened by the asyncio link probers.")
+probe_connections_queued = Gauge("checker_probe_connections_queued", "Link probes waiting for a connection slot.")
+
+
+def render() -> str:
+    """
+    Render every metric of the process.
+
+    :return: Prometheus text format.
+    """
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+@contextmanager
+def timed(timings: Optional[dict[str, float]], stage: str) -> Iterator[None]:
+    """
+    Time a stage of a check.
+
+    :param timings: Dictionary receiving the duration in seconds by stage name.
+    :param stage: Stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(timings, stage, time.perf_counter() - start)
+
+
+def record_stage(timings: Optional[dict[str, float]], stage: str, duration: float) -> None:
+    """
+    Record the duration of a stage of a check.
+
+    :param timings: Dictionary receiving the duration in seconds by stage name.
+    :param stage: Stage name.
+    :param duration: Duration in seconds.
+    """
+    if timings is not None:
+        timings[stage] = duration
+    stage_duration.observe(duration, stage=stage)
+
+
+def get_server_timing(timings: dict[str, float]) -> str:
+    """
+    Format stage durations as a Server-Timing header.
+
+    :param timings: Duration in seconds by stage name.
+    :return: Header value.
+    """
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in timings.items())
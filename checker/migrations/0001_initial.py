@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-16 23:08
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckJob",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("url", models.URLField(max_length=2048)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Đang chờ"),
+                            ("running", "Đang kiểm tra"),
+                            ("done", "Hoàn tất"),
+                            ("failed", "Thất bại"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("report", models.JSONField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["created_at"],
+                "indexes": [models.Index(fields=["status", "created_at"], name="checker_che_status_6551e0_idx")],
+            },
+        ),
+    ]
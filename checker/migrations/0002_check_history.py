@@ -0,0 +1,81 @@
+# Generated by Django 5.0.14 on 2026-10-16 22:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checker", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("url", models.URLField(max_length=2048)),
+                ("url_hash", models.CharField(max_length=64)),
+                ("title", models.TextField(blank=True, null=True)),
+                ("description", models.TextField(blank=True, null=True)),
+                ("favicon", models.TextField(blank=True, null=True)),
+                ("robots_meta", models.TextField(blank=True, null=True)),
+                ("headings", models.JSONField(blank=True, null=True)),
+                ("inline_css_count", models.PositiveIntegerField(default=0)),
+                ("images_count", models.PositiveIntegerField(default=0)),
+                ("images_miss_alt_count", models.PositiveIntegerField(default=0)),
+                ("page_rank", models.FloatField(blank=True, null=True)),
+                ("robots_txt", models.TextField(blank=True, null=True)),
+                ("sitemaps", models.JSONField(blank=True, null=True)),
+                ("truncated", models.BooleanField(default=False)),
+                ("incomplete", models.JSONField(blank=True, default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="Link",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("url", models.TextField()),
+                ("url_hash", models.CharField(max_length=64, unique=True)),
+                ("broken", models.BooleanField(null=True)),
+                ("checked_at", models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RunLink",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("broken", models.BooleanField(default=False)),
+                (
+                    "link",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="run_links", to="checker.link"
+                    ),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="run_links", to="checker.checkrun"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="checkrun",
+            name="links",
+            field=models.ManyToManyField(related_name="runs", through="checker.RunLink", to="checker.link"),
+        ),
+        migrations.AddConstraint(
+            model_name="runlink",
+            constraint=models.UniqueConstraint(fields=("run", "link"), name="unique_run_link"),
+        ),
+        migrations.AddIndex(
+            model_name="checkrun",
+            index=models.Index(fields=["url_hash", "-created_at"], name="checker_che_url_has_a8a54e_idx"),
+        ),
+    ]
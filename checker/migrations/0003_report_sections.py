@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checker", "0002_check_history"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="checkrun",
+            name="images_miss_alt",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="checkrun",
+            name="inline_css",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="checkrun",
+            name="report_id",
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -1 +1,90 @@
-# Create your models here.
+import uuid
+
+from django.db import models
+
+
+class CheckJob(models.Model):
+    """Check of a page queued to run in the background workers."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Đang chờ"
+        RUNNING = "running", "Đang kiểm tra"
+        DONE = "done", "Hoàn tất"
+        FAILED = "failed", "Thất bại"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    url = models.URLField(max_length=2048)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    report = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.url} ({self.status})"
+
+    @property
+    def finished(self) -> bool:
+        """Check if the job has finished, successfully or not."""
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+
+class Link(models.Model):
+    """Last known status of a link, shared by every check run linking to it, None if never requested."""
+
+    url = models.TextField()
+    url_hash = models.CharField(max_length=64, unique=True)
+    broken = models.BooleanField(null=True)
+    checked_at = models.DateTimeField(null=True)
+
+    def __str__(self) -> str:
+        return self.url
+
+
+class CheckRun(models.Model):
+    """Finished check of a page, with its extracted fields and the status of its links at the time."""
+
+    # Public identifier of the report, for the paginated sections
+    report_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    url = models.URLField(max_length=2048)
+    url_hash = models.CharField(max_length=64)
+    title = models.TextField(null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    favicon = models.TextField(null=True, blank=True)
+    robots_meta = models.TextField(null=True, blank=True)
+    headings = models.JSONField(null=True, blank=True)
+    inline_css_count = models.PositiveIntegerField(default=0)
+    images_count = models.PositiveIntegerField(default=0)
+    images_miss_alt_count = models.PositiveIntegerField(default=0)
+    inline_css = models.JSONField(default=list, blank=True)
+    images_miss_alt = models.JSONField(default=list, blank=True)
+    page_rank = models.FloatField(null=True, blank=True)
+    robots_txt = models.TextField(null=True, blank=True)
+    sitemaps = models.JSONField(null=True, blank=True)
+    truncated = models.BooleanField(default=False)
+    incomplete = models.JSONField(default=list, blank=True)
+    links = models.ManyToManyField(Link, through="RunLink", related_name="runs")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["url_hash", "-created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.url} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class RunLink(models.Model):
+    """Link of a check run, and whether it was reported broken by the run."""
+
+    run = models.ForeignKey(CheckRun, on_delete=models.CASCADE, related_name="run_links")
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name="run_links")
+    broken = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["run", "link"], name="unique_run_link")]
@@ -0,0 +1,181 @@
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from json import JSONDecodeError
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from requests import Session
+from requests.exceptions import RequestException
+
+from checker import metrics
+from checker.caching import make_key
+from checker.pipeline import Deadline, DeadlineExceeded, get_thread_name_prefix
+
+# Maximum number of domains per API call
+MAX_DOMAINS: int = 100
+
+
+def get_key(domain: str) -> str:
+    """
+    Get the cache key of the page rank of a domain.
+
+    :param domain: Domain.
+    :return: Cache key.
+    """
+    return make_key("pagerank", domain.lower())
+
+
+def fetch_page_ranks(client: Session, domains: list[str], deadline: Optional[Deadline] = None) -> dict[str, int]:
+    """
+    Get the page ranks of up to MAX_DOMAINS domains with a single API call.
+
+    :param client: Client sessions.
+    :param domains: Domains to look up.
+    :param deadline: Deadline of the check.
+    :return: Page ranks keyed by lowercase domain, 0 for the unranked domains, empty if the call failed.
+    """
+    params = {f"domains[{i}]": domain.lower() for i, domain in enumerate(domains)}
+    headers = {"API-OPR": settings.OPEN_PAGERANK_KEY}
+    try:
+        timeout = deadline.timeout(settings.HTTP_TIMEOUT) if deadline else None
+        r = client.get(settings.OPEN_PAGERANK_URL, params=params, headers=headers, timeout=timeout)
+        r.raise_for_status()
+        results: list[dict] = r.json()["response"]
+    except (RequestException, JSONDecodeError, KeyError, TypeError) as e:
+        print(f"Failed to get page rank: {e}")
+        return dict()
+
+    ranks: dict[str, int] = dict()
+    for domain, result in zip(domains, results):
+        domain = (result.get("domain") or domain).lower()
+        ranks[domain] = int(result["rank"]) if result.get("status_code") == 200 and result.get("rank") else 0
+    return ranks
+
+
+def get_page_ranks(client: Session, domains: Iterable[str], deadline: Optional[Deadline] = None) -> dict[str, int]:
+    """
+    Get the page ranks of many domains, from the cache or with one API call per MAX_DOMAINS domains.
+
+    :param client: Client sessions.
+    :param domains: Domains to look up.
+    :param deadline: Deadline of the check.
+    :return: Page ranks keyed by lowercase domain, the domains whose lookup failed are missing.
+    """
+    keys = {get_key(domain): domain.lower() for domain in domains}
+    ranks = {keys[key]: rank for key, rank in cache.get_many(keys).items()}
+    misses = [domain for domain in keys.values() if domain not in ranks]
+
+    for i in range(0, len(misses), MAX_DOMAINS):
+        fetched = fetch_page_ranks(client, misses[i : i + MAX_DOMAINS], deadline)
+        cache.set_many({get_key(domain): rank for domain, rank in fetched.items()}, settings.PAGE_RANK_CACHE_TTL)
+        ranks.update(fetched)
+
+    return ranks
+
+
+class PageRankBatcher:
+    """
+    Batch the page rank lookups of concurrent checks.
+
+    The first lookup opens a batch and waits PAGE_RANK_BATCH_WINDOW seconds for the lookups of the other checks, then
+    a single API call serves all of them. A full batch is sent right away. The call runs on a thread of its own with
+    a timeout of HTTP_TIMEOUT, every check waits for it up to its own deadline.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._batch: Optional[dict[str, Future]] = None
+
+    def get(self, client: Session, domain: str, deadline: Optional[Deadline] = None) -> Optional[int]:
+        """
+        Get the page rank of a domain within the next batch.
+
+        :param client: Client sessions.
+        :param domain: Domain to look up.
+        :param deadline: Deadline of the check.
+        :return: Page rank, None if the lookup failed.
+        """
+        domain = domain.lower()
+        with self._lock:
+            leader = self._batch is None
+            if leader:
+                self._batch = dict()
+            batch = self._batch
+            future = batch.setdefault(domain, Future())
+            full = len(batch) >= MAX_DOMAINS
+            if full:
+                self._batch = None
+
+        if full:
+            self._start(client, batch)
+        elif leader:
+            time.sleep(settings.PAGE_RANK_BATCH_WINDOW)
+            with self._lock:
+                # Already sent if it filled up in the meantime
+                open_batch = self._batch is batch
+                if open_batch:
+                    self._batch = None
+            if open_batch:
+                self._start(client, batch)
+
+        try:
+            return future.result(timeout=deadline.remaining() if deadline else None)
+        except FutureTimeoutError:
+            raise DeadlineExceeded("Deadline exceeded")
+
+    def _start(self, client: Session, batch: dict[str, Future]) -> None:
+        """
+        Send a batch in the background.
+
+        :param client: Client sessions.
+        :param batch: Futures keyed by domain.
+        """
+        thread = threading.Thread(target=self._send, args=(client, batch), name=get_thread_name_prefix("pagerank"))
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def _send(client: Session, batch: dict[str, Future]) -> None:
+        """
+        Look up a batch of domains and resolve their futures.
+
+        :param client: Client sessions.
+        :param batch: Futures keyed by domain.
+        """
+        try:
+            # Not bounded by the deadline of the check that opened the batch, the others may wait longer
+            ranks = get_page_ranks(client, batch, Deadline(settings.HTTP_TIMEOUT))
+        except BaseException as e:
+            for future in batch.values():
+                future.set_exception(e)
+            raise
+
+        for domain, future in batch.items():
+            future.set_result(ranks.get(domain))
+
+
+page_rank_batcher = PageRankBatcher()
+
+
+def get_page_rank(client: Session, domain: str, deadline: Optional[Deadline] = None) -> int:
+    """
+    Get the page rank of a domain.
+
+    :param client: Client sessions.
+    :param domain: Domain to check.
+    :param deadline: Deadline of the check.
+    :return: Page rank if found, 0 otherwise.
+    """
+    if settings.DEBUG:
+        print("Skipping page rank retrieval in debug mode.")
+        return 0
+
+    if (rank := cache.get(get_key(domain))) is not None:
+        metrics.cache_hits.inc(cache="pagerank")
+        return rank
+
+    metrics.cache_misses.inc(cache="pagerank")
+    return page_rank_batcher.get(client, domain, deadline) or 0
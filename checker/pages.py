@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from requests import Response, Session
+
+from checker import metrics
+from checker.caching import make_key, normalize_url
+from checker.parser import Extraction, Parser
+from checker.pipeline import Deadline
+from checker.utils import get_timeout
+
+
+@dataclass(slots=True)
+class CachedPage:
+    """Validators, hash and extracted fields of a page fetched earlier."""
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: str
+    truncated: bool
+    max_tags: Optional[int]
+    extraction: Extraction
+
+    def get_headers(self) -> dict[str, str]:
+        """
+        Get the headers of a conditional GET revalidating the page.
+
+        :return: If-None-Match and If-Modified-Since headers.
+        """
+        headers: dict[str, str] = dict()
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def get_page_key(url: str) -> str:
+    """
+    Get the cache key of a page.
+
+    :param url: URL of the page.
+    :return: Cache key.
+    """
+    return make_key("page", normalize_url(url))
+
+
+def open_page(
+    client: Session, url: str, deadline: Optional[Deadline] = None, max_tags: Optional[int] = None
+) -> tuple[Response, Optional[CachedPage]]:
+    """
+    Request a page, revalidating it with a conditional GET when it was fetched before.
+
+    :param client: Client sessions.
+    :param url: URL of the page.
+    :param deadline: Deadline of the check.
+    :param max_tags: Maximum number of tags rendered per list.
+    :return: Response opened with stream=True, and the cached page if any.
+    """
+    cached: Optional[CachedPage] = cache.get(get_page_key(url)) if settings.PAGE_CACHE_TTL > 0 else None
+    # An extraction is only reused with the same tag limit
+    if cached is not None and cached.max_tags != max_tags:
+        cached = None
+
+    headers = cached.get_headers() if cached else None
+    return client.get(url, stream=True, timeout=get_timeout(deadline), headers=headers), cached
+
+
+def parse_page(
+    response: Response,
+    cached: Optional[CachedPage],
+    base_url: str,
+    deadline: Optional[Deadline] = None,
+    max_tags: Optional[int] = None,
+) -> Parser:
+    """
+    Parse a page, reusing its cached extraction when it has not changed.
+
+    On a 304, or when the body has the same hash as the cached one, the cached extraction is reused and the page is
+    not parsed. A page that was not cached is parsed while it is being downloaded.
+
+    :param response: Response of open_page.
+    :param cached: Cached page of open_page.
+    :param base_url: Base URL.
+    :param deadline: Deadline of the check.
+    :param max_tags: Maximum number of tags rendered per list.
+    :return: Parser of the page.
+    """
+    if cached is None:
+        metrics.cache_misses.inc(cache="page")
+        return Parser.from_response(response, base_url, settings.MAX_PAGE_SIZE, deadline, max_tags)
+
+    if response.status_code == 304:
+        response.close()
+        metrics.cache_hits.inc(cache="page")
+        return Parser.from_extraction(cached.extraction, base_url, cached.digest, cached.truncated, max_tags)
+
+    # The body is hashed before it is parsed, to skip the parse when it is unchanged
+    reader = Parser.read_response(response, settings.MAX_PAGE_SIZE, deadline)
+    content = reader.read()
+    if reader.digest == cached.digest and reader.truncated == cached.truncated:
+        metrics.cache_hits.inc(cache="page")
+        return Parser.from_extraction(cached.extraction, base_url, cached.digest, cached.truncated, max_tags)
+
+    metrics.cache_misses.inc(cache="page")
+    parsed = Parser(content, base_url, max_tags)
+    parsed.truncated = reader.truncated
+    return parsed
+
+
+def store_page(
+    url: str,
+    response: Response,
+    parsed: Parser,
+    cached: Optional[CachedPage] = None,
+    deadline: Optional[Deadline] = None,
+) -> None:
+    """
+    Cache the validators, hash and extracted fields of a page.
+
+    Pages that are not successful, or that were cut short by the deadline, are not cached.
+
+    :param url: URL of the page.
+    :param response: Response of open_page.
+    :param parsed: Parser of parse_page.
+    :param cached: Cached page of open_page, whose validators are kept when a 304 does not repeat them.
+    :param deadline: Deadline of the check.
+    """
+    if settings.PAGE_CACHE_TTL <= 0 or not response.ok or (deadline and deadline.expired):
+        return
+
+    page = CachedPage(
+        etag=response.headers.get("ETag") or (cached.etag if cached else None),
+        last_modified=response.headers.get("Last-Modified") or (cached.last_modified if cached else None),
+        digest=parsed.digest,
+        truncated=parsed.truncated,
+        max_tags=parsed.max_tags,
+        extraction=parsed.extraction,
+    )
+    cache.set(get_page_key(url), page, settings.PAGE_CACHE_TTL)
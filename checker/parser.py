@@ -1,63 +1,243 @@
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional
+import hashlib
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Iterator, Optional
+from urllib.parse import urljoin
 
 from lxml import etree
+from requests import Response
 
+from checker.pipeline import Deadline
 from checker.utils import ENCODING
 
 
+@dataclass(slots=True)
+class Extraction:
+    """All the fields extracted from a page in a single pass."""
+
+    title: Optional[str] = None
+    description: Optional[str] = None
+    favicon: Optional[str] = None
+    robots_meta: Optional[str] = None
+    headings: dict[int, Optional[list[str]]] = field(default_factory=dict)
+    anchors: Optional[list[str]] = None
+    inline_css: Optional[list[str]] = None
+    images: Optional[list[str]] = None
+    images_miss_alt: Optional[list[str]] = None
+    inline_css_count: int = 0
+    images_count: int = 0
+    images_miss_alt_count: int = 0
+
+
+class BodyReader:
+    """Read the body of a streamed response up to a size and a deadline, hashing what is read."""
+
+    CHUNK_SIZE: int = 64 * 1024
+
+    def __init__(self, response: Response, max_size: int, deadline: Optional[Deadline] = None) -> None:
+        """
+        Initialize the reader.
+
+        :param response: Response opened with stream=True.
+        :param max_size: Maximum number of bytes to read.
+        :param deadline: Deadline after which the rest of the body is ignored.
+        """
+        self.response = response
+        self.max_size = max_size
+        self.deadline = deadline
+        self.truncated = False
+        self._hash = hashlib.sha256()
+
+    def __iter__(self) -> Iterator[bytes]:
+        size = 0
+        try:
+            for chunk in self.response.iter_content(chunk_size=self.CHUNK_SIZE):
+                if len(chunk) > self.max_size - size:
+                    chunk = chunk[: self.max_size - size]
+                    self.truncated = True
+                self._hash.update(chunk)
+                yield chunk
+                size += len(chunk)
+                if self.truncated:
+                    break
+                if self.deadline and self.deadline.expired:
+                    self.truncated = True
+                    break
+        finally:
+            self.response.close()
+
+    def read(self) -> bytes:
+        """Read the whole body."""
+        return b"".join(self)
+
+    @property
+    def digest(self) -> str:
+        """Get the SHA-256 hash of what was read."""
+        return self._hash.hexdigest()
+
+
 class Parser:
     HEADING_LEVEL: int = 6
     METHOD_HTML: str = "html"
-
-    def __init__(self, content: bytes, base_url: str) -> None:
+    HEADING_TAGS: dict[str, int] = {f"h{level}": level for level in range(1, HEADING_LEVEL + 1)}
+    XPATH_TEXT = etree.XPath(".//text()")
+    CONTENT_TYPES: tuple[str, ...] = ("text/html", "application/xhtml+xml")
+    ATTRIBUTE_ESCAPES: dict[int, str] = str.maketrans({"&": "&amp;", '"': "&quot;", "<": "&lt;", ">": "&gt;"})
+    # Attributes serialized without their value by etree.tostring, as by libxml2
+    BOOLEAN_ATTRIBUTES: frozenset[str] = frozenset(
+        {
+            "checked",
+            "compact",
+            "declare",
+            "defer",
+            "disabled",
+            "ismap",
+            "multiple",
+            "nohref",
+            "noresize",
+            "noshade",
+            "nowrap",
+            "readonly",
+            "selected",
+        }
+    )
+
+    def __init__(self, content: bytes, base_url: str, max_tags: Optional[int] = None) -> None:
         """
         Initialize the parser.
 
         :param content: Content to be parsed.
         :param base_url: Base URL.
+        :param max_tags: Maximum number of tags rendered per list, 0 to only count them, None for no limit.
         """
         html_parser = etree.HTMLParser(encoding=ENCODING)
-        self.content = etree.fromstring(text=content, parser=html_parser, base_url=base_url)
-        self.base_url = base_url
+        self._load(etree.fromstring(text=content, parser=html_parser, base_url=base_url), base_url, max_tags)
+        self.page_url = None
+        self.digest = hashlib.sha256(content).hexdigest()
 
-        if self.content is None:
-            raise ValueError("Cannot parse content")
+    @classmethod
+    def read_response(cls, response: Response, max_size: int, deadline: Optional[Deadline] = None) -> BodyReader:
+        """
+        Check the content type of a streamed response and get a reader of its body.
 
-    def _xpath(self, xpath: str, multiple: bool = False) -> Optional[str | list[str]]:
+        :param response: Response opened with stream=True.
+        :param max_size: Maximum number of bytes to read.
+        :param deadline: Deadline after which the rest of the body is ignored.
+        :return: Body reader.
+        """
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in cls.CONTENT_TYPES:
+            response.close()
+            raise ValueError(f"Unsupported content type: {content_type}")
+        return BodyReader(response, max_size, deadline)
+
+    @classmethod
+    def from_response(
+        cls,
+        response: Response,
+        base_url: str,
+        max_size: int,
+        deadline: Optional[Deadline] = None,
+        max_tags: Optional[int] = None,
+        page_url: Optional[str] = None,
+    ) -> "Parser":
         """
-        Perform an XPath query.
+        Parse a streamed response incrementally while it is being downloaded.
 
-        :param xpath: XPath query.
-        :param multiple: Enable multiple results.
-        :return: Result if successful, None otherwise.
+        :param response: Response opened with stream=True.
+        :param base_url: Base URL.
+        :param max_size: Maximum number of bytes to read, the rest of the page is ignored.
+        :param deadline: Deadline after which the rest of the page is ignored.
+        :param max_tags: Maximum number of tags rendered per list, 0 to only count them, None for no limit.
+        :param page_url: URL of the page, relative links are resolved against it instead of the base URL if given.
+        :return: Parser of the (possibly truncated) content.
+        """
+        reader = cls.read_response(response, max_size, deadline)
+        html_parser = etree.HTMLParser(encoding=ENCODING)
+        for chunk in reader:
+            html_parser.feed(chunk)
+
+        try:
+            root = html_parser.close()
+        except etree.XMLSyntaxError:
+            root = None
+
+        parser = cls.__new__(cls)
+        parser._load(root, base_url, max_tags)
+        parser.page_url = page_url
+        parser.truncated = reader.truncated
+        parser.digest = reader.digest
+        return parser
+
+    @classmethod
+    def from_extraction(
+        cls, extraction: Extraction, base_url: str, digest: str, truncated: bool = False, max_tags: Optional[int] = None
+    ) -> "Parser":
         """
-        elements = self.content.xpath(xpath)
-        if not elements:
-            return None
+        Get a parser of a page extracted earlier, without any tree.
 
-        if not multiple:
-            return elements[0]
-        return elements
+        :param extraction: Extracted fields.
+        :param base_url: Base URL.
+        :param digest: SHA-256 hash of the content.
+        :param truncated: Whether the content was truncated.
+        :param max_tags: Maximum number of tags rendered per list.
+        :return: Parser whose fields come from the extraction.
+        """
+        parser = cls.__new__(cls)
+        parser.content = None
+        parser.base_url = base_url
+        parser.page_url = None
+        parser.max_tags = max_tags
+        parser.truncated = truncated
+        parser.digest = digest
+        parser.extraction = extraction
+        return parser
+
+    def _load(self, root: Optional[etree.ElementBase], base_url: str, max_tags: Optional[int] = None) -> None:
+        """
+        Load the parsed tree.
 
-    def _xpath_tags(self, xpath: str) -> Optional[list[str]]:
+        :param root: Root element.
+        :param base_url: Base URL.
+        :param max_tags: Maximum number of tags rendered per list.
         """
-        Perform an XPath query that returns HTML tags.
+        self.content = root
+        self.base_url = base_url
+        self.max_tags = max_tags
+        self.truncated = False
+
+        if self.content is None:
+            raise ValueError("Cannot parse content")
 
-        :param xpath: XPath query.
-        :return: List of HTML tags if successful, None otherwise.
+    @classmethod
+    def _render_tag(cls, element: etree.ElementBase) -> str:
         """
-        elements = self.content.xpath(xpath)
-        if not elements:
-            return None
+        Render the opening HTML tag of an element from its name and attributes.
+
+        Unlike etree.tostring, the subtree of the element is not serialized.
 
-        tags: list[str] = list()
-        for element in elements:
-            tag = etree.tostring(element, encoding=ENCODING, method=self.METHOD_HTML).decode(ENCODING)
-            if tag_match := re.search(r"<.*?>", tag):
-                tags.append(tag_match.group())
+        :param element: Element.
+        :return: HTML tag.
+        """
+        attributes: list[str] = list()
+        for name, value in element.items():
+            # Boolean attributes, e.g. <input disabled>, whatever their value
+            if name.lower() in cls.BOOLEAN_ATTRIBUTES:
+                attributes.append(f" {name}")
+            else:
+                attributes.append(f' {name}="{value.translate(cls.ATTRIBUTE_ESCAPES)}"')
+        return f"<{element.tag}{''.join(attributes)}>"
+
+    def _render_tags(self, elements: list[etree.ElementBase]) -> Optional[list[str]]:
+        """
+        Render the opening HTML tags of elements, up to max_tags of them.
 
+        :param elements: List of elements.
+        :return: List of HTML tags if any, None otherwise.
+        """
+        if self.max_tags is not None:
+            elements = elements[: self.max_tags]
+        tags = [self._render_tag(element) for element in elements]
         return tags if tags else None
 
     @staticmethod
@@ -101,6 +281,8 @@ class Parser:
         :param link: Link to normalize.
         :return: Normalized link.
         """
+        if self.page_url:
+            return urljoin(self.page_url, link)
 
         # Add base URL
         if not link.startswith(("http://", "https://", "//")):
@@ -112,80 +294,137 @@ class Parser:
 
         return link
 
+    def extract(self) -> Extraction:
+        """
+        Extract all the fields by walking the tree once.
+
+        :return: Extracted fields.
+        """
+        result = Extraction()
+        headings: dict[int, list[str]] = {level: list() for level in range(1, self.HEADING_LEVEL + 1)}
+        links: list[str] = list()
+        styled: list[etree.ElementBase] = list()
+        images: list[etree.ElementBase] = list()
+        images_miss_alt: list[etree.ElementBase] = list()
+
+        # Comments and processing instructions are skipped
+        for element in self.content.iter(etree.Element):
+            tag = element.tag
+            if element.get("style") is not None:
+                styled.append(element)
+
+            if tag == "a":
+                if (href := element.get("href")) is not None:
+                    links.append(href)
+            elif tag == "img":
+                images.append(element)
+                if element.get("alt") is None:
+                    images_miss_alt.append(element)
+            elif tag in self.HEADING_TAGS:
+                headings[self.HEADING_TAGS[tag]].extend(self.XPATH_TEXT(element))
+            elif tag == "title":
+                if result.title is None and element.text is not None:
+                    result.title = element.text
+            elif tag == "meta":
+                name, content = element.get("name"), element.get("content")
+                if content is None:
+                    continue
+                if name == "description" and result.description is None:
+                    result.description = content
+                elif name == "robots" and result.robots_meta is None:
+                    result.robots_meta = content
+            elif tag == "link":
+                href = element.get("href")
+                if result.favicon is None and href and "icon" in element.get("rel", ""):
+                    result.favicon = self._get_page_link(href)
+
+        result.headings = dict(self._clean_headings(level, texts) for level, texts in headings.items())
+        result.anchors = self._clean_anchors(links)
+        result.inline_css = self._render_tags(styled)
+        result.images = self._render_tags(images)
+        result.images_miss_alt = self._render_tags(images_miss_alt)
+        result.inline_css_count = len(styled)
+        result.images_count = len(images)
+        result.images_miss_alt_count = len(images_miss_alt)
+        return result
+
+    def _clean_anchors(self, links: list[str]) -> Optional[list[str]]:
+        """
+        Clean the list of anchor links.
+
+        :param links: List of raw links.
+        :return: Normalized and deduplicated page links in document order.
+        """
+        page_links: dict[str, None] = dict()
+        for link in links:
+            link = link.strip()
+            if not self._is_page_link(link):
+                continue
+            page_links[self._get_page_link(link)] = None
+
+        return list(page_links) if page_links else None
+
+    @cached_property
+    def extraction(self) -> Extraction:
+        """Get the cached result of the single-pass extraction."""
+        return self.extract()
+
     @property
     def title(self) -> Optional[str]:
         """Get title."""
-        return self._xpath("//title/text()")
+        return self.extraction.title
 
     @property
     def description(self) -> Optional[str]:
         """Get description."""
-        return self._xpath('//meta[@name="description"]/@content')
+        return self.extraction.description
 
     @property
     def favicon(self) -> Optional[str]:
         """Get favicon."""
-        link = self._xpath('//link[contains(@rel, "icon")]/@href')
-        return self._get_page_link(link) if link else None
+        return self.extraction.favicon
 
     @property
     def robots_meta(self) -> Optional[str]:
         """Get robots meta."""
-        return self._xpath('//meta[@name="robots"]/@content')
+        return self.extraction.robots_meta
 
     @property
     def headings(self) -> Optional[dict[int, Optional[list[str]]]]:
         """Get headings."""
-        xpath_template = "//h{}//text()"
-
-        results: list[tuple[int, Optional[list[str]]]] = []
-        with ThreadPoolExecutor(max_workers=self.HEADING_LEVEL) as executor:
-            futures = list()
-            for level in range(self.HEADING_LEVEL):
-                headings = self._xpath(xpath_template.format(level + 1), multiple=True)
-                futures.append(executor.submit(self._clean_headings, level, headings))
-
-            results.extend([future.result() for future in as_completed(futures)])
-            for future in as_completed(futures):
-                try:
-                    results.append(future.result())
-                except TimeoutError as e:
-                    print(f"TimeoutError: {e}")
-
-        if not results:
-            return None
-
-        return {result[0] + 1: result[1] for result in results}
+        return self.extraction.headings or None
 
     @property
     def anchors(self) -> Optional[list[str]]:
         """Get anchors."""
-        page_links: list[str] = list()
-
-        links = self._xpath("//a/@href", multiple=True)
-        if not links:
-            return None
-
-        for link in links:
-            link = link.strip()
-            if not self._is_page_link(link):
-                continue
-            page_links.append(self._get_page_link(link))
-
-        page_links = list(set(page_links))
-        return page_links if page_links else None
+        return self.extraction.anchors
 
     @property
     def inline_css(self) -> Optional[list[str]]:
         """Get inline CSS."""
-        return self._xpath_tags("//@style/..")
+        return self.extraction.inline_css
 
     @property
     def images(self) -> Optional[list[str]]:
         """Get images."""
-        return self._xpath_tags("//img")
+        return self.extraction.images
 
     @property
     def images_miss_alt(self) -> Optional[list[str]]:
         """Get images without alt attribute."""
-        return self._xpath_tags("//img[not(@alt)]")
+        return self.extraction.images_miss_alt
+
+    @property
+    def inline_css_count(self) -> int:
+        """Get the number of elements with inline CSS."""
+        return self.extraction.inline_css_count
+
+    @property
+    def images_count(self) -> int:
+        """Get the number of images."""
+        return self.extraction.images_count
+
+    @property
+    def images_miss_alt_count(self) -> int:
+        """Get the number of images without alt attribute."""
+        return self.extraction.images_miss_alt_count
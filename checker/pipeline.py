@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+
+def get_thread_name_prefix(name: str) -> str:
+    """
+    Get the name prefix of the worker threads started by the current thread.
+
+    Worker threads are named after the thread starting them, so the threads of a request can be told apart, e.g. by
+    the profiler.
+
+    :param name: Name of the workers.
+    :return: Thread name prefix, e.g. for a ThreadPoolExecutor.
+    """
+    return f"{threading.current_thread().name}/{name}"
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the time budget of a check has run out."""
+
+
+class Deadline:
+    """Time budget shared by every stage of a check."""
+
+    def __init__(self, seconds: float) -> None:
+        """
+        Initialize the deadline.
+
+        :param seconds: Time budget in seconds, starting now.
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Get the remaining time in seconds."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Check if the budget has run out."""
+        return self.remaining() <= 0
+
+    def cancel(self) -> None:
+        """Expire the budget now, the work bound by the deadline stops at its next check."""
+        self.expires_at = time.monotonic()
+
+    def timeout(self, default: float) -> float:
+        """
+        Get the timeout of an outbound call, bounded by the remaining time.
+
+        :param default: Default timeout in seconds.
+        :return: Timeout in seconds.
+        """
+        if (remaining := self.remaining()) <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+        return min(default, remaining)
+
+
+class Stage(NamedTuple):
+    func: Callable[..., Any]
+    args: tuple
+    kwargs: dict[str, Any]
+    requires: tuple[str, ...]
+
+
+class Pipeline:
+    """
+    Stage-dependency executor for the check pipeline.
+
+    Every stage starts as soon as all the stages it requires have finished, so independent stages run in parallel
+    and the pipeline takes about as long as its slowest branch.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, deadline: Optional[Deadline] = None) -> None:
+        """
+        Initialize the pipeline.
+
+        :param max_workers: Maximum number of stages running at the same time, defaults to the number of stages.
+        :param deadline: Deadline after which the unfinished stages are abandoned.
+        """
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.stages: dict[str, Stage] = dict()
+        self.incomplete: list[str] = list()
+        self.timings: dict[str, float] = dict()
+
+    def add(
+        self, name: str, func: Callable[..., Any], *args: Any, requires: tuple[str, ...] = (), **kwargs: Any
+    ) -> None:
+        """
+        Add a stage to the pipeline.
+
+        :param name: Stage name, also the key of its result.
+        :param func: Function to be called.
+        :param args: Positional arguments, followed by the results of the required stages in the given order.
+        :param requires: Names of the stages that must finish first.
+        :param kwargs: Keyword arguments.
+        """
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+
+        self.stages[name] = Stage(func, args, kwargs, tuple(requires))
+
+    def iter_results(self) -> Iterator[tuple[str, Any]]:
+        """
+        Run the stages and yield their results as they finish.
+
+        When the deadline expires, the stages not started yet are cancelled, the running ones are abandoned and all
+        of them are listed in `incomplete`, along with the stages that failed because of the deadline.
+
+        :return: Iterator of (stage name, result) in completion order.
+        """
+        pending = dict(self.stages)
+        results: dict[str, Any] = dict()
+        running: dict[Future, str] = dict()
+        self.incomplete = list()
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers or max(len(pending), 1), thread_name_prefix=get_thread_name_prefix("stage")
+        )
+
+        def submit_ready() -> None:
+            for name, stage in list(pending.items()):
+                if all(required in results for required in stage.requires):
+                    del pending[name]
+                    args = stage.args + tuple(results[required] for required in stage.requires)
+                    running[executor.submit(self._run_stage, name, stage.func, *args, **stage.kwargs)] = name
+
+        try:
+            submit_ready()
+            while running:
+                timeout = self.deadline.remaining() if self.deadline else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        # Failures caused by the deadline, e.g. timed out requests, only leave the stage incomplete
+                        if not isinstance(e, DeadlineExceeded) and not (self.deadline and self.deadline.expired):
+                            raise
+                        self.incomplete.append(name)
+                        continue
+                    yield name, results[name]
+                submit_ready()
+        finally:
+            executor.shutdown(wait=not running, cancel_futures=True)
+
+        if pending and not running and not self.incomplete:
+            raise ValueError(f"Unresolvable stage dependencies: {', '.join(pending)}")
+
+        self.incomplete.extend(running.values())
+        self.incomplete.extend(pending)
+
+    def _run_stage(self, name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a stage and record its duration in `timings`."""
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def run(self) -> dict[str, Any]:
+        """
+        Run the stages and wait for all of them, or until the deadline.
+
+        :return: Results of the finished stages keyed by stage name.
+        """
+        return dict(self.iter_results())
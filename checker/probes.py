@@ -0,0 +1,299 @@
+import asyncio
+import ssl
+from collections import OrderedDict
+from typing import Iterator, Optional
+from urllib.parse import urljoin, urlsplit
+
+import certifi
+from django.conf import settings
+from requests.utils import default_user_agent, requote_uri
+
+from checker import metrics
+from checker.admission import connection_slots, outbound_slots
+from checker.pipeline import Deadline, DeadlineExceeded
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_PORTS: dict[str, int] = {"http": 80, "https": 443}
+HEAD_NOT_ALLOWED: tuple[int, ...] = (405, 501)
+MAX_REDIRECTS = 30
+MAX_HEADERS = 100
+# File descriptors left to the rest of the process
+RESERVED_FDS = 128
+# Time given to a connection to close cleanly in seconds, e.g. for the TLS shutdown
+CLOSE_TIMEOUT = 1
+
+Connection = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+def get_max_connections(max_connections: int) -> int:
+    """
+    Bound a number of connections by the file descriptors the process may open.
+
+    :param max_connections: Number of connections wanted.
+    :return: Number of connections allowed.
+    """
+    if resource is None:
+        return max_connections
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return max_connections
+    return max(1, min(max_connections, soft - RESERVED_FDS))
+
+
+class LinkProber:
+    """
+    Link checker probing many links at once on a single event loop.
+
+    Links get a HEAD request, or a GET request without reading the body for the hosts that do not support HEAD, like
+    get_link_status. Connections are kept alive and reused by the next probes of the same host. At most
+    max_connections connections are open by all the probers of the process, within the file descriptor limit, at most
+    max_per_host probes run against the same host, and the requests count towards OUTBOUND_MAX_ACTIVE like the ones of
+    the shared client.
+    """
+
+    def __init__(
+        self, max_connections: int, max_per_host: int, timeout: float, deadline: Optional[Deadline] = None
+    ) -> None:
+        """
+        Initialize the prober.
+
+        :param max_connections: Maximum number of open connections in the process.
+        :param max_per_host: Maximum number of probes in flight to the same host.
+        :param timeout: Timeout of every request in seconds.
+        :param deadline: Deadline of the check, bounding the timeouts.
+        """
+        self.max_connections = get_max_connections(max_connections)
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.deadline = deadline
+        self.user_agent = default_user_agent()
+        # The CA bundle of requests, so both engines trust the same certificates
+        self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self._idle: OrderedDict[tuple[str, str, int], list[Connection]] = OrderedDict()
+        self._get_only_hosts: set[str] = set()
+
+    async def run(self, links: list[str]) -> dict[str, Optional[bool]]:
+        """
+        Probe links until they are all done or the deadline expires.
+
+        :param links: Links to probe.
+        :return: Status of every link probed in time, True if broken, False if OK, None if it cannot be reached.
+        """
+        results: dict[str, Optional[bool]] = dict()
+        slots = asyncio.Semaphore(self.max_connections)
+        host_slots: dict[str, asyncio.Semaphore] = dict()
+
+        async def probe(link: str) -> None:
+            host = urlsplit(link).netloc.lower()
+            # The host slot is taken first, so the links of a slow host do not hold the shared slots
+            async with host_slots.setdefault(host, asyncio.Semaphore(self.max_per_host)):
+                async with slots:
+                    results[link] = await self.probe(link)
+
+        tasks = [asyncio.ensure_future(probe(link)) for link in links]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=self.deadline.remaining() if self.deadline else None)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.close()
+        return results
+
+    async def probe(self, link: str) -> Optional[bool]:
+        """
+        Get the status of a link.
+
+        :param link: Link to check.
+        :return: True if the link is broken, False if it is OK, None if it cannot be reached.
+        """
+        host = urlsplit(link).netloc.lower()
+        try:
+            if host not in self._get_only_hosts:
+                status = await self.request("HEAD", link)
+                if status not in HEAD_NOT_ALLOWED:
+                    return status >= 400
+                self._get_only_hosts.add(host)
+
+            return await self.request("GET", link) >= 400
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError, DeadlineExceeded):
+            metrics.outbound_errors.inc()
+            return None
+
+    async def request(self, method: str, url: str) -> int:
+        """
+        Send a request and read its status, following the redirects of GET requests like requests does.
+
+        :param method: HEAD or GET.
+        :param url: URL.
+        :return: Status code.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers = await self.send(method, url)
+            if method == "HEAD" or not 300 <= status < 400 or "location" not in headers:
+                return status
+            url = urljoin(url, headers["location"])
+        raise ValueError(f"Too many redirects: {url}")
+
+    async def send(self, method: str, url: str) -> tuple[int, dict[str, str]]:
+        """
+        Send a request over a kept-alive connection to the host if any, a new connection otherwise.
+
+        :param method: HEAD or GET.
+        :param url: URL.
+        :return: Status code and headers, with lowercase names.
+        """
+        u = urlsplit(requote_uri(url))
+        if u.scheme not in DEFAULT_PORTS or not u.hostname:
+            raise ValueError(f"Unsupported URL: {url}")
+
+        hostname = u.hostname.encode("idna").decode("ascii")
+        key = (u.scheme, hostname, u.port or DEFAULT_PORTS[u.scheme])
+        host = hostname + (f":{u.port}" if u.port else "")
+        target = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        request = (
+            f"{method} {target} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"User-Agent: {self.user_agent}\r\n"
+            "Accept: */*\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+
+        timeout = self.deadline.timeout(self.timeout) if self.deadline else self.timeout
+        connection = self._pop_idle(key)
+        reused = connection is not None
+        if connection is None:
+            connection = await asyncio.wait_for(self._connect(key, timeout), timeout)
+
+        # The outbound slot is taken once a connection is held, so the probes waiting for a connection hold no slot
+        if not await outbound_slots.acquire_async(settings.OUTBOUND_MAX_ACTIVE, timeout):
+            self._keep_alive(key, connection)
+            raise asyncio.TimeoutError(f"Too many outbound requests, {method} {url} was not sent")
+
+        metrics.outbound_requests.inc()
+        try:
+            if reused:
+                try:
+                    return await self._exchange(key, connection, request, method, timeout)
+                except (OSError, EOFError, ValueError, asyncio.TimeoutError):
+                    # Closed by the server while idle, sent again over a new connection
+                    connection = await asyncio.wait_for(self._connect(key, timeout), timeout)
+            return await self._exchange(key, connection, request, method, timeout)
+        finally:
+            outbound_slots.release()
+
+    async def _connect(self, key: tuple[str, str, int], timeout: float) -> Connection:
+        scheme, hostname, port = key
+        # Idle connections to other hosts are closed to stay within the limit shared with the other probers
+        while not connection_slots.try_acquire(self.max_connections):
+            if self._idle:
+                _, connections = self._idle.popitem(last=False)
+                for _, writer in connections:
+                    await self._close(writer)
+            elif await connection_slots.acquire_async(self.max_connections, timeout):
+                break
+            else:
+                raise asyncio.TimeoutError(f"Too many open connections, {hostname} was not connected")
+
+        ssl_context = self._ssl_context if scheme == "https" else None
+        try:
+            return await asyncio.open_connection(
+                hostname, port, ssl=ssl_context, server_hostname=hostname if ssl_context else None
+            )
+        except BaseException:
+            connection_slots.release()
+            raise
+
+    async def _exchange(
+        self, key: tuple[str, str, int], connection: Connection, request: bytes, method: str, timeout: float
+    ) -> tuple[int, dict[str, str]]:
+        reader, writer = connection
+        try:
+            version, status, headers = await asyncio.wait_for(self._read_response(reader, writer, request), timeout)
+        except BaseException:
+            await self._close(writer)
+            raise
+
+        # A GET response has a body, which is never read
+        if method == "HEAD" and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close":
+            self._keep_alive(key, connection)
+        else:
+            await self._close(writer)
+        return status, headers
+
+    @staticmethod
+    async def _read_response(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: bytes
+    ) -> tuple[str, int, dict[str, str]]:
+        writer.write(request)
+        await writer.drain()
+
+        parts = (await reader.readline()).decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise ValueError("Invalid status line")
+
+        headers: dict[str, str] = dict()
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return parts[0], int(parts[1]), headers
+
+    def _keep_alive(self, key: tuple[str, str, int], connection: Connection) -> None:
+        self._idle.setdefault(key, list()).append(connection)
+        self._idle.move_to_end(key)
+
+    def _pop_idle(self, key: tuple[str, str, int]) -> Optional[Connection]:
+        connections = self._idle.get(key)
+        if not connections:
+            return None
+        connection = connections.pop()
+        if not connections:
+            del self._idle[key]
+        return connection
+
+    @staticmethod
+    async def _close(writer: asyncio.StreamWriter) -> None:
+        # The slot is released first, the wait may be cancelled
+        writer.close()
+        connection_slots.release()
+        try:
+            await asyncio.wait_for(writer.wait_closed(), CLOSE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            pass
+
+    async def close(self) -> None:
+        """Close the idle connections."""
+        writers = [writer for connections in self._idle.values() for _, writer in connections]
+        self._idle.clear()
+        await asyncio.gather(*(self._close(writer) for writer in writers))
+
+
+def get_prober(deadline: Optional[Deadline] = None) -> LinkProber:
+    return LinkProber(
+        settings.LINK_ASYNC_CONCURRENCY, settings.LINK_ASYNC_HOST_CONCURRENCY, settings.HTTP_TIMEOUT, deadline
+    )
+
+
+def probe_links(links: list[str], deadline: Optional[Deadline] = None) -> Iterator[tuple[str, Optional[bool]]]:
+    """
+    Probe links on an event loop of their own, from synchronous code.
+
+    Asynchronous code awaits get_prober(deadline).run(links) instead.
+
+    :param links: Links to probe.
+    :param deadline: Deadline after which the remaining links are dropped and DeadlineExceeded is raised.
+    :return: Iterator of (link, status).
+    """
+    results = asyncio.run(get_prober(deadline).run(links))
+    yield from results.items()
+    if len(results) < len(links):
+        raise DeadlineExceeded("Deadline exceeded")
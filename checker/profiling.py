@@ -0,0 +1,277 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from django.conf import settings
+
+# Python frames that block in C code, the samples ending in them are counted as waiting rather than running
+WAIT_FRAMES: frozenset[tuple[str, str]] = frozenset(
+    {
+        ("wait", "threading.py"),
+        ("_wait_for_tstate_lock", "threading.py"),
+        ("result", "_base.py"),
+        ("select", "selectors.py"),
+        ("readinto", "socket.py"),
+        ("create_connection", "connection.py"),
+        ("do_handshake", "ssl.py"),
+        ("get", "queue.py"),
+    }
+)
+TOP_FUNCTIONS = 30
+
+
+def get_label(frame) -> str:
+    """
+    Get the label of a frame in a folded stack.
+
+    :param frame: Frame.
+    :return: Function name and location.
+    """
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class Sampler:
+    """
+    Sampling profiler of a thread and of the threads it starts.
+
+    A background thread records the stacks of the sampled threads every PROFILER_INTERVAL seconds, so the threads of
+    the check pipeline and of the link scan are profiled along with the request thread. Threads are told apart by
+    name, the workers are named after the thread starting them, see get_thread_name_prefix. The threads of the other
+    requests are not sampled, but each profiled request runs a sampler of its own.
+    """
+
+    def __init__(self, interval: float, root: Optional[str] = None) -> None:
+        """
+        Initialize the sampler.
+
+        :param interval: Time between two samples in seconds.
+        :param root: Name of the sampled thread, every thread of the process is sampled if None.
+        """
+        self.interval = interval
+        self.root = root
+        self.stacks: Counter[str] = Counter()
+        self.threads: dict[str, dict[str, int]] = dict()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, str(thread_id))
+                if thread_id != own_id and self.is_sampled(name):
+                    self._sample(name, frame)
+            self.samples += 1
+
+    def is_sampled(self, thread_name: str) -> bool:
+        """
+        Check if a thread is sampled.
+
+        :param thread_name: Thread name.
+        :return: True if it is the root thread or one of its workers, or if every thread is sampled.
+        """
+        return self.root is None or thread_name == self.root or thread_name.startswith(self.root + "/")
+
+    def _sample(self, thread_name: str, frame) -> None:
+        code = frame.f_code
+        waiting = (code.co_name, os.path.basename(code.co_filename)) in WAIT_FRAMES
+
+        labels: list[str] = list()
+        while frame is not None:
+            labels.append(get_label(frame))
+            frame = frame.f_back
+        labels.append(thread_name)
+        self.stacks[";".join(reversed(labels))] += 1
+
+        thread = self.threads.setdefault(thread_name, {"samples": 0, "waiting": 0})
+        thread["samples"] += 1
+        thread["waiting"] += waiting
+
+    def get_top_functions(self) -> list[tuple[str, int, int]]:
+        """
+        Get the functions found in the most samples.
+
+        :return: Function label, samples where it runs (self) and samples where it is on the stack (total).
+        """
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            labels = stack.split(";")[1:]
+            own[labels[-1]] += count
+            for label in set(labels):
+                total[label] += count
+        return [(label, own[label], count) for label, count in total.most_common(TOP_FUNCTIONS)]
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of profiles, the oldest profiles are deleted first."""
+
+    SUFFIX = ".json"
+
+    def __init__(self, directory: str, max_profiles: int) -> None:
+        """
+        Initialize the store.
+
+        :param directory: Directory of the profiles, created on first save.
+        :param max_profiles: Maximum number of profiles kept.
+        """
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+
+    def save(self, profile: dict[str, Any]) -> str:
+        """
+        Save a profile, deleting the oldest ones beyond the limit.
+
+        :param profile: Profile.
+        :return: Profile ID.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Sorted by time, down to the nanosecond
+        profile_id = time.strftime("%Y%m%d-%H%M%S-") + f"{time.time_ns() % 10**9:09d}-" + uuid.uuid4().hex[:4]
+        path = self.directory / (profile_id + self.SUFFIX)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"id": profile_id, **profile}), encoding="utf-8")
+        tmp_path.replace(path)
+
+        for old_path in self._paths()[self.max_profiles :]:
+            old_path.unlink(missing_ok=True)
+        return profile_id
+
+    def _paths(self) -> list[Path]:
+        """Get the profile paths, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob("*" + self.SUFFIX), reverse=True)
+
+    def list_profiles(self) -> list[dict[str, Any]]:
+        """
+        List the profiles, newest first.
+
+        :return: Profiles without their stacks.
+        """
+        profiles: list[dict[str, Any]] = list()
+        for path in self._paths():
+            try:
+                profile = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            profile.pop("stacks", None)
+            profiles.append(profile)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[dict[str, Any]]:
+        """
+        Get a profile.
+
+        :param profile_id: Profile ID.
+        :return: Profile if found, None otherwise.
+        """
+        path = self.directory / (Path(profile_id).name + self.SUFFIX)
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(settings.PROFILER_DIR, settings.PROFILER_MAX_PROFILES)
+
+
+def to_folded(profile: dict[str, Any]) -> str:
+    """
+    Format the stacks of a profile in the folded format of flamegraph.pl and speedscope.
+
+    :param profile: Profile.
+    :return: One "frame;frame;frame count" line per stack.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests on demand or by sampling.
+
+    Staff members profile a request by adding ?profile=1, and its profile is always kept. Other requests are profiled
+    at the PROFILER_SAMPLE_RATE rate, and their profile is only kept when they take longer than PROFILER_THRESHOLD
+    seconds.
+    """
+
+    QUERY_PARAM = "profile"
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, "user", None)
+        requested = self.QUERY_PARAM in request.GET and bool(user and user.is_staff)
+        if not requested and random.random() >= settings.PROFILER_SAMPLE_RATE:
+            return self.get_response(request)
+
+        sampler = Sampler(settings.PROFILER_INTERVAL, threading.current_thread().name)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            sampler.stop()
+            raise
+
+        if response.streaming:
+            # The report is generated while it is streamed
+            response.streaming_content = self._wrap(
+                response.streaming_content, request, response, sampler, start, requested
+            )
+        else:
+            self._finish(request, response, sampler, start, requested)
+        return response
+
+    def _wrap(
+        self, content: Iterator[bytes], request, response, sampler: Sampler, start: float, requested: bool
+    ) -> Iterator[bytes]:
+        try:
+            yield from content
+        finally:
+            self._finish(request, response, sampler, start, requested)
+
+    @staticmethod
+    def _finish(request, response, sampler: Sampler, start: float, requested: bool) -> None:
+        sampler.stop()
+        duration = time.perf_counter() - start
+        if not requested and duration < settings.PROFILER_THRESHOLD:
+            return
+
+        profile_id = get_profile_store().save(
+            {
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "reason": "requested" if requested else "slow",
+                "time": time.time(),
+                "duration": duration,
+                "serverTiming": response.get("Server-Timing", ""),
+                "thread": sampler.root,
+                "interval": sampler.interval,
+                "samples": sampler.samples,
+                "threads": sampler.threads,
+                "topFunctions": sampler.get_top_functions(),
+                "stacks": dict(sampler.stacks),
+            }
+        )
+        print(f"Saved profile {profile_id} of {request.method} {request.path} ({duration:.2f}s)")
@@ -0,0 +1,179 @@
+import re
+from dataclasses import dataclass, field
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from requests import Session
+from requests.exceptions import RequestException
+
+from checker.caching import make_key, single_flight
+from checker.pipeline import Deadline, DeadlineExceeded
+
+# Larger robots.txt files are truncated, as search engines do
+MAX_SIZE: int = 500 * 1024
+WILDCARD: str = "*"
+
+
+class Rule(NamedTuple):
+    pattern: re.Pattern
+    allow: bool
+    length: int
+
+
+def compile_rule(path: str, allow: bool) -> Rule:
+    """
+    Compile an allow or disallow path, "*" matches any sequence of characters and a trailing "$" the end of the URL.
+
+    :param path: Path pattern.
+    :param allow: True for an allow rule, False for a disallow rule.
+    :return: Compiled rule.
+    """
+    anchored = path.endswith("$")
+    parts = re.split(r"(\*+)", path[:-1] if anchored else path)
+    regex = "".join(".*" if part.startswith(WILDCARD) else re.escape(part) for part in parts if part)
+    return Rule(re.compile(regex + ("$" if anchored else "")), allow, len(path))
+
+
+@dataclass(slots=True)
+class RobotsRules:
+    """Parsed robots.txt of a host."""
+
+    url: str
+    found: bool = False
+    groups: dict[str, list[Rule]] = field(default_factory=dict)
+    sitemaps: list[str] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, url: str, text: str) -> "RobotsRules":
+        """
+        Parse the content of a robots.txt file.
+
+        :param url: robots.txt link.
+        :param text: Content.
+        :return: Rules, grouped by lowercase user agent.
+        """
+        robots = cls(url, found=True)
+        agents: list[str] = list()
+        in_rules = False
+        for line in text.splitlines():
+            key, _, value = line.split("#", 1)[0].partition(":")
+            key, value = key.strip().lower(), value.strip()
+
+            if key == "user-agent":
+                # Consecutive user agents share the rules that follow
+                if in_rules:
+                    agents, in_rules = list(), False
+                agents.append(value.lower())
+                robots.groups.setdefault(value.lower(), list())
+            elif key in ("allow", "disallow"):
+                in_rules = True
+                # An empty disallow allows everything
+                if value:
+                    for agent in agents:
+                        robots.groups[agent].append(compile_rule(value, key == "allow"))
+            elif key == "sitemap" and value:
+                robots.sitemaps.append(value)
+
+        # The longest match wins, an allow rule wins a tie
+        for rules in robots.groups.values():
+            rules.sort(key=lambda rule: (-rule.length, not rule.allow))
+        return robots
+
+    def get_rules(self, user_agent: str) -> list[Rule]:
+        """
+        Get the rules applying to a user agent.
+
+        :param user_agent: User agent.
+        :return: Rules of the most specific group naming the user agent, or of the "*" group.
+        """
+        user_agent = user_agent.lower()
+        matches = [agent for agent in self.groups if agent != WILDCARD and agent in user_agent]
+        if matches:
+            return self.groups[max(matches, key=len)]
+        return self.groups.get(WILDCARD, [])
+
+    def is_allowed(self, url: str, user_agent: str = WILDCARD) -> bool:
+        """
+        Check if a user agent may fetch a URL.
+
+        :param url: URL to check.
+        :param user_agent: User agent.
+        :return: True if allowed, False otherwise.
+        """
+        u = urlsplit(url)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        for rule in self.get_rules(user_agent):
+            if rule.pattern.match(path):
+                return rule.allow
+        return True
+
+
+def fetch_robots(client: Session, robots_url: str, deadline: Optional[Deadline] = None) -> Optional[RobotsRules]:
+    """
+    Fetch and parse a robots.txt file.
+
+    :param client: Client sessions.
+    :param robots_url: robots.txt link.
+    :param deadline: Deadline of the check.
+    :return: Rules, allowing everything if there is no robots.txt, None if it cannot be reached.
+    """
+    try:
+        timeout = deadline.timeout(settings.HTTP_TIMEOUT) if deadline else None
+        with client.get(robots_url, stream=True, timeout=timeout) as r:
+            if r.status_code >= 500:
+                print(f"Failed to get robots.txt: {r.status_code}")
+                return None
+            if not r.ok:
+                print(f"Failed to get robots.txt: {r.status_code}")
+                return RobotsRules(robots_url)
+
+            content = b""
+            for chunk in r.iter_content(chunk_size=MAX_SIZE):
+                content += chunk
+                if len(content) >= MAX_SIZE:
+                    break
+            text = content[:MAX_SIZE].decode(r.encoding or "utf-8", errors="replace")
+    except RequestException as e:
+        if deadline and deadline.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+        print(f"Failed to get robots.txt: {e}")
+        return None
+
+    return RobotsRules.parse(robots_url, text)
+
+
+def get_robots(client: Session, base_url: str, deadline: Optional[Deadline] = None) -> RobotsRules:
+    """
+    Get the robots.txt rules of a host from the shared cache, fetching them once if needed.
+
+    :param client: Client sessions.
+    :param base_url: Base URL.
+    :param deadline: Deadline of the check.
+    :return: Rules, allowing everything if robots.txt is missing or cannot be reached.
+    """
+    robots_url = base_url.lower() + "/robots.txt"
+    if settings.ROBOTS_CACHE_TTL <= 0:
+        return fetch_robots(client, robots_url, deadline) or RobotsRules(robots_url)
+
+    # Unreachable hosts are not cached, they are tried again by the next check
+    robots = single_flight.get_or_set(
+        make_key("robots", robots_url),
+        lambda: fetch_robots(client, robots_url, deadline) or False,
+        settings.ROBOTS_CACHE_TTL,
+        cacheable=bool,
+    )
+    return robots or RobotsRules(robots_url)
+
+
+def is_allowed(client: Session, url: str, user_agent: str = WILDCARD) -> bool:
+    """
+    Check if a user agent may fetch a URL, according to the cached robots.txt of its host.
+
+    :param client: Client sessions.
+    :param url: URL to check.
+    :param user_agent: User agent.
+    :return: True if allowed, False otherwise.
+    """
+    u = urlsplit(url)
+    return get_robots(client, f"{u.scheme}://{u.netloc}").is_allowed(url, user_agent)
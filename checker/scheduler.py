@@ -0,0 +1,91 @@
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, Optional
+from urllib.parse import urlsplit
+
+from checker.pipeline import Deadline, DeadlineExceeded, get_thread_name_prefix
+
+
+class HostScheduler:
+    """
+    Host-aware scheduler for outbound requests.
+
+    Links are queued per host and dispatched round-robin across hosts, with a cap on the requests in flight to any
+    one host and a global cap on all of them. A slow origin only ever holds its own share of the workers.
+    """
+
+    def __init__(self, max_workers: int, max_per_host: int) -> None:
+        """
+        Initialize the scheduler.
+
+        :param max_workers: Maximum number of requests in flight.
+        :param max_per_host: Maximum number of requests in flight to the same host.
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+
+    @staticmethod
+    def get_host(link: str) -> str:
+        """
+        Get the host of a link.
+
+        :param link: Link.
+        :return: Host name, lowercase.
+        """
+        return urlsplit(link).netloc.lower()
+
+    def run(
+        self, func: Callable[[str], Any], links: list[str], deadline: Optional[Deadline] = None
+    ) -> Iterator[tuple[str, Any]]:
+        """
+        Call a function on every link.
+
+        :param func: Function to be called with a link.
+        :param links: Links to process.
+        :param deadline: Deadline after which the remaining links are dropped and DeadlineExceeded is raised.
+        :return: Iterator of (link, result) in completion order.
+        """
+        queues: OrderedDict[str, deque[str]] = OrderedDict()
+        for link in links:
+            queues.setdefault(self.get_host(link), deque()).append(link)
+
+        active: Counter[str] = Counter()
+        running: dict[Future, tuple[str, str]] = dict()
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=get_thread_name_prefix("link"))
+
+        def dispatch() -> None:
+            dispatched = not (deadline and deadline.expired)
+            while dispatched:
+                dispatched = False
+                for host in list(queues):
+                    if len(running) >= self.max_workers:
+                        return
+                    if active[host] >= self.max_per_host:
+                        continue
+
+                    queue = queues.pop(host)
+                    link = queue.popleft()
+                    active[host] += 1
+                    running[executor.submit(func, link)] = (host, link)
+                    dispatched = True
+
+                    # Rotate the host to the back so that the other hosts get the next slots
+                    if queue:
+                        queues[host] = queue
+
+        try:
+            dispatch()
+            while running:
+                timeout = deadline.remaining() if deadline else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("Deadline exceeded")
+
+                for future in done:
+                    host, link = running.pop(future)
+                    active[host] -= 1
+                    yield link, future.result()
+                dispatch()
+        finally:
+            executor.shutdown(wait=not running, cancel_futures=True)
@@ -0,0 +1,202 @@
+import random
+import zlib
+from collections import deque
+from datetime import date
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime
+from lxml import etree
+from requests import Response, Session
+from requests.exceptions import RequestException
+
+from checker.pipeline import Deadline, DeadlineExceeded
+from checker.utils import get_broken_links, get_sitemap_links, get_timeout
+
+CHUNK_SIZE: int = 64 * 1024
+GZIP_MAGIC: bytes = b"\x1f\x8b"
+ENTRY_TAGS: tuple[str, ...] = ("url", "sitemap")
+
+
+def _iter_chunks(response: Response) -> Iterator[bytes]:
+    """
+    Read a streamed response in chunks, decompressing gzipped sitemaps on the fly.
+
+    Sitemaps served as .xml.gz files are not decoded by requests, as they have no Content-Encoding. The output of the
+    decompressor is bounded, so a small compressed file cannot expand in memory.
+
+    :param response: Response opened with stream=True.
+    :return: Iterator of (decompressed) chunks.
+    """
+    decompressor = None
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if not chunk:
+            continue
+        if decompressor is None:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(GZIP_MAGIC) else False
+        if not decompressor:
+            yield chunk
+            continue
+
+        data = decompressor.decompress(chunk, CHUNK_SIZE)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE)
+
+
+def _read_entries(parser: etree.XMLPullParser) -> Iterator[tuple[str, str, Optional[str]]]:
+    """
+    Read the entries parsed so far, and free them.
+
+    :param parser: Pull parser.
+    :return: Iterator of (entry tag, loc, lastmod).
+    """
+    for _, element in parser.read_events():
+        qname = etree.QName(element)
+        if qname.localname not in ENTRY_TAGS:
+            continue
+
+        # Children of the same namespace only, e.g. <image:loc> is not the loc of the entry
+        prefix = f"{{{qname.namespace}}}" if qname.namespace else ""
+        loc = (element.findtext(prefix + "loc") or "").strip()
+        lastmod = (element.findtext(prefix + "lastmod") or "").strip()
+
+        # Only the entry being read is kept in the tree
+        element.clear(keep_tail=False)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+        if loc:
+            yield qname.localname, loc, lastmod or None
+
+
+def iter_sitemap(response: Response, deadline: Optional[Deadline] = None) -> Iterator[tuple[str, str, Optional[str]]]:
+    """
+    Parse a sitemap or a sitemap index incrementally while it is being downloaded, in constant memory.
+
+    :param response: Response opened with stream=True.
+    :param deadline: Deadline of the check.
+    :return: Iterator of (entry tag, loc, lastmod), the tag is "url" in a sitemap and "sitemap" in a sitemap index.
+    """
+    parser = etree.XMLPullParser(events=("end",), resolve_entities=False, no_network=True, remove_comments=True)
+    try:
+        for chunk in _iter_chunks(response):
+            parser.feed(chunk)
+            yield from _read_entries(parser)
+            if deadline and deadline.expired:
+                raise DeadlineExceeded("Deadline exceeded")
+        parser.close()
+        yield from _read_entries(parser)
+    finally:
+        response.close()
+
+
+def _parse_lastmod(lastmod: Optional[str]) -> Optional[date]:
+    """
+    Parse a W3C datetime.
+
+    :param lastmod: Date, with or without time.
+    :return: Date if valid, None otherwise.
+    """
+    if not lastmod:
+        return None
+    try:
+        if parsed := parse_datetime(lastmod):
+            return parsed.date()
+        return parse_date(lastmod)
+    except ValueError:
+        return None
+
+
+def read_sitemaps(
+    client: Session, sitemap_urls: list[str], stats: dict, deadline: Optional[Deadline] = None
+) -> list[str]:
+    """
+    Read sitemaps and the sitemaps listed in sitemap indexes.
+
+    Fills the statistics with the number of sitemaps read and failed, the number of URLs, the number of URLs with a
+    valid lastmod and the oldest and newest lastmod. Reading stops after SITEMAP_MAX_FILES sitemaps.
+
+    :param client: Client sessions.
+    :param sitemap_urls: Sitemap links.
+    :param stats: Dictionary receiving the statistics.
+    :param deadline: Deadline of the check.
+    :return: Sample of SITEMAP_SAMPLE_SIZE URLs, drawn uniformly from all the URLs listed.
+    """
+    stats.update({"sitemaps": 0, "errors": 0, "urls": 0, "lastmod": 0, "oldest": None, "newest": None})
+    oldest: Optional[date] = None
+    newest: Optional[date] = None
+    sample: list[str] = list()
+
+    queue = deque(sitemap_urls)
+    seen: set[str] = set()
+    try:
+        while queue and len(seen) < settings.SITEMAP_MAX_FILES:
+            sitemap_url = queue.popleft()
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+
+            try:
+                # Closed on errors too, iter_sitemap only closes the responses it reads
+                with client.get(sitemap_url, stream=True, timeout=get_timeout(deadline)) as r:
+                    r.raise_for_status()
+                    for tag, loc, lastmod in iter_sitemap(r, deadline):
+                        if tag == "sitemap":
+                            if len(seen) + len(queue) < settings.SITEMAP_MAX_FILES:
+                                queue.append(loc)
+                            continue
+
+                        stats["urls"] += 1
+                        # Reservoir sampling, the sample stays uniform without keeping the URLs
+                        if len(sample) < settings.SITEMAP_SAMPLE_SIZE:
+                            sample.append(loc)
+                        elif (index := random.randrange(stats["urls"])) < settings.SITEMAP_SAMPLE_SIZE:
+                            sample[index] = loc
+
+                        if modified := _parse_lastmod(lastmod):
+                            stats["lastmod"] += 1
+                            oldest = min(oldest, modified) if oldest else modified
+                            newest = max(newest, modified) if newest else modified
+                    stats["sitemaps"] += 1
+            except (RequestException, etree.XMLSyntaxError) as e:
+                if deadline and deadline.expired:
+                    raise DeadlineExceeded("Deadline exceeded")
+                print(f"Failed to read sitemap {sitemap_url}: {e}")
+                stats["errors"] += 1
+    finally:
+        stats["oldest"] = oldest.isoformat() if oldest else None
+        stats["newest"] = newest.isoformat() if newest else None
+
+    return sample
+
+
+def get_sitemaps(
+    client: Session, base_url: str, stats: dict, robots_url: Optional[str], deadline: Optional[Deadline] = None
+) -> Optional[list[str]]:
+    """
+    Get the sitemap links, read the sitemaps and check a sample of the URLs they list.
+
+    The statistics of read_sitemaps are completed with the "sample" size and the "broken" URLs of the sample. When
+    the deadline expires, "incomplete" is set and the statistics only cover what was read.
+
+    :param client: Client sessions.
+    :param base_url: Base URL.
+    :param stats: Dictionary receiving the statistics.
+    :param robots_url: robots.txt link.
+    :param deadline: Deadline of the check.
+    :return: Sitemap links if successful, None otherwise.
+    """
+    sitemap_urls = get_sitemap_links(client, base_url, robots_url, deadline)
+    if not sitemap_urls:
+        return None
+
+    try:
+        sample = read_sitemaps(client, sitemap_urls, stats, deadline)
+        stats["sample"] = len(sample)
+        stats["broken"] = get_broken_links(client, sample, deadline=deadline)
+    except DeadlineExceeded:
+        print("Deadline exceeded, sitemaps left unread")
+        stats["incomplete"] = True
+
+    return sitemap_urls
@@ -1,10 +1,86 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
 from unittest.mock import MagicMock, patch
-
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.template.loader import render_to_string
 from django.test import TestCase, override_settings
-
+from django.urls import reverse
+from django.utils import timezone
+from requests import Response
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+from checker import metrics
+from checker.admission import Limiter, ReleasingIterator, check_slots, connection_slots, outbound_slots
+from checker.benchmarks import FakeWebServer, compare, generate_page, load_results
+from checker.caching import SingleFlight, link_cache, make_key, normalize_url
+from checker.checks import finish_check, get_report, get_report_key, run_check, set_section
+from checker.client import Client, get_client, get_pool_size
+from checker.crawler import BloomFilter, Crawler
+from checker.history import get_section_items, get_stored_statuses, record_check
+from checker.jobs import claim_job, enqueue_check, run_job, work
+from checker.models import CheckJob, CheckRun
+from checker.pagerank import fetch_page_ranks, get_page_rank, get_page_ranks
+from checker.pages import get_page_key, open_page, parse_page, store_page
 from checker.parser import Parser
+from checker.pipeline import Deadline, DeadlineExceeded, Pipeline, get_thread_name_prefix
+from checker.probes import LinkProber, probe_links
+from checker.profiling import ProfileStore, Sampler, get_profile_store
+from checker.robots import RobotsRules, compile_rule, get_robots, is_allowed
+from checker.scheduler import HostScheduler
+from checker.sitemaps import get_sitemaps, iter_sitemap, read_sitemaps
 from checker.utils import *
 
+# Both caches share the same LocMem store, cleared by cache.clear()
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "links": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.send_header("Set-Cookie", "session=1")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class StubServerTestCase(TestCase):
+    handler = StubHandler
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), cls.handler)
+        cls.server_url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
 
 class ParserTestCase(TestCase):
     def setUp(self) -> None:
@@ -106,6 +182,34 @@ class ParserTestCase(TestCase):
         parser = Parser(b"Inline CSS", self.base_url)
         self.assertIsNone(parser.inline_css)
 
+    def test_inline_css_attributes(self) -> None:
+        parser = Parser(
+            b"<body style='margin:0'><input style='a&quot;b' disabled value=''><p>Text</p></body>", self.base_url
+        )
+        self.assertListEqual(
+            parser.inline_css, ['<body style="margin:0">', '<input style="a&quot;b" disabled value="">']
+        )
+
+    def test_boolean_attributes(self) -> None:
+        parser = Parser(
+            b"<img src='a.png' alt='alt'><img src='b.png' alt><input style='' disabled=''><input style='' checked='checked'>",
+            self.base_url,
+        )
+        # Only the HTML boolean attributes lose their value, an attribute may be valued with its own name
+        self.assertListEqual(parser.images, ['<img src="a.png" alt="alt">', '<img src="b.png" alt="">'])
+        self.assertListEqual(parser.inline_css, ['<input style="" disabled>', '<input style="" checked>'])
+
+    def test_max_tags(self) -> None:
+        parser = Parser(b"<img src='1.png'><img src='2.png'><img src='3.png' alt=''>", self.base_url, max_tags=1)
+        self.assertListEqual(parser.images, ['<img src="1.png">'])
+        self.assertEqual(parser.images_count, 3)
+        self.assertEqual(parser.images_miss_alt_count, 2)
+
+    def test_max_tags_count_only(self) -> None:
+        parser = Parser(b"<div style='color:red'></div>", self.base_url, max_tags=0)
+        self.assertIsNone(parser.inline_css)
+        self.assertEqual(parser.inline_css_count, 1)
+
     def test_images(self) -> None:
         parser = Parser(b"<img src='image.png'>", self.base_url)
         self.assertListEqual(parser.images, ['<img src="image.png">'])
@@ -122,51 +226,143 @@ class ParserTestCase(TestCase):
         parser = Parser(b"Images", self.base_url)
         self.assertIsNone(parser.images_miss_alt)
 
+    def test_from_response(self) -> None:
+        mock_response = MagicMock()
+        mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+        mock_response.iter_content.return_value = iter([b"<title>Ti", b"tle</title>"])
 
+        parser = Parser.from_response(mock_response, self.base_url, 1024)
+        self.assertEqual(parser.title, "Title")
+        self.assertFalse(parser.truncated)
+        mock_response.close.assert_called_once()
+
+    def test_from_response_truncated(self) -> None:
+        mock_response = MagicMock()
+        mock_response.headers = {}
+        mock_response.iter_content.return_value = iter([b"<title>Title</title>", b"<a href='page'></a>"])
+
+        parser = Parser.from_response(mock_response, self.base_url, 25)
+        self.assertEqual(parser.title, "Title")
+        self.assertIsNone(parser.anchors)
+        self.assertTrue(parser.truncated)
+
+    def test_from_response_content_type(self) -> None:
+        mock_response = MagicMock()
+        mock_response.headers = {"Content-Type": "application/pdf"}
+
+        self.assertRaises(ValueError, Parser.from_response, mock_response, self.base_url, 1024)
+        mock_response.iter_content.assert_not_called()
+
+    def test_from_response_empty(self) -> None:
+        mock_response = MagicMock()
+        mock_response.headers = {"Content-Type": "text/html"}
+        mock_response.iter_content.return_value = iter([])
+
+        self.assertRaises(ValueError, Parser.from_response, mock_response, self.base_url, 1024)
+
+    def test_headings_nested_text(self) -> None:
+        parser = Parser(b"<h1>Heading <b>1</b><!-- comment --></h1><h2> </h2>", self.base_url)
+        self.assertListEqual(parser.headings[1], ["Heading", "1"])
+        self.assertIsNone(parser.headings[2])
+
+    def test_anchors_document_order(self) -> None:
+        parser = Parser(b"<a href='page2'></a><a href='page1'></a><a href='page2'></a>", self.base_url)
+        self.assertListEqual(parser.anchors, [f"{self.base_url}/page2", f"{self.base_url}/page1"])
+
+    def test_extract(self) -> None:
+        parser = Parser(
+            b"<title>Title</title><meta name='description' content='Description'>"
+            b"<div style='color:red'><img src='image.png'><img src='image.png' alt='Image'></div>",
+            self.base_url,
+        )
+        extraction = parser.extract()
+        self.assertEqual(extraction.title, "Title")
+        self.assertEqual(extraction.description, "Description")
+        self.assertListEqual(extraction.inline_css, ['<div style="color:red">'])
+        self.assertEqual(len(extraction.images), 2)
+        self.assertListEqual(extraction.images_miss_alt, ['<img src="image.png">'])
+
+    def test_extraction_cached(self) -> None:
+        parser = Parser(b"<title>Title</title><a href='page'></a>", self.base_url)
+        with patch.object(Parser, "extract", wraps=parser.extract) as mock_extract:
+            self.assertEqual(parser.title, "Title")
+            self.assertListEqual(parser.anchors, [f"{self.base_url}/page"])
+            self.assertListEqual(parser.anchors, [f"{self.base_url}/page"])
+        mock_extract.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class UtilsTestCase(TestCase):
     def setUp(self) -> None:
         self.base_url = "https://test.com"
+        cache.clear()
+        link_cache.clear()
 
-    @patch("checker.utils.requests")
-    def test_verify_captcha(self, mock_requests) -> None:
+    @patch("checker.utils.get_client")
+    def test_verify_captcha(self, mock_get_client) -> None:
         mock_response = MagicMock()
         mock_response.json.return_value = {"success": True}
 
-        mock_requests.post.return_value = mock_response
+        mock_get_client.return_value.post.return_value = mock_response
         self.assertTrue(verify_captcha("response", "127.0.0.1"))
 
-    @patch("checker.utils.requests")
-    def test_verify_captcha_with_http_error(self, mock_requests) -> None:
-        mock_requests.post.side_effect = HTTPError()
+    @patch("checker.utils.get_client")
+    def test_verify_captcha_with_http_error(self, mock_get_client) -> None:
+        mock_get_client.return_value.post.side_effect = HTTPError()
         self.assertFalse(verify_captcha("response", "127.0.0.1"))
 
-    @patch("checker.utils.requests")
-    def test_verify_captcha_with_json_error(self, mock_requests) -> None:
+    @patch("checker.utils.get_client")
+    def test_verify_captcha_with_request_error(self, mock_get_client) -> None:
+        for error in (ReadTimeout(), ConnectTimeout()):
+            mock_get_client.return_value.post.side_effect = error
+            self.assertFalse(verify_captcha("response", "127.0.0.1"))
+
+    @patch("checker.utils.get_client")
+    def test_verify_captcha_with_json_error(self, mock_get_client) -> None:
         mock_response = MagicMock()
         mock_response.json.side_effect = JSONDecodeError("", "", 0)
 
-        mock_requests.post.return_value = mock_response
+        mock_get_client.return_value.post.return_value = mock_response
         self.assertFalse(verify_captcha("response", "127.0.0.1"))
 
     @override_settings(DEBUG=True)
     def test_verify_captcha_with_debug(self) -> None:
         self.assertTrue(verify_captcha("response", "127.0.0.1"))
 
-    @patch("checker.utils.requests")
-    def test_get_robots_link(self, mock_requests) -> None:
-        self.assertEqual(get_robots_link(mock_requests, self.base_url), f"{self.base_url}/robots.txt")
+    def make_robots_session(self, status_code: int = 200, text: str = "") -> MagicMock:
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.status_code = status_code
+        mock_response.ok = status_code < 400
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [text.encode()]
+
+        mock_session = MagicMock()
+        mock_session.get.return_value = mock_response
+        return mock_session
+
+    def test_get_robots_link(self) -> None:
+        mock_session = self.make_robots_session()
+        self.assertEqual(get_robots_link(mock_session, self.base_url), f"{self.base_url}/robots.txt")
 
     def test_get_robots_link_with_http_error(self) -> None:
-        mock_response = MagicMock()
-        mock_response.raise_for_status.side_effect = HTTPError()
+        mock_session = self.make_robots_session(status_code=404)
+        self.assertEqual(get_robots_link(mock_session, self.base_url), None)
 
+    def test_get_robots_link_with_request_error(self) -> None:
         mock_session = MagicMock()
-        mock_session.head.return_value = mock_response
+        mock_session.get.side_effect = RequestException()
         self.assertEqual(get_robots_link(mock_session, self.base_url), None)
 
-    @patch("checker.utils.requests")
-    def test_get_sitemap_link(self, mock_requests) -> None:
-        self.assertListEqual(get_sitemap_links(mock_requests, self.base_url, None), [f"{self.base_url}/sitemap.xml"])
+    def test_get_robots_link_cached(self) -> None:
+        mock_session = self.make_robots_session()
+        get_robots_link(mock_session, self.base_url)
+        get_sitemap_links(mock_session, self.base_url, f"{self.base_url}/robots.txt")
+        mock_session.get.assert_called_once()
+
+    @patch("checker.utils.get_client")
+    def test_get_sitemap_link(self, mock_client) -> None:
+        self.assertListEqual(get_sitemap_links(mock_client, self.base_url, None), [f"{self.base_url}/sitemap.xml"])
 
     def test_get_sitemap_link_with_http_error(self) -> None:
         mock_response = MagicMock()
@@ -176,48 +372,38 @@ class UtilsTestCase(TestCase):
         mock_session.head.return_value = mock_response
         self.assertIsNone(get_sitemap_links(mock_session, self.base_url, None))
 
-    def test_get_sitemap_link_from_robots_url(self) -> None:
-        mock_head_response = MagicMock()
-        mock_head_response.raise_for_status.side_effect = HTTPError()
-
+    def test_get_sitemap_link_with_request_error(self) -> None:
         mock_session = MagicMock()
-        mock_session.head.return_value = mock_head_response
+        mock_session.head.side_effect = RequestException()
+        self.assertIsNone(get_sitemap_links(mock_session, self.base_url, None))
 
-        mock_get_response = MagicMock()
-        mock_get_response.text = f"Sitemap: {self.base_url}/sitemap1.xml\nSitemap: {self.base_url}/sitemap2.xml"
-        mock_session.get.return_value = mock_get_response
+        deadline = Deadline(0)
+        with self.assertRaises(DeadlineExceeded):
+            get_sitemap_links(mock_session, self.base_url, None, deadline)
+
+    def test_get_sitemap_link_from_robots_url(self) -> None:
+        mock_session = self.make_robots_session(
+            text=f"Sitemap: {self.base_url}/sitemap1.xml\nsitemap: {self.base_url}/sitemap2.xml.gz"
+        )
         self.assertListEqual(
             get_sitemap_links(mock_session, self.base_url, f"{self.base_url}/robots.txt"),
-            [f"{self.base_url}/sitemap1.xml", f"{self.base_url}/sitemap2.xml"],
+            [f"{self.base_url}/sitemap1.xml", f"{self.base_url}/sitemap2.xml.gz"],
         )
+        mock_session.head.assert_not_called()
 
     def test_get_sitemap_link_from_robots_url_with_empty_sitemap(self) -> None:
-        mock_head_response = MagicMock()
-        mock_head_response.raise_for_status.side_effect = HTTPError()
-
-        mock_session = MagicMock()
-        mock_session.head.return_value = mock_head_response
-
-        mock_get_response = MagicMock()
-        mock_get_response.text = ""
-        mock_session.get.return_value = mock_get_response
+        mock_session = self.make_robots_session()
+        mock_session.head.return_value.raise_for_status.side_effect = HTTPError()
         self.assertIsNone(get_sitemap_links(mock_session, self.base_url, f"{self.base_url}/robots.txt"))
 
     def test_get_sitemap_link_from_robots_url_with_http_error(self) -> None:
-        mock_head_response = MagicMock()
-        mock_head_response.raise_for_status.side_effect = HTTPError()
-
-        mock_session = MagicMock()
-        mock_session.head.return_value = mock_head_response
-
-        mock_get_response = MagicMock()
-        mock_get_response.raise_for_status.side_effect = HTTPError()
-        mock_session.get.return_value = mock_get_response
+        mock_session = self.make_robots_session(status_code=500)
+        mock_session.head.return_value.raise_for_status.side_effect = HTTPError()
         self.assertIsNone(get_sitemap_links(mock_session, self.base_url, f"{self.base_url}/robots.txt"))
 
-    @patch("checker.utils.requests")
-    def test_check_broken_link(self, mock_requests) -> None:
-        self.assertEqual(check_broken_link(mock_requests, self.base_url), None)
+    @patch("checker.utils.get_client")
+    def test_check_broken_link(self, mock_client) -> None:
+        self.assertEqual(check_broken_link(mock_client, self.base_url), None)
 
     def test_check_broken_link_with_http_error(self) -> None:
         mock_response = MagicMock()
@@ -235,57 +421,1712 @@ class UtilsTestCase(TestCase):
         mock_session.head.return_value = mock_response
         self.assertEqual(check_broken_link(mock_session, self.base_url), None)
 
-    @patch("checker.utils.check_broken_link")
-    def test_get_broken_links(self, mock_check_broken_link) -> None:
-        mock_check_broken_link.return_value = self.base_url
+    def test_get_link_status(self) -> None:
+        mock_session = MagicMock()
+        self.assertFalse(get_link_status(mock_session, self.base_url))
+
+    def test_get_link_status_with_http_error(self) -> None:
+        mock_response = MagicMock()
+        mock_response.raise_for_status.side_effect = HTTPError()
+
+        mock_session = MagicMock()
+        mock_session.head.return_value = mock_response
+        self.assertTrue(get_link_status(mock_session, self.base_url))
 
+    def test_get_link_status_with_request_error(self) -> None:
         mock_session = MagicMock()
-        self.assertListEqual(get_broken_links(mock_session, [self.base_url]), [self.base_url])
+        mock_session.head.side_effect = RequestException()
+        self.assertIsNone(get_link_status(mock_session, self.base_url))
 
-    @patch("checker.utils.check_broken_link")
-    def test_get_broken_links_with_none(self, mock_check_broken_link) -> None:
-        mock_check_broken_link.return_value = None
+    def test_get_link_status_head_not_allowed(self) -> None:
+        mock_head_response = MagicMock()
+        mock_head_response.status_code = 405
+
+        mock_get_response = MagicMock()
+        mock_get_response.__enter__.return_value = mock_get_response
+        mock_get_response.raise_for_status.side_effect = HTTPError()
 
         mock_session = MagicMock()
-        self.assertIsNone(get_broken_links(mock_session, [self.base_url]))
+        mock_session.head.return_value = mock_head_response
+        mock_session.get.return_value = mock_get_response
+        self.assertTrue(get_link_status(mock_session, "https://no-head.test.com/page1"))
+        mock_session.get.assert_called_once_with("https://no-head.test.com/page1", stream=True, timeout=None)
 
-    @patch("checker.utils.requests")
-    def test_get_broken_links_with_empty_links(self, mock_requests) -> None:
-        self.assertIsNone(get_broken_links(mock_requests, []))
+        # The host is remembered
+        self.assertTrue(get_link_status(mock_session, "https://no-head.test.com/page2"))
+        mock_session.head.assert_called_once()
 
-    def test_get_page_rank(self) -> None:
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"response": [{"status_code": 200, "rank": 1}]}
+    @patch("checker.utils.get_link_status")
+    def test_get_broken_links(self, mock_get_link_status) -> None:
+        mock_get_link_status.return_value = True
 
         mock_session = MagicMock()
-        mock_session.get.return_value = mock_response
-        self.assertEqual(get_page_rank(mock_session, self.base_url), 1)
+        self.assertListEqual(get_broken_links(mock_session, [self.base_url]), [self.base_url])
 
-    def test_get_page_rank_with_http_error(self) -> None:
-        mock_response = MagicMock()
-        mock_response.raise_for_status.side_effect = HTTPError()
+    @patch("checker.utils.get_link_status")
+    def test_get_broken_links_with_none(self, mock_get_link_status) -> None:
+        mock_get_link_status.return_value = False
 
         mock_session = MagicMock()
-        mock_session.get.return_value = mock_response
-        self.assertEqual(get_page_rank(mock_session, self.base_url), 0)
+        self.assertIsNone(get_broken_links(mock_session, [self.base_url]))
 
-    def test_get_page_rank_with_json_error(self) -> None:
-        mock_response = MagicMock()
-        mock_response.json.side_effect = JSONDecodeError("", "", 0)
+    @patch("checker.utils.get_link_status")
+    def test_get_broken_links_cached(self, mock_get_link_status) -> None:
+        mock_get_link_status.side_effect = lambda client, link, deadline: link.endswith("broken")
+        links = [f"{self.base_url}/ok", f"{self.base_url}/broken"]
+
+        stats: dict[str, int] = dict()
+        self.assertListEqual(get_broken_links(MagicMock(), links), [f"{self.base_url}/broken"])
+        self.assertListEqual(get_broken_links(MagicMock(), links, stats), [f"{self.base_url}/broken"])
+        self.assertEqual(mock_get_link_status.call_count, 2)
+        self.assertDictEqual(stats, {"hits": 2, "misses": 0})
+
+        # Shared by the other worker processes
+        link_cache.clear()
+        get_broken_links(MagicMock(), links + [f"{self.base_url}/new"], stats)
+        self.assertEqual(mock_get_link_status.call_count, 3)
+        self.assertDictEqual(stats, {"hits": 4, "misses": 1})
+
+    def test_get_broken_links_with_deadline(self) -> None:
+        release = threading.Event()
+
+        def head(link: str, timeout: float) -> MagicMock:
+            if link.endswith("slow") and not release.wait(timeout + 0.05):
+                raise RequestException()
+            response = MagicMock()
+            if link.endswith("broken"):
+                response.raise_for_status.side_effect = HTTPError()
+            return response
 
         mock_session = MagicMock()
-        mock_session.get.return_value = mock_response
-        self.assertEqual(get_page_rank(mock_session, self.base_url), 0)
+        mock_session.head.side_effect = head
+        links = [f"{self.base_url}/broken"] + [f"https://slow{idx}.com/slow" for idx in range(10)]
+
+        stats: dict[str, int] = dict()
+        self.assertListEqual(get_broken_links(mock_session, links, stats, Deadline(0.3)), [f"{self.base_url}/broken"])
+        self.assertEqual(stats["unchecked"], 10)
+        release.set()
+
+    @patch("checker.utils.get_link_status")
+    def test_get_broken_links_not_cached_when_unreachable(self, mock_get_link_status) -> None:
+        mock_get_link_status.return_value = None
+
+        self.assertIsNone(get_broken_links(MagicMock(), [self.base_url]))
+        self.assertIsNone(get_broken_links(MagicMock(), [self.base_url]))
+        self.assertEqual(mock_get_link_status.call_count, 2)
+
+    @override_settings(LINK_CACHE_SIZE=1)
+    def test_link_cache_eviction(self) -> None:
+        link_cache.set_many({"a": False, "b": True})
+        cache.clear()
+        self.assertDictEqual(link_cache.get_many(["a", "b"]), {"b": True})
+
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "default"},
+            "links": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "links"},
+        }
+    )
+    def test_link_cache_backend(self) -> None:
+        link_cache.set_many({"a": False})
+        self.assertIsNone(cache.get(make_key("link", "a")))
+        self.assertIsNotNone(caches["links"].get(make_key("link", "a")))
+        caches["links"].clear()
+
+    @override_settings(LINK_CACHE_BROKEN_TTL=0)
+    def test_link_cache_ttl(self) -> None:
+        link_cache.set_many({"a": False, "b": True})
+        self.assertDictEqual(link_cache.get_many(["a", "b"]), {"a": False})
+
+    @patch("checker.utils.get_client")
+    def test_get_broken_links_with_empty_links(self, mock_client) -> None:
+        self.assertIsNone(get_broken_links(mock_client, []))
+
+
+class PipelineTestCase(TestCase):
+    def test_run(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", lambda x: x + 1, 1)
+        pipeline.add("b", lambda x: x * 2, 2)
+        self.assertDictEqual(pipeline.run(), {"a": 2, "b": 4})
+
+    def test_run_with_requires(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("b", lambda x, a: x + a, 10, requires=("a",))
+        pipeline.add("a", lambda: 1)
+        self.assertDictEqual(pipeline.run(), {"a": 1, "b": 11})
+
+    def test_run_in_parallel(self) -> None:
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline()
+        pipeline.add("a", barrier.wait)
+        pipeline.add("b", barrier.wait)
+        self.assertSetEqual(set(pipeline.run()), {"a", "b"})
+
+    def test_run_with_duplicate_stage(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", lambda: 1)
+        self.assertRaises(ValueError, pipeline.add, "a", lambda: 2)
+
+    def test_run_with_missing_stage(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", lambda b: b, requires=("b",))
+        self.assertRaises(ValueError, pipeline.run)
+
+    def test_run_with_error(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", lambda: 1 / 0)
+        pipeline.add("b", lambda a: a, requires=("a",))
+        self.assertRaises(ZeroDivisionError, pipeline.run)
+
+    def test_run_with_kwargs(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", lambda x, y=0: x + y, 1, y=2)
+        self.assertDictEqual(pipeline.run(), {"a": 3})
+
+    def test_run_with_deadline(self) -> None:
+        release = threading.Event()
+        pipeline = Pipeline(deadline=Deadline(0.2))
+        pipeline.add("fast", lambda: 1)
+        pipeline.add("slow", release.wait, 5)
+        pipeline.add("after_slow", lambda slow: slow, requires=("slow",))
+
+        started = time.monotonic()
+        self.assertDictEqual(pipeline.run(), {"fast": 1})
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertListEqual(pipeline.incomplete, ["slow", "after_slow"])
+        release.set()
+
+    def test_run_with_deadline_exceeded(self) -> None:
+        def func() -> None:
+            raise DeadlineExceeded()
+
+        pipeline = Pipeline(deadline=Deadline(5))
+        pipeline.add("a", func)
+        pipeline.add("b", lambda: 1)
+        self.assertDictEqual(pipeline.run(), {"b": 1})
+        self.assertListEqual(pipeline.incomplete, ["a"])
+
+    def test_deadline(self) -> None:
+        self.assertEqual(Deadline(5).timeout(1), 1)
+        self.assertLessEqual(Deadline(0.5).timeout(1), 0.5)
+        self.assertTrue(Deadline(0).expired)
+        self.assertRaises(DeadlineExceeded, Deadline(0).timeout, 1)
+
+    def test_timings(self) -> None:
+        pipeline = Pipeline()
+        pipeline.add("a", time.sleep, 0.05)
+        pipeline.run()
+        self.assertGreaterEqual(pipeline.timings["a"], 0.05)
+
+    def test_deadline_cancel(self) -> None:
+        deadline = Deadline(5)
+        deadline.cancel()
+        self.assertTrue(deadline.expired)
+        self.assertRaises(DeadlineExceeded, deadline.timeout, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REPORT_CACHE_TTL=60)
+class CachingTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_normalize_url(self) -> None:
+        self.assertEqual(normalize_url("HTTPS://Test.com:443#top"), "https://test.com/")
+        self.assertEqual(normalize_url("http://test.com:8080/page?q=1"), "http://test.com:8080/page?q=1")
+
+    def test_single_flight(self) -> None:
+        calls: list[int] = list()
+        started = threading.Event()
+        release = threading.Event()
+
+        def func() -> str:
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "value"
+
+        single_flight = SingleFlight()
+        results: list[str] = list()
+        threads = [threading.Thread(target=lambda: results.append(single_flight.get_or_set("key", func, 60)))]
+        threads[0].start()
+        started.wait(5)
+        threads.extend(
+            threading.Thread(target=lambda: results.append(single_flight.get_or_set("key", func, 60))) for _ in range(3)
+        )
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertListEqual(results, ["value"] * 4)
+        self.assertEqual(cache.get("key"), "value")
+
+    def test_single_flight_other_process(self) -> None:
+        cache.add("key:lock", True)
+        threading.Timer(0.3, cache.set, ("key", "value")).start()
+
+        func = MagicMock()
+        self.assertEqual(SingleFlight().get_or_set("key", func, 60), "value")
+        func.assert_not_called()
+
+    def test_single_flight_error(self) -> None:
+        single_flight = SingleFlight()
+        self.assertRaises(ZeroDivisionError, single_flight.get_or_set, "key", lambda: 1 / 0, 60)
+        self.assertIsNone(cache.get("key:lock"))
+        self.assertEqual(single_flight.get_or_set("key", lambda: "value", 60), "value")
+
+    @patch("checker.checks.run_check")
+    def test_get_report(self, mock_run_check) -> None:
+        mock_run_check.return_value = {"url": "https://test.com"}
+
+        self.assertDictEqual(get_report("https://test.com"), {"url": "https://test.com"})
+        self.assertDictEqual(get_report("https://TEST.com/#top"), {"url": "https://test.com"})
+        mock_run_check.assert_called_once()
+        self.assertIsNotNone(cache.get(make_key("report", "https://test.com/")))
+
+    @override_settings(REPORT_CACHE_TTL=0)
+    @patch("checker.checks.run_check")
+    def test_get_report_disabled(self, mock_run_check) -> None:
+        mock_run_check.return_value = {"url": "https://test.com"}
+
+        get_report("https://test.com")
+        get_report("https://test.com")
+        self.assertEqual(mock_run_check.call_count, 2)
+
+
+class HostSchedulerTestCase(TestCase):
+    def test_run(self) -> None:
+        links = [f"https://host{idx % 3}.com/{idx}" for idx in range(12)]
+        results = dict(HostScheduler(4, 2).run(str.upper, links))
+        self.assertDictEqual(results, {link: link.upper() for link in links})
+
+    def test_run_with_caps(self) -> None:
+        lock = threading.Lock()
+        active: dict[str, int] = dict()
+        peaks: dict[str, int] = dict()
+
+        def func(link: str) -> None:
+            host = HostScheduler.get_host(link)
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                active["*"] = active.get("*", 0) + 1
+                for key in (host, "*"):
+                    peaks[key] = max(peaks.get(key, 0), active[key])
+            time.sleep(0.01)
+            with lock:
+                active[host] -= 1
+                active["*"] -= 1
+
+        links = [f"https://slow.com/{idx}" for idx in range(10)] + [f"https://fast{idx}.com/" for idx in range(10)]
+        list(HostScheduler(5, 2).run(func, links))
+        self.assertEqual(peaks["slow.com"], 2)
+        self.assertLessEqual(peaks["*"], 5)
+
+    def test_run_round_robin(self) -> None:
+        order: list[str] = list()
+        links = [f"https://a.com/{idx}" for idx in range(3)] + [f"https://b.com/{idx}" for idx in range(3)]
+        list(HostScheduler(1, 1).run(order.append, links))
+        self.assertListEqual([HostScheduler.get_host(link) for link in order], ["a.com", "b.com"] * 3)
+
+
+class ClientTestCase(StubServerTestCase):
+    def test_get_client(self) -> None:
+        self.assertIs(get_client(), get_client())
+
+    @patch("requests.Session.request")
+    def test_default_timeout(self, mock_request) -> None:
+        client = Client(3, 2)
+        client.get(self.server_url)
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], 3)
+        client.get(self.server_url, timeout=1)
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], 1)
+
+    def test_connection_reuse(self) -> None:
+        client = Client(3, 2)
+        for _ in range(3):
+            self.assertEqual(client.get(self.server_url).text, "OK")
+
+        self.assertDictEqual(client.get_stats(), {"hosts": 1, "connections": 1, "requests": 3})
+        self.assertEqual(len(client.cookies), 0)
+
+    @override_settings(CHECK_MAX_ACTIVE=8, LINK_HOST_CONCURRENCY=2, OUTBOUND_MAX_ACTIVE=64)
+    def test_get_pool_size(self) -> None:
+        self.assertEqual(get_pool_size(), 16)
+        with self.settings(OUTBOUND_MAX_ACTIVE=10):
+            self.assertEqual(get_pool_size(), 10)
+
+    def test_record_stats(self) -> None:
+        client = Client(3, 2)
+        client.get(self.server_url)
+        client.record_stats()
+        self.assertEqual(metrics.client_pools.value, 1)
+        self.assertEqual(metrics.client_requests.value, 1)
+
+    @override_settings(OUTBOUND_MAX_ACTIVE=1)
+    def test_outbound_limit(self) -> None:
+        client = Client(3, 2)
+        self.assertTrue(outbound_slots.acquire(1, 0))
+        try:
+            self.assertRaises(ConnectTimeout, client.get, self.server_url, timeout=0.05)
+        finally:
+            outbound_slots.release()
+        self.assertEqual(client.get(self.server_url).text, "OK")
+        self.assertEqual(outbound_slots.active, 0)
+
+
+class LimiterTestCase(TestCase):
+    def setUp(self) -> None:
+        self.limiter = Limiter(metrics.Gauge("test_active", ""), metrics.Gauge("test_queued", ""))
+        self.addCleanup(metrics.registry.remove, self.limiter._active_gauge)
+        self.addCleanup(metrics.registry.remove, self.limiter._queued_gauge)
+
+    def test_acquire(self) -> None:
+        self.assertTrue(self.limiter.acquire(1, 0))
+        self.assertFalse(self.limiter.acquire(1, 0.05))
+        self.limiter.release()
+        self.assertTrue(self.limiter.acquire(1, 0))
+        self.assertEqual(self.limiter._active_gauge.value, 1)
+
+    def test_acquire_unlimited(self) -> None:
+        for _ in range(3):
+            self.assertTrue(self.limiter.acquire(0, 0))
+        self.assertEqual(self.limiter.active, 3)
+
+    def test_acquire_queued(self) -> None:
+        self.limiter.acquire(1, 0)
+        threading.Timer(0.05, self.limiter.release).start()
+        self.assertTrue(self.limiter.acquire(1, 5))
+        self.assertEqual(self.limiter.queued, 0)
+
+    def test_acquire_queue_full(self) -> None:
+        self.limiter.acquire(1, 0)
+        waiter = threading.Thread(target=self.limiter.acquire, args=(1, 0.5, 1))
+        waiter.start()
+        while self.limiter.queued == 0:
+            time.sleep(0.01)
+        self.assertFalse(self.limiter.acquire(1, 5, max_queued=1))
+        self.limiter.release()
+        waiter.join()
+        self.assertEqual(self.limiter.active, 1)
+
+    def test_acquire_async(self) -> None:
+        self.assertTrue(asyncio.run(self.limiter.acquire_async(1, 0)))
+        self.assertFalse(asyncio.run(self.limiter.acquire_async(1, 0.05)))
+        threading.Timer(0.05, self.limiter.release).start()
+        self.assertTrue(asyncio.run(self.limiter.acquire_async(1, 5)))
+        self.assertEqual(self.limiter.queued, 0)
+
+    def test_releasing_iterator(self) -> None:
+        released = MagicMock()
+        content = ReleasingIterator(iter([b"a", b"b"]), released)
+        self.assertListEqual(list(content), [b"a", b"b"])
+        content.close()
+        released.assert_called_once()
+
+        # Closed before being iterated, e.g. when the client goes away
+        ReleasingIterator(iter([b"a"]), released).close()
+        self.assertEqual(released.call_count, 2)
+
+
+class JobsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.url = "https://test.com"
+
+    def test_claim_job(self) -> None:
+        first = enqueue_check(self.url)
+        second = enqueue_check(self.url)
+
+        self.assertEqual(claim_job().pk, first.pk)
+        self.assertEqual(claim_job().pk, second.pk)
+        self.assertIsNone(claim_job())
+        self.assertEqual(CheckJob.objects.filter(status=CheckJob.Status.RUNNING).count(), 2)
+
+    @override_settings(CHECK_JOB_TIMEOUT=60)
+    def test_claim_job_stale(self) -> None:
+        job = enqueue_check(self.url)
+        CheckJob.objects.filter(pk=job.pk).update(
+            status=CheckJob.Status.RUNNING, started_at=timezone.now() - timezone.timedelta(minutes=5)
+        )
+        self.assertEqual(claim_job().pk, job.pk)
+
+    @patch("checker.jobs.get_report")
+    def test_run_job(self, mock_get_report) -> None:
+        mock_get_report.return_value = {"url": self.url, "headings": {1: ["Heading 1"]}}
+
+        run_job(enqueue_check(self.url))
+        job = CheckJob.objects.get()
+        self.assertEqual(job.status, CheckJob.Status.DONE)
+        self.assertDictEqual(job.report, {"url": self.url, "headings": {"1": ["Heading 1"]}})
+        self.assertIsNotNone(job.finished_at)
+
+    @patch("checker.jobs.get_report")
+    def test_run_job_with_error(self, mock_get_report) -> None:
+        mock_get_report.side_effect = HTTPError("Not found")
+
+        run_job(enqueue_check(self.url))
+        job = CheckJob.objects.get()
+        self.assertEqual(job.status, CheckJob.Status.FAILED)
+        self.assertEqual(job.error, "Not found")
+
+    @patch("checker.jobs.get_report")
+    def test_run_job_with_unexpected_error(self, mock_get_report) -> None:
+        mock_get_report.side_effect = KeyError("title")
+
+        run_job(enqueue_check(self.url))
+        job = CheckJob.objects.get()
+        self.assertEqual(job.status, CheckJob.Status.FAILED)
+        self.assertEqual(job.error, "'title'")
+
+    @override_settings(CHECK_JOB_POLL_INTERVAL=0)
+    @patch("checker.jobs.run_job")
+    @patch("checker.jobs.claim_job")
+    def test_work_with_error(self, mock_claim_job, mock_run_job) -> None:
+        stop = threading.Event()
+        job = enqueue_check(self.url)
+        mock_claim_job.side_effect = [DatabaseError(), job, None]
+        mock_run_job.side_effect = lambda job: stop.set()
+
+        work(stop)
+        mock_run_job.assert_called_once_with(job)
+
+    @override_settings(CHECK_JOBS_ENABLED=True)
+    @patch("checker.views.verify_captcha")
+    def test_check_view(self, mock_verify_captcha) -> None:
+        mock_verify_captcha.return_value = True
+
+        response = self.client.post(reverse("check"), {"url": self.url, "g-recaptcha-response": ""})
+        job = CheckJob.objects.get()
+        self.assertRedirects(response, reverse("check_job", args=[job.id]))
+        self.assertEqual(job.status, CheckJob.Status.PENDING)
+
+    def test_job_status_view(self) -> None:
+        job = enqueue_check(self.url)
+        response = self.client.get(reverse("check_job_status", args=[job.id]))
+        self.assertEqual(response.json()["status"], CheckJob.Status.PENDING)
+        self.assertContains(
+            self.client.get(reverse("check_job", args=[job.id])), reverse("check_job_status", args=[job.id])
+        )
+
+        CheckJob.objects.filter(pk=job.pk).update(
+            status=CheckJob.Status.DONE, report={"url": self.url, "title": "Title"}
+        )
+        self.assertEqual(self.client.get(reverse("check_job_status", args=[job.id])).json()["report"]["title"], "Title")
+        self.assertContains(self.client.get(reverse("check_job", args=[job.id])), "Title")
 
-    def test_get_page_rank_with_not_found(self) -> None:
+
+@override_settings(CACHES=LOCMEM_CACHES, REPORT_CACHE_TTL=60)
+class CheckViewTestCase(TestCase):
+    def setUp(self) -> None:
+        self.url = "https://test.com"
+        self.data = {"url": self.url, "g-recaptcha-response": ""}
+        cache.clear()
+
+        patcher = patch("checker.views.verify_captcha", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_check(self, deadline=None) -> tuple[dict, Pipeline]:
+        context = {
+            "url": self.url,
+            "title": "Title",
+            "anchors": [self.url],
+            "linkStats": {},
+            "sitemapStats": {},
+            "incomplete": [],
+            "timings": {},
+        }
+        pipeline = Pipeline(deadline=deadline)
+        pipeline.add("pageRank", lambda: 5)
+        pipeline.add("robotsTxt", lambda: f"{self.url}/robots.txt")
+        pipeline.add("sitemaps", lambda robots: [f"{self.url}/sitemap.xml"], requires=("robotsTxt",))
+        pipeline.add("brokenLinks", lambda: [self.url])
+        return context, pipeline
+
+    @patch("checker.views.start_check")
+    def test_post(self, mock_start_check) -> None:
+        mock_start_check.return_value = self.make_check()
+
+        response = self.client.post(reverse("check"), self.data)
+        self.assertContains(response, "Title")
+        self.assertContains(response, f"{self.url}/sitemap.xml")
+        self.assertNotContains(response, "section-pageRank")
+        for stage in ("captcha", "pageRank", "robotsTxt", "sitemaps", "brokenLinks", "total"):
+            self.assertIn(f"{stage};dur=", response["Server-Timing"])
+
+    @patch("checker.views.start_check")
+    def test_post_with_error(self, mock_start_check) -> None:
+        mock_start_check.side_effect = HTTPError()
+        self.assertRedirects(self.client.post(reverse("check"), self.data), "/", fetch_redirect_response=False)
+
+    @patch("checker.views.start_check")
+    def test_post_cached(self, mock_start_check) -> None:
+        mock_start_check.return_value = self.make_check()
+
+        self.client.post(reverse("check"), self.data)
+        self.assertContains(self.client.post(reverse("check"), self.data), "Title")
+        mock_start_check.assert_called_once()
+
+    @patch("checker.views.start_check")
+    def test_post_speculative(self, mock_start_check) -> None:
+        fetched = threading.Event()
+
+        def start_check(url: str, deadline: Deadline) -> tuple[dict, Pipeline]:
+            fetched.set()
+            return self.make_check(deadline)
+
+        def verify_captcha(response: str, user_ip: str) -> bool:
+            # The page is fetched while the captcha is verified
+            return fetched.wait(5)
+
+        mock_start_check.side_effect = start_check
+        with patch("checker.views.verify_captcha", side_effect=verify_captcha):
+            self.assertContains(self.client.post(reverse("check"), self.data), "Title")
+
+    @patch("checker.views.start_check")
+    def test_post_speculative_with_captcha_error(self, mock_start_check) -> None:
+        deadlines: list[Deadline] = list()
+        started = threading.Event()
+
+        def start_check(url: str, deadline: Deadline) -> tuple[dict, Pipeline]:
+            deadlines.append(deadline)
+            started.set()
+            return self.make_check(deadline)
+
+        mock_start_check.side_effect = start_check
+        with patch("checker.views.verify_captcha", side_effect=lambda *args: not started.wait(5)):
+            response = self.client.post(reverse("check"), self.data)
+
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        # The speculative fetch is abandoned
+        self.assertTrue(deadlines[0].expired)
+        self.assertIsNone(cache.get(get_report_key(self.url)))
+
+    @patch("checker.views.start_check")
+    def test_post_speculative_with_captcha_exception(self, mock_start_check) -> None:
+        deadlines: list[Deadline] = list()
+
+        def start_check(url: str, deadline: Deadline) -> tuple[dict, Pipeline]:
+            deadlines.append(deadline)
+            return self.make_check(deadline)
+
+        def verify_captcha(response: str, user_ip: str) -> bool:
+            while not deadlines:
+                time.sleep(0.01)
+            raise RuntimeError()
+
+        mock_start_check.side_effect = start_check
+        with patch("checker.views.verify_captcha", side_effect=verify_captcha):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse("check"), self.data)
+        self.assertTrue(deadlines[0].expired)
+
+    @override_settings(CHECK_STREAMING=True)
+    @patch("checker.views.start_check")
+    def test_post_streaming(self, mock_start_check) -> None:
+        mock_start_check.return_value = self.make_check()
+
+        response = self.client.post(reverse("check"), self.data)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 6)
+        self.assertIn("Title", chunks[0])
+        self.assertEqual(chunks[0].count("Đang kiểm tra..."), 4)
+        self.assertSetEqual(
+            {chunk.split('"')[1] for chunk in chunks[1:-1]},
+            {f"section-{name}-done" for name in ("pageRank", "robotsTxt", "sitemaps", "brokenLinks")},
+        )
+        self.assertIsNotNone(cache.get(get_report_key(self.url)))
+
+        # Served from the cache
+        self.assertFalse(self.client.post(reverse("check"), self.data).streaming)
+        mock_start_check.assert_called_once()
+
+    @override_settings(CHECK_STREAMING=True)
+    @patch("checker.views.start_check")
+    def test_post_streaming_with_deadline(self, mock_start_check) -> None:
+        release = threading.Event()
+        context, pipeline = self.make_check(Deadline(0.2))
+        pipeline.stages["brokenLinks"] = pipeline.stages["brokenLinks"]._replace(func=release.wait, args=(5,))
+        mock_start_check.return_value = (context, pipeline)
+
+        chunks = [chunk.decode() for chunk in self.client.post(reverse("check"), self.data).streaming_content]
+        self.assertIn("Hết thời gian kiểm tra", chunks[-2])
+        self.assertIsNone(cache.get(get_report_key(self.url)))
+        release.set()
+
+    @override_settings(CHECK_MAX_ACTIVE=1, CHECK_QUEUE_TIMEOUT=0.05)
+    @patch("checker.views.start_check")
+    def test_post_busy(self, mock_start_check) -> None:
+        check_slots.acquire(1, 0)
+        try:
+            response = self.client.post(reverse("check"), self.data)
+        finally:
+            check_slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "10")
+        mock_start_check.assert_not_called()
+
+        mock_start_check.return_value = self.make_check()
+        self.assertContains(self.client.post(reverse("check"), self.data), "Title")
+        self.assertEqual(check_slots.active, 0)
+
+    @override_settings(CHECK_STREAMING=True, CHECK_MAX_ACTIVE=1)
+    @patch("checker.views.start_check")
+    def test_post_streaming_slot(self, mock_start_check) -> None:
+        mock_start_check.return_value = self.make_check()
+
+        response = self.client.post(reverse("check"), self.data)
+        self.assertEqual(check_slots.active, 1)
+        list(response.streaming_content)
+        response.close()
+        self.assertEqual(check_slots.active, 0)
+
+
+@override_settings(BATCH_API_TOKENS=["token"], BATCH_MAX_URLS=4)
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchCheckViewTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def post(self, data, token: str = "token"):
+        return self.client.post(
+            reverse("batch_check"),
+            json.dumps(data),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    def test_unauthorized(self) -> None:
+        self.assertEqual(self.post({"urls": []}, token="wrong").status_code, 401)
+
+    def test_invalid_request(self) -> None:
+        self.assertEqual(self.post({"url": "https://test.com"}).status_code, 400)
+        self.assertEqual(self.post({"urls": "https://test.com"}).status_code, 400)
+        self.assertEqual(self.post({"urls": ["https://test.com"] * 5}).status_code, 400)
+
+    @patch("checker.views.get_page_ranks")
+    @patch("checker.views.get_report")
+    def test_post(self, mock_get_report, mock_get_page_ranks) -> None:
+        prefetched = threading.Event()
+        mock_get_page_ranks.side_effect = lambda *args: prefetched.set()
+
+        def get_report(url: str) -> dict:
+            prefetched.wait(5)
+            if url.endswith("error"):
+                raise HTTPError("Not found")
+            if url.endswith("bug"):
+                raise KeyError("title")
+            return {"url": url, "title": "Title"}
+
+        mock_get_report.side_effect = get_report
+
+        urls = ["https://test.com", "https://test.com/error", "https://test.com/bug", "ftp://test.com"]
+        response = self.post({"urls": urls})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        results = {
+            result["url"]: result for result in map(json.loads, b"".join(response.streaming_content).splitlines())
+        }
+        self.assertEqual(results["https://test.com"]["report"]["title"], "Title")
+        self.assertEqual(results["https://test.com/error"]["error"], "Not found")
+        self.assertEqual(results["https://test.com/bug"]["status"], "error")
+        self.assertEqual(results["ftp://test.com"]["error"], "Invalid URL")
+        self.assertSetEqual(mock_get_page_ranks.call_args.args[1], {"test.com"})
+
+    @patch("checker.views.get_page_ranks")
+    @patch("checker.views.get_report")
+    def test_post_slow_page_ranks(self, mock_get_report, mock_get_page_ranks) -> None:
+        release, prefetched = threading.Event(), threading.Event()
+        mock_get_page_ranks.side_effect = lambda *args: (release.wait(5), prefetched.set())
+        mock_get_report.side_effect = lambda url: {"url": url, "title": "Title"}
+
+        # The first result is sent while the page ranks are still being fetched
+        content = self.post({"urls": ["https://test.com"]}).streaming_content
+        self.assertEqual(json.loads(next(iter(content)))["status"], "ok")
+        self.assertFalse(prefetched.is_set())
+        release.set()
+
+    @override_settings(CHECK_MAX_ACTIVE=1, CHECK_QUEUE_TIMEOUT=0.05)
+    @patch("checker.views.get_page_ranks")
+    @patch("checker.views.get_report")
+    def test_post_busy(self, mock_get_report, mock_get_page_ranks) -> None:
+        mock_get_report.side_effect = lambda url: {"url": url, "title": "Title"}
+        cache.set(get_report_key("https://test.com/cached"), {"url": "https://test.com/cached"})
+
+        check_slots.acquire(1, 0)
+        try:
+            response = self.post({"urls": ["https://test.com", "https://test.com/cached"]})
+            results = {
+                result["url"]: result for result in map(json.loads, b"".join(response.streaming_content).splitlines())
+            }
+        finally:
+            check_slots.release()
+        self.assertEqual(results["https://test.com"]["status"], "busy")
+        self.assertEqual(results["https://test.com/cached"]["status"], "ok")
+        mock_get_report.assert_not_called()
+
+        self.assertEqual(
+            json.loads(b"".join(self.post({"urls": ["https://test.com"]}).streaming_content))["status"], "ok"
+        )
+        self.assertEqual(check_slots.active, 0)
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pages = {
+        "/robots.txt": b"User-agent: *\nDisallow: /private/\n",
+        "/": b"<title>Home</title><h1>Home</h1><a href='/a#top'>A</a><a href='/b'>B</a><a href='/private/c'>C</a>"
+        b"<a href='https://other.com/'>Other</a>",
+        "/a": b"<title>A</title><a href='/'>Home</a><a href='/b'>B</a><a href='/a/d'>D</a>",
+        "/b": b"<meta name='description' content='B'><img src='b.png'>",
+        "/a/d": b"<title>D</title><a href='/a/d/e'>E</a>",
+        "/private/c": b"<title>C</title>",
+        "/blog/a": b"<title>Blog A</title><a href='b'>B</a><a href='../about'>About</a>",
+        "/blog/b": b"<title>Blog B</title>",
+        "/about": b"<title>About</title>",
+    }
+
+    def do_GET(self) -> None:
+        content = self.pages.get(self.path)
+        self.send_response(200 if content is not None else 404)
+        content = content or b"Not found"
+        self.send_header("Content-Type", "text/plain" if self.path.endswith(".txt") else "text/html")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class BloomFilterTestCase(TestCase):
+    def test_add(self) -> None:
+        bloom = BloomFilter(100)
+        self.assertTrue(bloom.add("https://test.com/a"))
+        self.assertFalse(bloom.add("https://test.com/a"))
+        self.assertIn("https://test.com/a", bloom)
+        self.assertNotIn("https://test.com/b", bloom)
+        self.assertEqual(bloom.count, 1)
+
+    def test_error_rate(self) -> None:
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"https://test.com/{i}")
+
+        false_positives = sum(f"https://other.com/{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CrawlerTestCase(StubServerTestCase):
+    handler = SiteHandler
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_crawl(self) -> None:
+        crawler = Crawler(self.server_url + "/", max_depth=3, max_pages=10, concurrency=2)
+        reports = {report["url"].removeprefix(self.server_url): report for report in crawler.crawl()}
+
+        self.assertEqual(set(reports), {"/", "/a", "/b", "/a/d", "/a/d/e"})
+        self.assertEqual(reports["/a/d"]["depth"], 2)
+        self.assertEqual(reports["/a/d/e"]["status"], 404)
+
+        summary = crawler.get_summary()
+        self.assertEqual(summary["pages"], 5)
+        self.assertEqual(summary["statuses"], {200: 4, 404: 1})
+        self.assertEqual(summary["missingDescription"], 4)
+        self.assertEqual(summary["imagesMissAlt"], 1)
+
+    def test_crawl_relative_links(self) -> None:
+        crawler = Crawler(self.server_url + "/blog/a", max_depth=1, max_pages=10, concurrency=2)
+        reports = {report["url"].removeprefix(self.server_url): report for report in crawler.crawl()}
+
+        # Relative links are resolved against the page, not the site root
+        self.assertEqual(set(reports), {"/blog/a", "/blog/b", "/about"})
+        self.assertEqual(reports["/blog/b"]["status"], 200)
+
+    def test_crawl_max_depth(self) -> None:
+        crawler = Crawler(self.server_url + "/", max_depth=1, max_pages=10)
+        self.assertEqual({report["url"].removeprefix(self.server_url) for report in crawler.crawl()}, {"/", "/a", "/b"})
+
+    def test_crawl_max_pages(self) -> None:
+        crawler = Crawler(self.server_url + "/", max_depth=3, max_pages=2)
+        self.assertEqual(len(list(crawler.crawl())), 2)
+
+    @patch("checker.crawler.resource", None)
+    def test_get_summary_without_resource(self) -> None:
+        self.assertIsNone(Crawler(self.server_url + "/").get_summary()["peakMemory"])
+
+    def test_is_allowed(self) -> None:
+        crawler = Crawler(self.server_url + "/")
+        self.assertTrue(crawler.is_allowed(self.server_url + "/a"))
+        self.assertFalse(crawler.is_allowed(self.server_url + "/private/c"))
+        self.assertFalse(crawler.is_allowed("https://other.com/"))
+        self.assertFalse(crawler.is_allowed("mailto:test@test.com"))
+
+
+class SitemapHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def get_content(self) -> tuple[int, bytes]:
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        xmlns = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        image_xmlns = 'xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"'
+        if self.path == "/robots.txt":
+            return 200, f"User-agent: *\nsitemap: {base_url}/sitemap_index.xml\n".encode()
+        if self.path == "/sitemap_index.xml":
+            sitemaps = "".join(
+                f"<sitemap><loc>{base_url}/{name}</loc></sitemap>"
+                for name in ("sitemap1.xml", "sitemap2.xml.gz", "missing.xml", "sitemap1.xml")
+            )
+            return 200, f"<?xml version='1.0'?><sitemapindex {xmlns}>{sitemaps}</sitemapindex>".encode()
+        if self.path == "/sitemap1.xml":
+            urls = (
+                f"<url><loc>{base_url}/a</loc><lastmod>2024-01-02T10:00:00+00:00</lastmod>"
+                f"<image:image><image:loc>{base_url}/a.png</image:loc></image:image></url>"
+                f"<url><loc>{base_url}/b</loc><lastmod>2023-05-06</lastmod></url>"
+                f"<url><loc>{base_url}/broken</loc></url>"
+            )
+            return 200, f"<urlset {xmlns} {image_xmlns}>{urls}</urlset>".encode()
+        if self.path == "/sitemap2.xml.gz":
+            urls = f"<url><loc>{base_url}/c</loc><lastmod>2025-03-04</lastmod></url>"
+            return 200, gzip.compress(f"<urlset {xmlns}>{urls}</urlset>".encode())
+        if self.path in ("/a", "/b", "/c"):
+            return 200, b"OK"
+        return 404, b"Not found"
+
+    def do_HEAD(self) -> None:
+        status, content = self.get_content()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        self.do_HEAD()
+        self.wfile.write(self.get_content()[1])
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SITEMAP_MAX_FILES=10, SITEMAP_SAMPLE_SIZE=10)
+class SitemapsTestCase(StubServerTestCase):
+    handler = SitemapHandler
+
+    def setUp(self) -> None:
+        cache.clear()
+        link_cache.clear()
+
+    def test_iter_sitemap(self) -> None:
+        response = MagicMock()
+        response.iter_content.return_value = [
+            b"<urlset><url><loc> https://test.com/a </loc></url><url><lo",
+            b"c>https://test.com/b</loc><lastmod>2024-01-01</lastmod></url><url></url></urlset>",
+        ]
+        self.assertListEqual(
+            list(iter_sitemap(response)),
+            [("url", "https://test.com/a", None), ("url", "https://test.com/b", "2024-01-01")],
+        )
+        response.close.assert_called_once()
+
+    def test_iter_sitemap_large(self) -> None:
+        def iter_content(chunk_size: int):
+            yield b"<urlset>"
+            for i in range(50000):
+                yield f"<url><loc>https://test.com/{i}</loc></url>".encode()
+            yield b"</urlset>"
+
+        response = MagicMock()
+        response.iter_content.side_effect = iter_content
+        self.assertEqual(sum(1 for _ in iter_sitemap(response)), 50000)
+
+    def test_iter_sitemap_with_deadline(self) -> None:
+        response = MagicMock()
+        response.iter_content.return_value = [b"<urlset><url><loc>https://test.com/a</loc></url>"]
+        with self.assertRaises(DeadlineExceeded):
+            list(iter_sitemap(response, Deadline(0)))
+
+    def test_read_sitemaps(self) -> None:
+        stats: dict = dict()
+        sample = read_sitemaps(get_client(), [self.server_url + "/sitemap_index.xml"], stats)
+        self.assertDictEqual(
+            stats,
+            {"sitemaps": 3, "errors": 1, "urls": 4, "lastmod": 3, "oldest": "2023-05-06", "newest": "2025-03-04"},
+        )
+        self.assertListEqual(sorted(sample), [self.server_url + path for path in ("/a", "/b", "/broken", "/c")])
+
+    def test_read_sitemaps_closed_on_error(self) -> None:
+        response = Response()
+        response.status_code = 404
+        response.url = self.server_url + "/missing.xml"
+        response.raw = MagicMock()
+        mock_client = MagicMock()
+        mock_client.get.return_value = response
+
+        stats: dict = dict()
+        self.assertListEqual(read_sitemaps(mock_client, [response.url], stats), [])
+        self.assertEqual(stats["errors"], 1)
+        # The connection goes back to the pool
+        response.raw.release_conn.assert_called_once()
+
+    @override_settings(SITEMAP_SAMPLE_SIZE=2)
+    def test_read_sitemaps_sample(self) -> None:
+        sample = read_sitemaps(get_client(), [self.server_url + "/sitemap_index.xml"], dict())
+        self.assertEqual(len(sample), 2)
+
+    def test_get_sitemaps(self) -> None:
+        stats: dict = dict()
+        sitemaps = get_sitemaps(get_client(), self.server_url, stats, self.server_url + "/robots.txt")
+        self.assertListEqual(sitemaps, [self.server_url + "/sitemap_index.xml"])
+        self.assertEqual(stats["urls"], 4)
+        self.assertEqual(stats["sample"], 4)
+        self.assertListEqual(stats["broken"], [self.server_url + "/broken"])
+
+    def test_get_sitemaps_not_found(self) -> None:
+        stats: dict = dict()
+        self.assertIsNone(get_sitemaps(get_client(), self.server_url, stats, None))
+        self.assertDictEqual(stats, {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RobotsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.base_url = "https://test.com"
+        self.robots = RobotsRules.parse(
+            f"{self.base_url}/robots.txt",
+            "# Comment\n"
+            "User-agent: *\n"
+            "Disallow: /private/\n"
+            "Allow: /private/public\n"
+            "Disallow: /*.pdf$\n"
+            "Disallow: /search?q=\n"
+            "Disallow:\n"
+            "\n"
+            "User-agent: BadBot\n"
+            "User-agent: web-checker\n"
+            "Disallow: / # Everything\n"
+            "Allow: /$\n"
+            "Sitemap: https://test.com/sitemap.xml\n",
+        )
+        cache.clear()
+
+    def test_compile_rule(self) -> None:
+        self.assertTrue(compile_rule("/a*b", allow=False).pattern.match("/a/x/b/c"))
+        self.assertTrue(compile_rule("/a*b$", allow=False).pattern.match("/a/x/b"))
+        self.assertFalse(compile_rule("/a*b$", allow=False).pattern.match("/a/x/b/c"))
+        self.assertFalse(compile_rule("/a.b", allow=False).pattern.match("/axb"))
+
+    def test_parse(self) -> None:
+        self.assertTrue(self.robots.found)
+        self.assertSetEqual(set(self.robots.groups), {"*", "badbot", "web-checker"})
+        self.assertListEqual(self.robots.sitemaps, ["https://test.com/sitemap.xml"])
+
+    def test_is_allowed(self) -> None:
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/"))
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/page"))
+        self.assertFalse(self.robots.is_allowed(f"{self.base_url}/private/page"))
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/private/public/page"))
+        self.assertFalse(self.robots.is_allowed(f"{self.base_url}/files/a.pdf"))
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/files/a.pdf?v=1"))
+        self.assertFalse(self.robots.is_allowed(f"{self.base_url}/search?q=test"))
+
+    def test_is_allowed_user_agent(self) -> None:
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/", "web-checker/1.0"))
+        self.assertFalse(self.robots.is_allowed(f"{self.base_url}/page", "web-checker/1.0"))
+        self.assertFalse(self.robots.is_allowed(f"{self.base_url}/page", "BadBot"))
+        self.assertTrue(self.robots.is_allowed(f"{self.base_url}/page", "GoodBot"))
+
+    def test_is_allowed_empty(self) -> None:
+        self.assertTrue(RobotsRules(f"{self.base_url}/robots.txt").is_allowed(f"{self.base_url}/private/page"))
+
+    def test_get_robots_cached(self) -> None:
         mock_response = MagicMock()
-        mock_response.json.return_value = {"response": [{"status_code": 404}]}
+        mock_response.__enter__.return_value = mock_response
+        mock_response.status_code = 200
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [b"User-agent: *\nDisallow: /private/\n"]
 
         mock_session = MagicMock()
         mock_session.get.return_value = mock_response
-        self.assertEqual(get_page_rank(mock_session, self.base_url), 0)
+        self.assertFalse(is_allowed(mock_session, f"{self.base_url}/private/page"))
+        self.assertTrue(is_allowed(mock_session, f"{self.base_url}/page"))
+        self.assertTrue(get_robots(mock_session, self.base_url).found)
+        mock_session.get.assert_called_once()
+
+    def test_get_robots_not_cached_when_unreachable(self) -> None:
+        mock_session = MagicMock()
+        mock_session.get.side_effect = RequestException()
+        self.assertFalse(get_robots(mock_session, self.base_url).found)
+        self.assertFalse(get_robots(mock_session, self.base_url).found)
+        self.assertEqual(mock_session.get.call_count, 2)
+
+
+class PageRankHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: list[list[str]] = list()
+    ranks = {"test.com": 10, "example.com": 20}
+    delay = 0.0
+
+    def do_GET(self) -> None:
+        time.sleep(self.delay)
+        query = parse_qs(urlsplit(self.path).query)
+        domains = [query[f"domains[{i}]"][0] for i in range(len(query))]
+        self.requests.append(domains)
+
+        if self.headers.get("API-OPR") != "key":
+            self.send_response(401)
+            content = b"Unauthorized"
+        else:
+            self.send_response(200)
+            results = [
+                (
+                    {"status_code": 200, "domain": domain, "rank": str(self.ranks[domain])}
+                    if domain in self.ranks
+                    else {"status_code": 404, "domain": domain, "rank": None}
+                )
+                for domain in domains
+            ]
+            content = json.dumps({"status_code": 200, "response": results}).encode()
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, OPEN_PAGERANK_KEY="key", PAGE_RANK_BATCH_WINDOW=0.1)
+class PageRankTestCase(StubServerTestCase):
+    handler = PageRankHandler
+
+    def setUp(self) -> None:
+        self.enterContext(self.settings(OPEN_PAGERANK_URL=self.server_url + "/api"))
+        PageRankHandler.requests.clear()
+        cache.clear()
+
+    def test_fetch_page_ranks(self) -> None:
+        self.assertDictEqual(
+            fetch_page_ranks(get_client(), ["test.com", "Example.com", "unknown.com"]),
+            {"test.com": 10, "example.com": 20, "unknown.com": 0},
+        )
+
+    @override_settings(OPEN_PAGERANK_KEY="wrong")
+    def test_fetch_page_ranks_with_http_error(self) -> None:
+        self.assertDictEqual(fetch_page_ranks(get_client(), ["test.com"]), {})
+
+    def test_fetch_page_ranks_with_json_error(self) -> None:
+        mock_session = MagicMock()
+        mock_session.get.return_value.json.side_effect = JSONDecodeError("", "", 0)
+        self.assertDictEqual(fetch_page_ranks(mock_session, ["test.com"]), {})
+
+    def test_get_page_ranks_cached(self) -> None:
+        self.assertDictEqual(get_page_ranks(get_client(), ["test.com"]), {"test.com": 10})
+        self.assertDictEqual(
+            get_page_ranks(get_client(), ["test.com", "example.com"]), {"test.com": 10, "example.com": 20}
+        )
+        self.assertListEqual(PageRankHandler.requests, [["test.com"], ["example.com"]])
+
+    @patch("checker.pagerank.MAX_DOMAINS", 2)
+    def test_get_page_ranks_chunked(self) -> None:
+        self.assertEqual(len(get_page_ranks(get_client(), ["a.com", "b.com", "c.com"])), 3)
+        self.assertEqual(len(PageRankHandler.requests), 2)
+
+    def test_get_page_rank(self) -> None:
+        self.assertEqual(get_page_rank(get_client(), "test.com"), 10)
+        self.assertEqual(get_page_rank(get_client(), "unknown.com"), 0)
+        self.assertEqual(get_page_rank(get_client(), "test.com"), 10)
+        self.assertEqual(len(PageRankHandler.requests), 2)
+
+    @override_settings(OPEN_PAGERANK_KEY="wrong")
+    def test_get_page_rank_with_http_error(self) -> None:
+        self.assertEqual(get_page_rank(get_client(), "test.com"), 0)
+        self.assertEqual(get_page_rank(get_client(), "test.com"), 0)
+        # Failed lookups are not cached
+        self.assertEqual(len(PageRankHandler.requests), 2)
+
+    def test_get_page_rank_batched(self) -> None:
+        domains = ["test.com", "example.com", "unknown.com"] * 2
+        with ThreadPoolExecutor(max_workers=len(domains)) as executor:
+            ranks = list(executor.map(lambda domain: get_page_rank(get_client(), domain), domains))
+
+        self.assertListEqual(ranks, [10, 20, 0] * 2)
+        self.assertEqual(len(PageRankHandler.requests), 1)
+        self.assertCountEqual(PageRankHandler.requests[0], ["test.com", "example.com", "unknown.com"])
+
+    @patch.object(PageRankHandler, "delay", 0.3)
+    def test_get_page_rank_batched_deadlines(self) -> None:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(get_page_rank, get_client(), "test.com", Deadline(0.2))
+            time.sleep(0.02)
+            waiter = executor.submit(get_page_rank, get_client(), "example.com", Deadline(5))
+
+            # The batch outlives the deadline of the check that opened it
+            self.assertRaises(DeadlineExceeded, leader.result)
+            self.assertEqual(waiter.result(), 20)
+        self.assertEqual(len(PageRankHandler.requests), 1)
 
     @override_settings(DEBUG=True)
     def test_get_page_rank_with_debug(self) -> None:
-        mock_session = MagicMock()
-        self.assertEqual(get_page_rank(mock_session, self.base_url), 0)
+        self.assertEqual(get_page_rank(MagicMock(), "test.com"), 0)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_generate_page(self) -> None:
+        parser = Parser(
+            generate_page("https://test.com", anchors=10, images=4, styles=3, paragraphs=5), "https://test.com"
+        )
+        self.assertEqual(len(parser.anchors), 10)
+        self.assertEqual(len(parser.images), 4)
+        self.assertEqual(len(parser.images_miss_alt), 2)
+        self.assertEqual(len(parser.inline_css), 3)
+
+    def test_fake_web_server(self) -> None:
+        with FakeWebServer(error_rate=0.5) as server:
+            server.pages["test"] = b"<title>Test</title>"
+            client = get_client()
+            self.assertEqual(client.get(f"{server.url}/page/test").content, b"<title>Test</title>")
+
+            statuses = [client.head(f"{server.url}/link/{i}").status_code for i in range(100)]
+            self.assertTrue(20 < statuses.count(404) < 80)
+            self.assertListEqual(statuses, [client.head(f"{server.url}/link/{i}").status_code for i in range(100)])
+
+    def test_compare(self) -> None:
+        results = {"results": {"a": {"median": 2.0}, "b": {"median": 1.0}, "c": {"median": 1.0}}}
+        baseline = {"results": {"a": {"median": 1.0}, "b": {"median": 2.0}}}
+        self.assertListEqual(compare(results, baseline), [("a", 2.0), ("b", 0.5)])
+
+    def test_benchmark_command(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            output = f"{directory}/benchmark.json"
+            options = {"sizes": ["tiny"], "repeat": 1, "links": 20, "output": output, "stdout": MagicMock()}
+            call_command("benchmark", **options)
+
+            results = load_results(output)
+            self.assertIn("parser.tiny.anchors", results["results"])
+            self.assertIn("check_view.tiny", results["results"])
+            self.assertIn("broken_links.20", results["results"])
+
+            # Compared against itself with a negative threshold, everything has regressed
+            with self.assertRaises(CommandError):
+                call_command("benchmark", **options, baseline=output, threshold=-1)
+
+
+class MetricsTestCase(TestCase):
+    def test_counter(self) -> None:
+        counter = metrics.Counter("test_total", "Test.")
+        metrics.registry.remove(counter)
+        counter.inc(cache="link")
+        counter.inc(2, cache="link")
+        counter.inc(cache='re"port')
+        self.assertEqual(counter.get(cache="link"), 3)
+        self.assertListEqual(
+            counter.render(),
+            [
+                "# HELP test_total Test.",
+                "# TYPE test_total counter",
+                'test_total{cache="link"} 3',
+                'test_total{cache="re\\"port"} 1',
+            ],
+        )
+
+    def test_histogram(self) -> None:
+        histogram = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1))
+        metrics.registry.remove(histogram)
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, stage="fetch")
+        self.assertEqual(histogram.get_count(stage="fetch"), 4)
+        self.assertListEqual(
+            histogram.samples(),
+            [
+                'test_seconds_bucket{stage="fetch",le="0.1"} 2',
+                'test_seconds_bucket{stage="fetch",le="1"} 3',
+                'test_seconds_bucket{stage="fetch",le="+Inf"} 4',
+                'test_seconds_sum{stage="fetch"} 5.65',
+                'test_seconds_count{stage="fetch"} 4',
+            ],
+        )
+
+    def test_timed(self) -> None:
+        timings: dict[str, float] = dict()
+        count = metrics.stage_duration.get_count(stage="test")
+        with metrics.timed(timings, "test"):
+            time.sleep(0.01)
+        self.assertGreaterEqual(timings["test"], 0.01)
+        self.assertEqual(metrics.stage_duration.get_count(stage="test"), count + 1)
+        self.assertEqual(metrics.get_server_timing({"fetch": 0.0123, "total": 1}), "fetch;dur=12.3, total;dur=1000.0")
+
+    def test_outbound_errors(self) -> None:
+        errors = metrics.outbound_errors.get()
+        with self.assertRaises(RequestException):
+            Client(1, 1).get("http://127.0.0.1:1/")
+        self.assertEqual(metrics.outbound_errors.get(), errors + 1)
+
+    def test_metrics_view(self) -> None:
+        metrics.checks_run.inc(result="complete")
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE checker_stage_duration_seconds histogram", response.content.decode())
+        self.assertIn('checker_checks_total{result="complete"}', response.content.decode())
+        self.assertIn("checker_client_connections ", response.content.decode())
+
+    def test_metrics_view_not_allowed(self) -> None:
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1").status_code, 404)
+
+
+class ProfilerTestCase(TestCase):
+    def setUp(self) -> None:
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(PROFILER_DIR=directory, PROFILER_INTERVAL=0.001))
+        self.staff = User.objects.create_user("staff", password="password", is_staff=True)
+
+    def test_sampler(self) -> None:
+        def busy_wait() -> None:
+            end = time.monotonic() + 0.1
+            while time.monotonic() < end:
+                pass
+
+        sampler = Sampler(0.001)
+        sampler.start()
+        thread = threading.Thread(target=busy_wait, name="busy")
+        thread.start()
+        thread.join()
+        sampler.stop()
+
+        self.assertGreater(sampler.samples, 0)
+        self.assertGreater(sampler.threads["busy"]["samples"], 0)
+        self.assertTrue(any(stack.startswith("busy;") and "busy_wait" in stack for stack in sampler.stacks))
+        self.assertIn("busy_wait", " ".join(label for label, _, _ in sampler.get_top_functions()))
+
+    def test_sampler_root(self) -> None:
+        def busy_wait() -> None:
+            end = time.monotonic() + 0.1
+            while time.monotonic() < end:
+                pass
+
+        sampler = Sampler(0.001, threading.current_thread().name)
+        sampler.start()
+        other = threading.Thread(target=busy_wait, name="other")
+        other.start()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix=get_thread_name_prefix("busy")) as executor:
+            executor.submit(busy_wait).result()
+        other.join()
+        sampler.stop()
+
+        # Only the workers of the thread are sampled, not the threads of other requests
+        self.assertIn(threading.current_thread().name + "/busy_0", sampler.threads)
+        self.assertNotIn("other", sampler.threads)
+
+    def test_profile_store(self) -> None:
+        store = ProfileStore(settings.PROFILER_DIR, max_profiles=2)
+        ids = [store.save({"path": f"/{i}", "stacks": {"a;b": 1}}) for i in range(3)]
+
+        self.assertListEqual([profile["id"] for profile in store.list_profiles()], ids[:0:-1])
+        self.assertNotIn("stacks", store.list_profiles()[0])
+        self.assertDictEqual(store.get(ids[2])["stacks"], {"a;b": 1})
+        self.assertIsNone(store.get(ids[0]))
+        # Paths are confined to the directory of the store
+        self.assertIsNone(store.get("../" + ids[0]))
+
+    def test_middleware_requested(self) -> None:
+        self.client.get(reverse("index") + "?profile=1")
+        self.assertListEqual(get_profile_store().list_profiles(), [])
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse("index") + "?profile=1")
+        profiles = get_profile_store().list_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]["reason"], "requested")
+        self.assertEqual(profiles[0]["path"], reverse("index") + "?profile=1")
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_THRESHOLD=60)
+    def test_middleware_sampled_fast(self) -> None:
+        self.client.get(reverse("index"))
+        self.assertListEqual(get_profile_store().list_profiles(), [])
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_THRESHOLD=0)
+    def test_middleware_sampled_slow(self) -> None:
+        self.client.get(reverse("index"))
+        self.assertEqual(get_profile_store().list_profiles()[0]["reason"], "slow")
+
+    def test_profile_views(self) -> None:
+        profile_id = get_profile_store().save({"method": "GET", "path": "/", "stacks": {"main;a;b": 3}})
+        self.assertEqual(self.client.get(reverse("profiles")).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse("profiles")), profile_id)
+
+        response = self.client.get(reverse("profile_download", args=[profile_id]) + "?format=folded")
+        self.assertEqual(response.content, b"main;a;b 3\n")
+        self.assertEqual(self.client.get(reverse("profile_download", args=[profile_id])).json()["id"], profile_id)
+        self.assertEqual(self.client.get(reverse("profile_download", args=["missing"])).status_code, 404)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    content = b"<title>Title</title><a href='page'></a>"
+    etag = '"v1"'
+
+    def do_GET(self) -> None:
+        if self.path == "/etag" and self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(self.content)))
+        if self.path == "/etag":
+            self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class SlowSitemapHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    content = b"<title>Title</title>"
+
+    def do_HEAD(self) -> None:
+        # Slower than the request timeout, well within the deadline
+        time.sleep(1)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        if self.path != "/":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHECK_HISTORY=False, CHECK_DEADLINE=20, HTTP_TIMEOUT=0.2)
+class RunCheckTestCase(StubServerTestCase):
+    handler = SlowSitemapHandler
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    @patch("checker.checks.get_page_rank", return_value=None)
+    def test_stage_failure(self, mock_get_page_rank) -> None:
+        # The sitemap request times out before the deadline, the other sections are still reported
+        context = run_check(self.server_url + "/")
+        self.assertEqual(context["title"], "Title")
+        self.assertIsNone(context["robotsTxt"])
+        self.assertIsNone(context["sitemaps"])
+        self.assertListEqual(context["incomplete"], [])
+        self.assertIn("Không tìm thấy liên kết sitemap.xml", render_to_string("checker/check.html", context))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PAGE_CACHE_TTL=60)
+class PagesTestCase(StubServerTestCase):
+    handler = PageHandler
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def fetch(self, url: str) -> Parser:
+        r, cached = open_page(get_client(), url)
+        parsed = parse_page(r, cached, self.server_url)
+        parsed.anchors
+        store_page(url, r, parsed, cached)
+        return parsed
+
+    def test_not_modified(self) -> None:
+        url = self.server_url + "/etag"
+        parsed = self.fetch(url)
+        self.assertIsNotNone(parsed.content)
+
+        with patch.object(Parser, "extract") as mock_extract:
+            parsed = self.fetch(url)
+        mock_extract.assert_not_called()
+        self.assertIsNone(parsed.content)
+        self.assertEqual(parsed.title, "Title")
+        self.assertListEqual(parsed.anchors, [f"{self.server_url}/page"])
+        self.assertEqual(cache.get(get_page_key(url)).etag, '"v1"')
+
+    def test_same_digest(self) -> None:
+        url = self.server_url + "/plain"
+        self.assertEqual(self.fetch(url).digest, hashlib.sha256(PageHandler.content).hexdigest())
+
+        with patch.object(Parser, "extract") as mock_extract:
+            parsed = self.fetch(url)
+        mock_extract.assert_not_called()
+        self.assertEqual(parsed.title, "Title")
+
+    def test_changed(self) -> None:
+        url = self.server_url + "/plain"
+        self.fetch(url)
+        cached = cache.get(get_page_key(url))
+        cached.digest = "changed"
+        cache.set(get_page_key(url), cached)
+
+        parsed = self.fetch(url)
+        self.assertIsNotNone(parsed.content)
+        self.assertEqual(cache.get(get_page_key(url)).digest, parsed.digest)
+
+    def test_max_tags(self) -> None:
+        url = self.server_url + "/etag"
+        self.fetch(url)
+        r, cached = open_page(get_client(), url, max_tags=0)
+        r.close()
+        self.assertIsNone(cached)
+
+    @override_settings(PAGE_CACHE_TTL=0)
+    def test_disabled(self) -> None:
+        url = self.server_url + "/etag"
+        self.fetch(url)
+        self.assertIsNone(cache.get(get_page_key(url)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHECK_HISTORY_RUNS=2)
+class HistoryTestCase(TestCase):
+    def setUp(self) -> None:
+        self.url = "https://test.com"
+        cache.clear()
+        link_cache.clear()
+
+    def make_context(self, **kwargs) -> dict:
+        return {
+            "url": self.url,
+            "title": "Title",
+            "headings": {1: ["Heading"]},
+            "anchors": [f"{self.url}/a", f"{self.url}/b"],
+            "brokenLinks": [f"{self.url}/b"],
+            "incomplete": [],
+            **kwargs,
+        }
+
+    def test_record_check(self) -> None:
+        checked = {f"{self.url}/a": False, f"{self.url}/b": True}
+        self.assertIsNone(record_check(self.make_context(), checked))
+        self.assertDictEqual(get_stored_statuses(checked), checked)
+
+        context = self.make_context(
+            title="New title", anchors=[f"{self.url}/b", f"{self.url}/c"], brokenLinks=[f"{self.url}/c"]
+        )
+        changes = record_check(context, {f"{self.url}/c": True})
+        self.assertDictEqual(changes["fields"], {"title": {"old": "Title", "new": "New title"}})
+        self.assertListEqual(changes["addedLinks"], [f"{self.url}/c"])
+        self.assertListEqual(changes["removedLinks"], [f"{self.url}/a"])
+        self.assertListEqual(changes["newBrokenLinks"], [f"{self.url}/c"])
+        self.assertListEqual(changes["fixedLinks"], [f"{self.url}/b"])
+
+        # Links not requested keep their stored status
+        self.assertDictEqual(get_stored_statuses([f"{self.url}/b"]), {f"{self.url}/b": True})
+
+    def test_record_check_incomplete(self) -> None:
+        record_check(self.make_context(), {})
+        changes = record_check(self.make_context(brokenLinks=None, incomplete=["brokenLinks"]), {})
+        self.assertDictEqual(changes["fields"], {})
+        self.assertEqual(changes["fixedLinksCount"], 0)
+
+    def test_prune_runs(self) -> None:
+        for _ in range(3):
+            record_check(self.make_context(), {})
+        self.assertEqual(CheckRun.objects.filter(url=self.url + "/").count(), 2)
+
+    @override_settings(CHECK_HISTORY_RUNS=1)
+    def test_record_check_last_run(self) -> None:
+        record_check(self.make_context(), {})
+        changes = record_check(self.make_context(title="New title", brokenLinks=[]), {})
+        self.assertDictEqual(changes["fields"], {"title": {"old": "Title", "new": "New title"}})
+        self.assertListEqual(changes["fixedLinks"], [f"{self.url}/b"])
+        self.assertEqual(CheckRun.objects.filter(url=self.url + "/").count(), 1)
+
+    @override_settings(LINK_CACHE_OK_TTL=60, LINK_CACHE_BROKEN_TTL=0)
+    def test_get_stored_statuses_expired(self) -> None:
+        record_check(self.make_context(), {f"{self.url}/a": False, f"{self.url}/b": True})
+        self.assertDictEqual(get_stored_statuses([f"{self.url}/a", f"{self.url}/b"]), {f"{self.url}/a": False})
+
+    @patch("checker.utils.get_link_status", return_value=False)
+    def test_get_broken_links_known(self, mock_get_link_status) -> None:
+        checked: dict[str, bool] = dict()
+        links = [f"{self.url}/a", f"{self.url}/b"]
+        self.assertListEqual(
+            get_broken_links(MagicMock(), links, known={f"{self.url}/a": True}, checked=checked), [f"{self.url}/a"]
+        )
+        mock_get_link_status.assert_called_once()
+        self.assertDictEqual(checked, {f"{self.url}/b": False})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REPORT_MAX_TAGS=2)
+class ReportSectionTestCase(TestCase):
+    def setUp(self) -> None:
+        self.url = "https://test.com"
+        self.links = [f"{self.url}/{i}" for i in range(5)]
+        cache.clear()
+
+    def make_check(self) -> tuple[dict, Pipeline]:
+        context = {
+            "url": self.url,
+            "reportId": "0f8fad5b-d9cb-469f-a165-70867728950e",
+            "anchors": self.links,
+            "linkStats": {},
+            "sitemapStats": {},
+            "incomplete": [],
+        }
+        set_section(context, "inlineCSS", ['<p style="color: red">'] * 3, 4)
+        pipeline = Pipeline()
+        pipeline.add("brokenLinks", lambda: self.links)
+        pipeline.add("sitemaps", lambda: [f"{self.url}/sitemap.xml"])
+        return context, pipeline
+
+    def test_finish_check(self) -> None:
+        context = finish_check(*self.make_check())
+        self.assertListEqual(context["brokenLinks"], self.links[:2])
+        self.assertEqual(context["brokenLinksCount"], 5)
+        self.assertEqual(context["inlineCSSCount"], 4)
+        self.assertEqual(context["sitemapsCount"], 1)
+        self.assertNotIn("sectionItems", context)
+
+        # The full lists are saved with the run
+        self.assertListEqual(list(get_section_items(context["reportId"], "brokenLinks")), self.links)
+        self.assertEqual(len(get_section_items(context["reportId"], "inlineCSS")), 3)
+        self.assertIsNone(get_section_items("7c9e6679-7425-40de-944b-e07fc1f90ae7", "brokenLinks"))
+
+    def test_get(self) -> None:
+        report_id = finish_check(*self.make_check())["reportId"]
+        url = reverse("report_section", args=(report_id, "brokenLinks"))
+
+        response = self.client.get(url, {"page": 2})
+        self.assertContains(response, self.links[3])
+        self.assertNotContains(response, self.links[4])
+        self.assertContains(response, f"{url}?page=3")
+
+        response = self.client.get(url, {"page": 3, "format": "json"})
+        self.assertDictEqual(
+            response.json(),
+            {"section": "brokenLinks", "count": 5, "page": 3, "pages": 3, "items": self.links[4:], "next": None},
+        )
+
+        self.assertEqual(self.client.get(url, {"page": 4}).status_code, 404)
+        self.assertEqual(self.client.get(reverse("report_section", args=(report_id, "anchors"))).status_code, 404)
+
+    @override_settings(CHECK_STREAMING=False)
+    @patch("checker.views.verify_captcha", return_value=True)
+    @patch("checker.views.start_check")
+    def test_check_view(self, mock_start_check, mock_verify_captcha) -> None:
+        mock_start_check.return_value = self.make_check()
+        context = mock_start_check.return_value[0]
+
+        response = self.client.post(reverse("check"), {"url": self.url, "g-recaptcha-response": ""})
+        self.assertContains(response, "<b>5</b> trong số <b>5</b>")
+        self.assertNotContains(response, self.links[2])
+        self.assertContains(response, reverse("report_section", args=(context["reportId"], "brokenLinks")) + "?page=2")
+        self.assertContains(response, reverse("report_section", args=(context["reportId"], "inlineCSS")) + "?page=2")
+        self.assertNotContains(response, reverse("report_section", args=(context["reportId"], "sitemaps")))
+
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self) -> None:
+        super().setup()
+        type(self).connections += 1
+
+    def respond(self, status: int, location: Optional[str] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        if location:
+            self.send_header("Location", location)
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(b"OK")
+
+    def do_HEAD(self) -> None:
+        if self.path == "/slow":
+            time.sleep(1)
+        if self.path.startswith("/nohead"):
+            self.respond(405)
+        else:
+            self.respond(404 if self.path == "/missing" else 200)
+
+    def do_GET(self) -> None:
+        if self.path == "/nohead/redirect":
+            self.respond(302, "/missing")
+        else:
+            self.respond(404 if self.path == "/missing" else 200)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LINK_ENGINE="asyncio")
+class ProbesTestCase(StubServerTestCase):
+    handler = ProbeHandler
+
+    def setUp(self) -> None:
+        cache.clear()
+        link_cache.clear()
+
+    def test_probe(self) -> None:
+        prober = LinkProber(10, 2, 3)
+        links = [f"{self.server_url}/ok", f"{self.server_url}/missing", f"{self.server_url}/nohead"]
+        links += [f"{self.server_url}/nohead/redirect", "http://127.0.0.1:1/closed"]
+        self.assertDictEqual(asyncio.run(prober.run(links)), dict(zip(links, [False, True, False, True, None])))
+
+    def test_connection_reuse(self) -> None:
+        ProbeHandler.connections = 0
+        prober = LinkProber(10, 1, 3)
+        asyncio.run(prober.run([f"{self.server_url}/ok?{i}" for i in range(10)]))
+        self.assertEqual(ProbeHandler.connections, 1)
+
+    def test_max_connections(self) -> None:
+        self.assertEqual(LinkProber(1, 1, 3).max_connections, 1)
+        self.assertLessEqual(LinkProber(10**9, 1, 3).max_connections, 10**9)
+
+    def test_connection_limit_shared(self) -> None:
+        link = f"{self.server_url}/ok"
+        # Held by another prober of the process
+        self.assertTrue(connection_slots.try_acquire(1))
+        try:
+            self.assertDictEqual(asyncio.run(LinkProber(1, 1, 0.2).run([link])), {link: None})
+        finally:
+            connection_slots.release()
+        self.assertDictEqual(asyncio.run(LinkProber(1, 1, 3).run([link])), {link: False})
+        self.assertEqual(connection_slots.active, 0)
+
+    @override_settings(OUTBOUND_MAX_ACTIVE=1)
+    def test_outbound_limit(self) -> None:
+        link = f"{self.server_url}/ok"
+        self.assertTrue(outbound_slots.acquire(1, 0))
+        try:
+            self.assertDictEqual(asyncio.run(LinkProber(10, 1, 0.2).run([link])), {link: None})
+        finally:
+            outbound_slots.release()
+        self.assertDictEqual(asyncio.run(LinkProber(10, 1, 3).run([link])), {link: False})
+        self.assertEqual(outbound_slots.active, 0)
+        self.assertEqual(connection_slots.active, 0)
+
+    def test_probe_links_deadline(self) -> None:
+        links = [f"{self.server_url}/ok", f"{self.server_url}/slow"]
+        results = list()
+        with self.assertRaises(DeadlineExceeded):
+            for result in probe_links(links, Deadline(0.5)):
+                results.append(result)
+        self.assertListEqual(results, [(f"{self.server_url}/ok", False)])
+
+    def test_get_broken_links(self) -> None:
+        stats: dict[str, int] = dict()
+        links = [f"{self.server_url}/ok", f"{self.server_url}/missing", f"{self.server_url}/slow"]
+        self.assertListEqual(
+            get_broken_links(get_client(), links, stats, Deadline(0.5)), [f"{self.server_url}/missing"]
+        )
+        self.assertEqual(stats["unchecked"], 1)
@@ -7,4 +7,11 @@ urlpatterns = [
     path("gioi-thieu/", views.AboutView.as_view(), name="about"),
     path("lien-he/", views.ContactView.as_view(), name="contact"),
     path("kiem-tra/", views.CheckView.as_view(), name="check"),
+    path("kiem-tra/<uuid:job_id>/", views.CheckJobView.as_view(), name="check_job"),
+    path("kiem-tra/<uuid:job_id>/trang-thai/", views.CheckJobStatusView.as_view(), name="check_job_status"),
+    path("kiem-tra/bao-cao/<uuid:report_id>/<str:section>/", views.ReportSectionView.as_view(), name="report_section"),
+    path("api/kiem-tra/", views.BatchCheckView.as_view(), name="batch_check"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("profiles/", views.ProfileListView.as_view(), name="profiles"),
+    path("profiles/<str:profile_id>/", views.ProfileDownloadView.as_view(), name="profile_download"),
 ]
@@ -1,15 +1,35 @@
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from json import JSONDecodeError
 from typing import Optional
 
-import requests
 from django.conf import settings
 from requests import Session
 from requests.exceptions import HTTPError, RequestException
 
+from checker import metrics
+from checker.caching import link_cache
+from checker.client import get_client
+from checker.pipeline import Deadline, DeadlineExceeded
+from checker.probes import probe_links
+from checker.robots import get_robots
+from checker.scheduler import HostScheduler
+
 ENCODING: str = "utf-8"
-MAX_WORKERS = 5
+HEAD_NOT_ALLOWED: tuple[int, ...] = (405, 501)
+MAX_GET_ONLY_HOSTS = 1000
+
+# Hosts answering 405/501 to HEAD requests, checked with streamed GET requests instead
+_get_only_hosts: dict[str, None] = dict()
+
+
+def get_timeout(deadline: Optional[Deadline]) -> Optional[float]:
+    """
+    Get the timeout of an outbound request.
+
+    :param deadline: Deadline of the check.
+    :return: Default timeout bounded by the deadline, None for the client default.
+    """
+    return deadline.timeout(settings.HTTP_TIMEOUT) if deadline else None
 
 
 def verify_captcha(response: str, user_ip: str) -> bool:
@@ -32,128 +52,200 @@ def verify_captcha(response: str, user_ip: str) -> bool:
     }
 
     try:
-        r = requests.post(url=url, data=data)
+        r = get_client().post(url=url, data=data)
         result: dict = r.json()
         return result["success"]
-    except (HTTPError, JSONDecodeError) as e:
+    except (RequestException, JSONDecodeError) as e:
+        # Timed out, or no outbound slot free, the user may submit again
         print(f"Failed to verify reCAPTCHA: {e}")
         return False
 
 
-def get_robots_link(client: Session, base_url: str) -> Optional[str]:
+def get_robots_link(client: Session, base_url: str, deadline: Optional[Deadline] = None) -> Optional[str]:
     """
     Get robots.txt link.
 
     :param client: Client sessions.
     :param base_url: Base URL.
+    :param deadline: Deadline of the check.
     :return: robots.txt link if successful, None otherwise.
     """
-    robots_url = base_url + "/robots.txt"
-    try:
-        r = client.head(robots_url)
-        r.raise_for_status()
-        return robots_url
-    except HTTPError as e:
-        print(f"Failed to get robots.txt: {e}")
-        return None
+    robots = get_robots(client, base_url, deadline)
+    return robots.url if robots.found else None
 
 
-def get_sitemap_links(client: Session, base_url: str, robots_url: Optional[str]) -> Optional[list[str]]:
+def get_sitemap_links(
+    client: Session, base_url: str, robots_url: Optional[str], deadline: Optional[Deadline] = None
+) -> Optional[list[str]]:
     """
-    Get sitemap links.
+    Get sitemap links, from robots.txt or at the default location.
 
     :param client: Client sessions.
     :param base_url: Base URL.
     :param robots_url: robots.txt link.
+    :param deadline: Deadline of the check.
     :return: Sitemap links if successful, None otherwise.
     """
+    # robots.txt is cached by get_robots_link, reading its sitemaps costs no request
+    if robots_url and (sitemaps := get_robots(client, base_url, deadline).sitemaps):
+        return list(sitemaps)
+
     sitemap_url = base_url + "/sitemap.xml"
     try:
-        r = client.head(sitemap_url)
+        r = client.head(sitemap_url, timeout=get_timeout(deadline))
         r.raise_for_status()
         return [sitemap_url]
-    except HTTPError as e:
+    except RequestException as e:
+        # Not reachable within the deadline, rather than not reachable at all
+        if deadline and deadline.expired:
+            raise DeadlineExceeded("Deadline exceeded")
         print(f"Failed to get sitemap.xml: {e}")
-
-    # Get sitemap from robots.txt content
-    if not robots_url:
         return None
 
-    sitemaps: list[str] = list()
-    try:
-        r = client.get(robots_url)
-        r.raise_for_status()
-        sitemaps.extend(re.findall(r"Sitemap:.*xml", r.text))
-    except HTTPError as e:
-        print(f"Failed to get robots.txt content: {e}")
-        return None
-
-    if not sitemaps:
-        return None
-
-    return [sitemap.split("Sitemap:")[1].strip() for sitemap in sitemaps]
-
 
-def check_broken_link(client: Session, link: str) -> Optional[str]:
+def get_link_status(client: Session, link: str, deadline: Optional[Deadline] = None) -> Optional[bool]:
     """
-    Check if a link is broken.
+    Get the status of a link.
+
+    A streamed GET request is sent instead of a HEAD request to the hosts that do not support HEAD, the body is never
+    downloaded.
 
     :param client: Client sessions.
     :param link: Link to check.
-    :return: Link if it is broken, None otherwise.
+    :param deadline: Deadline of the check.
+    :return: True if the link is broken, False if it is OK, None if it cannot be reached.
     """
+    host = HostScheduler.get_host(link)
     try:
-        r = client.head(link)
-        r.raise_for_status()
-        return None
+        if host not in _get_only_hosts:
+            r = client.head(link, timeout=get_timeout(deadline))
+            if r.status_code not in HEAD_NOT_ALLOWED:
+                r.raise_for_status()
+                return False
+
+            if len(_get_only_hosts) >= MAX_GET_ONLY_HOSTS:
+                _get_only_hosts.clear()
+            _get_only_hosts[host] = None
+
+        with client.get(link, stream=True, timeout=get_timeout(deadline)) as r:
+            r.raise_for_status()
+        return False
     except HTTPError:
-        return link
+        return True
     except RequestException:
-        pass
+        # Not reachable within the deadline, rather than not reachable at all
+        if deadline and deadline.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+        return None
 
 
-def get_broken_links(client: Session, links: Optional[list[str]]) -> Optional[list[str]]:
+def check_broken_link(client: Session, link: str) -> Optional[str]:
     """
-    Get a list of broken links.
+    Check if a link is broken.
 
     :param client: Client sessions.
-    :param links: List of links to check.
-    :return: List of links if broken, None otherwise.
+    :param link: Link to check.
+    :return: Link if it is broken, None otherwise.
     """
-    if not links:
-        return None
+    return link if get_link_status(client, link) else None
 
-    broken_links: list[str] = list()
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(check_broken_link, client, link) for link in links]
-        for future in as_completed(futures):
-            if future.result():
-                broken_links.append(future.result())
+def lookup_link_statuses(
+    links: list[str], stats: Optional[dict[str, int]] = None, known: Optional[dict[str, bool]] = None
+) -> tuple[dict[str, bool], list[str]]:
+    """
+    Get the statuses of links from the link status cache and the known statuses.
 
+    :param links: List of links.
+    :param stats: Dictionary receiving the cache "hits" and "misses" counts.
+    :param known: Statuses known from elsewhere, used on cache misses.
+    :return: Statuses found, and the links to request.
+    """
+    statuses = link_cache.get_many(links)
+    if known:
+        statuses.update((link, known[link]) for link in links if link not in statuses and link in known)
+    misses = [link for link in links if link not in statuses]
+    print(f"Link status cache: {len(statuses)} hits, {len(misses)} misses")
+    metrics.cache_hits.inc(len(statuses), cache="link")
+    metrics.cache_misses.inc(len(misses), cache="link")
+    if stats is not None:
+        stats["hits"] = stats.get("hits", 0) + len(statuses)
+        stats["misses"] = stats.get("misses", 0) + len(misses)
+    return statuses, misses
+
+
+def store_link_statuses(
+    links: list[str],
+    statuses: dict[str, bool],
+    results: dict[str, Optional[bool]],
+    unchecked: int,
+    stats: Optional[dict[str, int]] = None,
+    checked: Optional[dict[str, bool]] = None,
+) -> Optional[list[str]]:
+    """
+    Cache the statuses of the links requested and get the broken links.
+
+    :param links: List of links.
+    :param statuses: Statuses found by lookup_link_statuses.
+    :param results: Statuses of the links requested, None for the links that cannot be reached.
+    :param unchecked: Number of links left when the deadline expired.
+    :param stats: Dictionary receiving the "unchecked" links count.
+    :param checked: Dictionary receiving the statuses of the links requested.
+    :return: List of links if broken, None otherwise.
+    """
+    if unchecked:
+        print(f"Deadline exceeded, {unchecked} links left unchecked")
+        if stats is not None:
+            stats["unchecked"] = stats.get("unchecked", 0) + unchecked
+
+    # Unreachable links are neither reported nor cached
+    requested = {link: status for link, status in results.items() if status is not None}
+    metrics.links_checked.inc(len(results))
+    link_cache.set_many(requested)
+    statuses.update(requested)
+    if checked is not None:
+        checked.update(requested)
+    broken_links = [link for link in links if statuses.get(link)]
     return broken_links if broken_links else None
 
 
-def get_page_rank(client: Session, domain: str) -> int:
+def get_broken_links(
+    client: Session,
+    links: Optional[list[str]],
+    stats: Optional[dict[str, int]] = None,
+    deadline: Optional[Deadline] = None,
+    known: Optional[dict[str, bool]] = None,
+    checked: Optional[dict[str, bool]] = None,
+) -> Optional[list[str]]:
     """
-    Get the page rank of a domain.
+    Get a list of broken links, only the links missing from the link status cache and the known statuses are requested.
+
+    Requests are spread across hosts by the host scheduler, or probed on an event loop when LINK_ENGINE is "asyncio".
+    When the deadline expires, the broken links found so far are returned and the links left are counted as
+    "unchecked" in the statistics.
 
     :param client: Client sessions.
-    :param domain: Domain to check.
-    :return: Page rank if found, 0 otherwise.
+    :param links: List of links to check.
+    :param stats: Dictionary receiving the cache "hits" and "misses" counts, and the "unchecked" links count.
+    :param deadline: Deadline of the check.
+    :param known: Statuses known from elsewhere, e.g. stored by the previous checks, used on cache misses.
+    :param checked: Dictionary receiving the statuses of the links requested.
+    :return: List of links if broken, None otherwise.
     """
-    if settings.DEBUG:
-        print("Skipping page rank retrieval in debug mode.")
-        return 0
+    if not links:
+        return None
+
+    statuses, misses = lookup_link_statuses(links, stats, known)
+    if settings.LINK_ENGINE == "asyncio":
+        probes = probe_links(misses, deadline)
+    else:
+        scheduler = HostScheduler(settings.LINK_CONCURRENCY, settings.LINK_HOST_CONCURRENCY)
+        probes = scheduler.run(partial(get_link_status, client, deadline=deadline), misses, deadline)
 
-    url = "https://openpagerank.com/api/v1.0/getPageRank?domains[0]=" + domain
-    headers = {"API-OPR": settings.OPEN_PAGERANK_KEY}
+    results: dict[str, Optional[bool]] = dict()
     try:
-        r = client.get(url, headers=headers)
-        result: dict = r.json()["response"][0]
-        if result["status_code"] == 200:
-            return int(result["rank"])
-    except (HTTPError, JSONDecodeError) as e:
-        print(f"Failed to get page rank: {e}")
-
-    return 0
+        for link, status in probes:
+            results[link] = status
+    except DeadlineExceeded:
+        pass
+    return store_link_statuses(links, statuses, results, len(misses) - len(results), stats, checked)
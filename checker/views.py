@@ -1,19 +1,46 @@
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from hmac import compare_digest
 from urllib.parse import urlsplit
 
+from django.conf import settings
 from django.contrib import messages
-from django.shortcuts import redirect, render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import URLValidator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView
-from requests import Session
-from requests.exceptions import HTTPError
-
-from checker.parser import Parser
-from checker.utils import (
-    get_broken_links,
-    get_page_rank,
-    get_robots_link,
-    get_sitemap_links,
-    verify_captcha,
+from requests.exceptions import RequestException
+
+from checker import metrics
+from checker.admission import ReleasingIterator, admit_check, release_check
+from checker.checks import (
+    PAGED_SECTIONS,
+    get_cached_report,
+    get_report,
+    get_report_key,
+    is_cacheable,
+    iter_check,
+    start_check,
 )
+from checker.client import get_client
+from checker.history import get_section_items
+from checker.jobs import enqueue_check
+from checker.metrics import get_server_timing, timed
+from checker.models import CheckJob
+from checker.pagerank import get_page_ranks
+from checker.pipeline import Deadline, get_thread_name_prefix
+from checker.profiling import get_profile_store, to_folded
+from checker.utils import verify_captcha
 
 
 class IndexView(TemplateView):
@@ -31,47 +58,151 @@ class ContactView(TemplateView):
 class CheckView(TemplateView):
     template_name = "checker/check.html"
     template_error = "checker/index.html"
+    template_busy = "checker/busy.html"
+    RETRY_AFTER = 10
+    STREAM_MARKER = "<!--sections-->"
+    SECTION_TEMPLATES = {
+        "pageRank": "checker/sections/page_rank.html",
+        "robotsTxt": "checker/sections/robots_txt.html",
+        "sitemaps": "checker/sections/sitemaps.html",
+        "brokenLinks": "checker/sections/broken_links.html",
+    }
 
     def post(self, request):
         url = request.POST["url"]
+        start = time.perf_counter()
+
+        # Cached reports and background jobs do not take a check slot
+        cached = get_cached_report(url)
+        if cached is not None or settings.CHECK_JOBS_ENABLED:
+            return self.check(request, url, cached, start)
+
+        if not admit_check():
+            response = render(request, self.template_busy, {"url": url, "retryAfter": self.RETRY_AFTER}, status=503)
+            response["Retry-After"] = str(self.RETRY_AFTER)
+            return response
+
+        try:
+            response = self.check(request, url, cached, start)
+        except BaseException:
+            release_check()
+            raise
 
-        if not verify_captcha(request.POST["g-recaptcha-response"], request.META["REMOTE_ADDR"]):
+        # A streamed report keeps its slot until it is sent
+        if response.streaming:
+            response.streaming_content = ReleasingIterator(response.streaming_content, release_check)
+        else:
+            release_check()
+        return response
+
+    def check(self, request, url, cached, start):
+        timings: dict[str, float] = dict()
+
+        # Fetch and parse the page while the captcha is verified, the network stages only start once it passes
+        speculative = None
+        if cached is None and not settings.CHECK_JOBS_ENABLED:
+            deadline = Deadline(settings.CHECK_DEADLINE)
+            speculative = self.speculate(start_check, url, deadline)
+
+        verified = False
+        try:
+            with timed(timings, "captcha"):
+                verified = verify_captcha(request.POST["g-recaptcha-response"], request.META["REMOTE_ADDR"])
+        finally:
+            # The speculative fetch is abandoned on every exit but a passed captcha
+            if not verified and speculative:
+                deadline.cancel()
+                speculative.cancel()
+        if not verified:
             messages.info(request, url)
             messages.error(request, "* Bạn chưa được kiểm tra không phải là robot!")
             return redirect("/")
 
-        # Parsing
-        u = urlsplit(url, allow_fragments=False)
-        domain = u.netloc
-        base_url = f"{u.scheme}://{domain}"
-        client = Session()
+        # Background job mode, the report is polled for
+        if settings.CHECK_JOBS_ENABLED:
+            job = enqueue_check(url)
+            return redirect("check_job", job_id=job.id)
+
+        if cached is not None:
+            metrics.cache_hits.inc(cache="report")
+            response = render(request, self.template_name, cached)
+            response["Server-Timing"] = 'cache;desc="hit", ' + get_server_timing(
+                {**timings, "total": time.perf_counter() - start}
+            )
+            return response
+
+        metrics.cache_misses.inc(cache="report")
         try:
-            r = client.get(url)
-            parsed = Parser(r.content, base_url)
-            context = {
-                "url": url,
-                "title": parsed.title,
-                "description": parsed.description,
-                "favicon": parsed.favicon,
-                "robotsMeta": parsed.robots_meta,
-                "headings": parsed.headings,
-                "inlineCSS": parsed.inline_css,
-                "images": parsed.images,
-                "imagesMissAlt": parsed.images_miss_alt,
-                "pageRank": get_page_rank(client, domain),
-                "robotsTxt": get_robots_link(client, base_url),
-                "brokenLinks": get_broken_links(client, parsed.anchors),
-                "anchors": parsed.anchors,
-            }
-            context["sitemaps"] = get_sitemap_links(client, base_url, context["robotsTxt"])
-            return render(request, self.template_name, context)
-        except HTTPError as e:
+            if settings.CHECK_STREAMING:
+                response = self.stream(request, url, speculative, timings)
+            else:
+                response = render(request, self.template_name, context := get_report(url, speculative))
+                timings.update(context.get("timings") or {})
+
+            # The network stages of a streamed report are not timed yet
+            response["Server-Timing"] = get_server_timing({**timings, "total": time.perf_counter() - start})
+            return response
+        except (RequestException, ValueError, TimeoutError) as e:
             print(f"Failed to get URL: {e}")
             messages.info(request, url)
             messages.error(request, "* Không phân tích được URL. Vui lòng kiểm tra lại!")
             return redirect("/")
+
+    @staticmethod
+    def speculate(func, *args) -> Future:
+        """
+        Run a function in the background, in a thread of its own.
+        """
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=get_thread_name_prefix("speculative"))
+        try:
+            return executor.submit(func, *args)
         finally:
-            client.close()
+            executor.shutdown(wait=False)
+
+    def stream(self, request, url, started=None, timings=None):
+        """
+        Stream the report, the page shell and the parsed sections first, then every network section as it finishes.
+
+        The durations of the stages run before the response starts are added to timings.
+        """
+        key = get_report_key(url)
+        if settings.REPORT_CACHE_TTL > 0 and (context := cache.get(key)) is not None:
+            return render(request, self.template_name, context)
+
+        context, pipeline = started.result() if started else start_check(url)
+        if timings is not None:
+            timings.update(context.get("timings") or {})
+        response = StreamingHttpResponse(self.iter_report(request, key, context, pipeline))
+        # Disable proxy buffering, e.g. by nginx
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def iter_report(self, request, key, context, pipeline):
+        html = render_to_string(self.template_name, {**context, "streaming": True}, request)
+        head, tail = html.split(self.STREAM_MARKER, 1)
+        yield head
+
+        pending = set(self.SECTION_TEMPLATES)
+        try:
+            for name in iter_check(context, pipeline):
+                pending.discard(name)
+                yield self.render_section(request, context, name)
+        except Exception as e:
+            # The response has started, the sections left are reported as incomplete
+            print(f"Failed to check URL: {e}")
+            for name in pending:
+                context[name] = None
+                context["incomplete"].append(name)
+                yield self.render_section(request, context, name)
+
+        yield tail
+
+        if settings.REPORT_CACHE_TTL > 0 and is_cacheable(context):
+            cache.set(key, context, settings.REPORT_CACHE_TTL)
+
+    def render_section(self, request, context, name):
+        section = {"section": name, "section_template": self.SECTION_TEMPLATES[name]}
+        return render_to_string("checker/sections/streamed.html", {**context, **section}, request)
 
     def get_context_data(self, **kwargs):
         context = super(CheckView, self).get_context_data()
@@ -86,14 +217,205 @@ class CheckView(TemplateView):
                     1: ["Phân tích & Đánh giá SEO"],
                     2: ["Nhanh chóng, Chính xác, Miễn phí"],
                 },
+                "reportId": None,
                 "inlineCSS": [],
                 "images": ["/images"],
                 "imagesMissAlt": [],
+                "inlineCSSCount": 0,
+                "imagesCount": 1,
+                "imagesMissAltCount": 0,
                 "pageRank": 0,
                 "robotsTxt": "/robots.txt",
                 "brokenLinks": [],
+                "brokenLinksCount": 0,
                 "anchors": ["/anchors"],
                 "sitemaps": ["/sitemap.xml"],
+                "sitemapsCount": 1,
+                "incomplete": [],
+            }
+        )
+        return context
+
+
+class ReportSectionView(View):
+    """
+    Page of a section of a saved report, as an HTML fragment loaded by the report page, or as JSON with ?format=json.
+
+    Pages hold REPORT_MAX_TAGS items, the first one is already in the report.
+    """
+
+    template_name = "checker/sections/items.html"
+
+    def get(self, request, report_id, section):
+        if section not in PAGED_SECTIONS:
+            raise Http404()
+        items = get_section_items(report_id, section)
+        if items is None:
+            raise Http404()
+
+        try:
+            page = Paginator(items, settings.REPORT_MAX_TAGS).page(request.GET.get("page", 1))
+        except InvalidPage:
+            raise Http404()
+
+        next_page = page.next_page_number() if page.has_next() else None
+        if request.GET.get("format") == "json":
+            data = {
+                "section": section,
+                "count": page.paginator.count,
+                "page": page.number,
+                "pages": page.paginator.num_pages,
+                "items": list(page.object_list),
+                "next": next_page,
             }
+            return JsonResponse(data)
+
+        context = {
+            "reportId": report_id,
+            "section": section,
+            "items": page.object_list,
+            "page": next_page,
+            "remaining": page.paginator.count - page.end_index(),
+        }
+        return render(request, self.template_name, context)
+
+
+class CheckJobView(TemplateView):
+    template_name = "checker/job.html"
+
+    def get(self, request, job_id):
+        job = get_object_or_404(CheckJob, pk=job_id)
+        if job.status == CheckJob.Status.DONE:
+            return render(request, CheckView.template_name, job.report)
+
+        if job.status == CheckJob.Status.FAILED:
+            messages.info(request, job.url)
+            messages.error(request, "* Không phân tích được URL. Vui lòng kiểm tra lại!")
+            return redirect("/")
+
+        return render(request, self.template_name, {"job": job})
+
+
+class CheckJobStatusView(View):
+    def get(self, request, job_id):
+        job = get_object_or_404(CheckJob, pk=job_id)
+        data = {"id": job.id, "url": job.url, "status": job.status}
+        if job.status == CheckJob.Status.DONE:
+            data["report"] = job.report
+        elif job.status == CheckJob.Status.FAILED:
+            data["error"] = job.error
+        return JsonResponse(data)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class BatchCheckView(View):
+    """
+    Check a batch of URLs, authenticated by a bearer token.
+
+    The body is a JSON object {"urls": [...]}. The response streams one JSON result per line as each check finishes.
+    Checks share the CHECK_MAX_ACTIVE slots of the process, the URLs that get no slot in time have a "busy" status.
+    """
+
+    validate_url = URLValidator(schemes=["http", "https"])
+
+    def post(self, request):
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not token or not any(compare_digest(token, allowed) for allowed in settings.BATCH_API_TOKENS):
+            return JsonResponse({"error": "Unauthorized"}, status=401)
+
+        try:
+            urls = json.loads(request.body)["urls"]
+            if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                raise ValueError("urls must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            return JsonResponse({"error": f"Invalid request: {e}"}, status=400)
+
+        if len(urls) > settings.BATCH_MAX_URLS:
+            return JsonResponse({"error": f"Too many URLs, the limit is {settings.BATCH_MAX_URLS}"}, status=400)
+
+        response = StreamingHttpResponse(self.iter_results(urls), content_type="application/x-ndjson")
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def check(self, url: str) -> dict:
+        try:
+            self.validate_url(url)
+            if (cached := get_cached_report(url)) is not None:
+                return {"url": url, "status": "ok", "report": cached}
+
+            # Every check of a batch takes a check slot, like the checks of the report page
+            if not admit_check():
+                return {"url": url, "status": "busy", "error": "Too many checks running, retry later"}
+            try:
+                return {"url": url, "status": "ok", "report": get_report(url)}
+            finally:
+                release_check()
+        except ValidationError:
+            return {"url": url, "status": "error", "error": "Invalid URL"}
+        except (RequestException, ValueError, TimeoutError) as e:
+            return {"url": url, "status": "error", "error": str(e)}
+        except Exception as e:
+            # A bug must fail its URL only, not the rest of the batch
+            print(f"Unexpected error while checking {url}: {e!r}")
+            return {"url": url, "status": "error", "error": str(e)}
+
+    @staticmethod
+    def prefetch_page_ranks(urls: list[str]) -> None:
+        # One API call per 100 domains, the checks then find their page rank in the cache
+        if not settings.DEBUG:
+            domains = {u.netloc for u in map(urlsplit, urls) if u.scheme in ("http", "https") and u.netloc}
+            get_page_ranks(get_client(), domains)
+
+    def iter_results(self, urls: list[str]):
+        # The pooled client and the caches are shared by every check of the batch. The page ranks are prefetched by an
+        # extra worker, the checks need them only once their page is fetched, so the first results are not delayed
+        executor = ThreadPoolExecutor(
+            max_workers=settings.BATCH_CONCURRENCY + 1, thread_name_prefix=get_thread_name_prefix("batch")
         )
+        try:
+            executor.submit(self.prefetch_page_ranks, urls)
+            futures = [executor.submit(self.check, url) for url in urls]
+            for future in as_completed(futures):
+                yield json.dumps(future.result(), cls=DjangoJSONEncoder) + "\n"
+        finally:
+            # Stop the checks not started yet when the client goes away
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class MetricsView(View):
+    """Process-level metrics in the Prometheus text format, served to the allowed addresses only."""
+
+    def get(self, request):
+        if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+            raise Http404()
+        get_client().record_stats()
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class ProfileListView(TemplateView):
+    template_name = "checker/profiles.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["profiles"] = get_profile_store().list_profiles()
         return context
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class ProfileDownloadView(View):
+    """Download a profile, as JSON or as folded stacks with ?format=folded."""
+
+    def get(self, request, profile_id):
+        profile = get_profile_store().get(profile_id)
+        if profile is None:
+            raise Http404()
+
+        if request.GET.get("format") == "folded":
+            response = HttpResponse(to_folded(profile), content_type="text/plain; charset=utf-8")
+            filename = f"{profile_id}.folded"
+        else:
+            response = JsonResponse(profile)
+            filename = f"{profile_id}.json"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
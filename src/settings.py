@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from configparser import ConfigParser
 from pathlib import Path
+from tempfile import gettempdir
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -56,6 +57,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "checker.profiling.ProfilerMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -91,6 +93,38 @@ DATABASES = {
 }
 
 
+# Cache, shared by all the worker processes, of at most CACHE_MAX_ENTRIES reports, pages, robots rules and page ranks.
+# The file-based cache lists its directory on every write beyond that size, a few checks write about 10 entries.
+# Link statuses are many more, they go to the "links" cache, which is the default cache unless it is file-based: the
+# links are then only cached in process, see LINK_CACHE_SIZE
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHE_BACKEND = configs.get("CACHE_BACKEND", fallback="django.core.cache.backends.filebased.FileBasedCache")
+CACHE_LOCATION = configs.get("CACHE_LOCATION", fallback=str(Path(gettempdir()) / "web-checker"))
+CACHE_MAX_ENTRIES = configs.getint("CACHE_MAX_ENTRIES", fallback=10000)
+LINK_CACHE_BACKEND = configs.get(
+    "LINK_CACHE_BACKEND",
+    fallback=(
+        "django.core.cache.backends.dummy.DummyCache"
+        if CACHE_BACKEND == "django.core.cache.backends.filebased.FileBasedCache"
+        else CACHE_BACKEND
+    ),
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": CACHE_LOCATION,
+        "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    },
+    "links": {
+        "BACKEND": LINK_CACHE_BACKEND,
+        "LOCATION": configs.get("LINK_CACHE_LOCATION", fallback=CACHE_LOCATION),
+        "OPTIONS": {"MAX_ENTRIES": configs.getint("LINK_CACHE_MAX_ENTRIES", fallback=100000)},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -148,3 +182,133 @@ GOOGLE_RECAPTCHA_SECRET_KEY = configs.get("GOOGLE_RECAPTCHA_SECRET_KEY")
 # https://www.domcop.com/openpagerank/
 
 OPEN_PAGERANK_KEY = configs.get("OPEN_PAGERANK_KEY")
+
+
+# Maximum size of a checked page in bytes, the rest of the page is not parsed
+
+MAX_PAGE_SIZE = configs.getint("MAX_PAGE_SIZE", fallback=5 * 1024 * 1024)
+
+
+# Maximum number of items listed per report section, e.g. inline CSS, also the page size of the sections loaded on
+# demand. Maximum number of tags saved with a check run for those pages, the others are only counted
+
+REPORT_MAX_TAGS = configs.getint("REPORT_MAX_TAGS", fallback=100)
+REPORT_STORED_TAGS = configs.getint("REPORT_STORED_TAGS", fallback=10000)
+
+
+# Time to keep a finished report in the cache in seconds, 0 to disable
+
+REPORT_CACHE_TTL = configs.getint("REPORT_CACHE_TTL", fallback=600)
+
+
+# Time to keep the validators, hash and extracted fields of a checked page in seconds, 0 to disable. Re-checks
+# revalidate the page with a conditional GET and skip the parse when it has not changed
+
+PAGE_CACHE_TTL = configs.getint("PAGE_CACHE_TTL", fallback=7 * 24 * 3600)
+
+
+# Link status cache, size of the in-process LRU and times to keep OK and broken statuses in seconds
+
+LINK_CACHE_SIZE = configs.getint("LINK_CACHE_SIZE", fallback=10000)
+LINK_CACHE_OK_TTL = configs.getint("LINK_CACHE_OK_TTL", fallback=6 * 60 * 60)
+LINK_CACHE_BROKEN_TTL = configs.getint("LINK_CACHE_BROKEN_TTL", fallback=15 * 60)
+
+
+# Outbound HTTP client, default timeout in seconds and number of concurrent link checks in total and per host
+
+HTTP_TIMEOUT = configs.getfloat("HTTP_TIMEOUT", fallback=10)
+LINK_CONCURRENCY = configs.getint("LINK_CONCURRENCY", fallback=5)
+LINK_HOST_CONCURRENCY = configs.getint("LINK_HOST_CONCURRENCY", fallback=2)
+
+
+# Broken link engine, "threads" or "asyncio". The asyncio engine probes the links on one event loop, with a cap on the
+# open connections of the process, bounded by the file descriptor limit, and on the probes in flight per host. Its
+# requests count towards OUTBOUND_MAX_ACTIVE
+
+LINK_ENGINE = configs.get("LINK_ENGINE", fallback="threads")
+LINK_ASYNC_CONCURRENCY = configs.getint("LINK_ASYNC_CONCURRENCY", fallback=500)
+LINK_ASYNC_HOST_CONCURRENCY = configs.getint("LINK_ASYNC_HOST_CONCURRENCY", fallback=10)
+
+
+# Time budget of a check in seconds, the report shows what finished within it
+
+CHECK_DEADLINE = configs.getfloat("CHECK_DEADLINE", fallback=30)
+
+
+# Check history, saved runs and link statuses reused by the next checks, and number of runs kept per page
+
+CHECK_HISTORY = configs.getboolean("CHECK_HISTORY", fallback=True)
+CHECK_HISTORY_RUNS = max(1, configs.getint("CHECK_HISTORY_RUNS", fallback=30))
+
+
+# Admission control per process, number of checks running at once, number of checks waiting for a slot and their
+# maximum wait in seconds, the other checks get a busy page. Number of outbound HTTP requests at once, 0 for no limit:
+# a request holds its slot until the response headers arrive, the streamed bodies are read outside of the limit
+
+CHECK_MAX_ACTIVE = configs.getint("CHECK_MAX_ACTIVE", fallback=8)
+CHECK_MAX_QUEUED = configs.getint("CHECK_MAX_QUEUED", fallback=16)
+CHECK_QUEUE_TIMEOUT = configs.getfloat("CHECK_QUEUE_TIMEOUT", fallback=5)
+OUTBOUND_MAX_ACTIVE = configs.getint("OUTBOUND_MAX_ACTIVE", fallback=64)
+
+
+# Background check jobs, number of worker processes, time to wait for new jobs and time after which a running job is
+# claimed again in seconds
+
+CHECK_JOBS_ENABLED = configs.getboolean("CHECK_JOBS_ENABLED", fallback=False)
+CHECK_JOB_WORKERS = configs.getint("CHECK_JOB_WORKERS", fallback=2)
+CHECK_JOB_POLL_INTERVAL = configs.getfloat("CHECK_JOB_POLL_INTERVAL", fallback=1)
+CHECK_JOB_TIMEOUT = configs.getint("CHECK_JOB_TIMEOUT", fallback=300)
+
+
+# Stream the report while the check is running
+
+CHECK_STREAMING = configs.getboolean("CHECK_STREAMING", fallback=False)
+
+
+# Batch check API, bearer tokens, maximum number of URLs per batch and number of concurrent checks
+
+BATCH_API_TOKENS = [token for token in configs.get("BATCH_API_TOKENS", fallback="").split("|") if token]
+BATCH_MAX_URLS = configs.getint("BATCH_MAX_URLS", fallback=10000)
+BATCH_CONCURRENCY = configs.getint("BATCH_CONCURRENCY", fallback=4)
+
+
+# Site crawler, maximum link depth, maximum number of pages, number of concurrent fetches and robots.txt user agent
+
+CRAWL_MAX_DEPTH = configs.getint("CRAWL_MAX_DEPTH", fallback=3)
+CRAWL_MAX_PAGES = configs.getint("CRAWL_MAX_PAGES", fallback=500)
+CRAWL_CONCURRENCY = configs.getint("CRAWL_CONCURRENCY", fallback=4)
+CRAWL_USER_AGENT = configs.get("CRAWL_USER_AGENT", fallback="web-checker")
+
+
+# Sitemaps, maximum number of sitemap files read per check and number of listed URLs checked
+
+SITEMAP_MAX_FILES = configs.getint("SITEMAP_MAX_FILES", fallback=50)
+SITEMAP_SAMPLE_SIZE = configs.getint("SITEMAP_SAMPLE_SIZE", fallback=20)
+
+
+# Time to keep the parsed robots.txt of a host in seconds
+
+ROBOTS_CACHE_TTL = configs.getint("ROBOTS_CACHE_TTL", fallback=3600)
+
+
+# Open PageRank API, endpoint, time to keep the rank of a domain in seconds and time to wait for concurrent lookups to
+# batch them in a single call
+
+OPEN_PAGERANK_URL = configs.get("OPEN_PAGERANK_URL", fallback="https://openpagerank.com/api/v1.0/getPageRank")
+PAGE_RANK_CACHE_TTL = configs.getint("PAGE_RANK_CACHE_TTL", fallback=7 * 24 * 3600)
+PAGE_RANK_BATCH_WINDOW = configs.getfloat("PAGE_RANK_BATCH_WINDOW", fallback=0.05)
+
+
+# Addresses allowed to scrape the metrics endpoint
+
+METRICS_ALLOWED_IPS = configs.get("METRICS_ALLOWED_IPS", fallback="127.0.0.1|::1").split("|")
+
+
+# Request profiler, share of the requests profiled, time above which their profile is kept in seconds, time between
+# two samples in seconds, number of profiles kept and their directory. Staff members profile a request with ?profile=1
+
+PROFILER_SAMPLE_RATE = configs.getfloat("PROFILER_SAMPLE_RATE", fallback=0)
+PROFILER_THRESHOLD = configs.getfloat("PROFILER_THRESHOLD", fallback=5)
+PROFILER_INTERVAL = configs.getfloat("PROFILER_INTERVAL", fallback=0.005)
+PROFILER_MAX_PROFILES = configs.getint("PROFILER_MAX_PROFILES", fallback=50)
+PROFILER_DIR = configs.get("PROFILER_DIR", fallback=str(Path(gettempdir()) / "web-checker-profiles"))